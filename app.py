@@ -1,8 +1,13 @@
 import os
+from contextlib import contextmanager
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
+import config
+from db_pool import TimedQueuePool
+from http_cache import http_cache
+from logging_setup import configure_logging
 
 class Base(DeclarativeBase):
     pass
@@ -14,18 +19,45 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///bot.db")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
+    "pool_recycle": config.DB_POOL_RECYCLE,
+    "pool_pre_ping": config.DB_POOL_PRE_PING,
 }
+if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+        "poolclass": TimedQueuePool,  # Records checkout wait times (see /metrics)
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    })
 
 # Initialize extensions
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+http_cache.init_app(app)
 
-# Import routes after app initialization to avoid circular imports
+@contextmanager
+def session_scope():
+    """
+    Short-lived database session for background threads and streams.
+    Commits on success, rolls back on error and always returns the connection
+    to the pool, so keep network and video I/O outside the block.
+    """
+    with app.app_context():
+        try:
+            yield db.session
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+# One queue-based logging setup for the whole process (see logging_setup.py)
+configure_logging()
+
+# Import routes after app initialization to avoid circular imports.
+# Schema creation is an explicit step (python init_db.py) and tasks run in
+# separate worker processes (python -m bot.worker), so importing the app stays cheap.
 with app.app_context():
     from routes import *  # This registers all our routes
     import models  # This ensures our models are loaded
-    db.create_all()  # This creates all database tables
\ No newline at end of file
@@ -7,15 +7,9 @@ from scraper import InstagramReelDownloader
 from uploader import upload_with_retry
 from config import PROCESSED_VIDEO_DIR, DOWNLOAD_DIR, generate_caption
 from video_processor import process_video
+from logging_setup import configure_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
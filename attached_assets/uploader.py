@@ -5,15 +5,6 @@ import pickle
 from instagrapi import Client
 from config import INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD, MAX_RETRIES, DOWNLOAD_DIR, generate_caption
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 class InstagramUploader:
@@ -0,0 +1,148 @@
+"""
+Network I/O benchmark: thread-per-transfer vs the asyncio engine (bot.aio).
+
+Each transfer downloads a payload from a local fixture server and uploads it in
+chunks to a local fake rupload endpoint, the two network-bound stages of a
+task. Both servers add per-request latency to stand in for Instagram's round
+trips, and run in a child process so that their threads do not count against
+the engine under test.
+
+--engine threads runs every transfer on its own thread with a requests session,
+as the thread worker does; --engine aio runs them all as coroutines on one
+event loop over a pooled aiohttp session. Reports transfers/sec, MB/s, peak
+thread count, peak RSS and chunk throughput, optionally as JSON.
+
+Usage:
+    python -m benchmarks.aio_bench --engine threads --transfers 200
+    python -m benchmarks.aio_bench --engine aio --transfers 200 --json aio.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _serve(directory, latency, drop_rate, connection, stop):
+    from benchmarks.fakes import FixtureServer, FakeRuploadServer
+
+    with FixtureServer(directory, latency=latency) as fixtures, \
+            FakeRuploadServer(latency=latency, drop_rate=drop_rate) as rupload:
+        connection.send((fixtures.url, rupload.url))
+        stop.wait()
+        connection.send(rupload.drops)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=("threads", "aio"), default="aio")
+    parser.add_argument("--transfers", type=int, default=200, help="downloads + uploads run concurrently")
+    parser.add_argument("--size-kb", type=int, default=2048, help="payload size of each transfer")
+    parser.add_argument("--chunk-kb", type=int, default=512, help="upload chunk size")
+    parser.add_argument("--latency-ms", type=float, default=100, help="server latency per request")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of upload chunks dropped")
+    parser.add_argument("--connections-per-host", type=int, default=64, help="aio connection pool size per host")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args()
+
+
+def run_threads(args, download_url, rupload_url, work_dir):
+    import requests
+    from bot.rupload import ChunkedUpload
+
+    def transfer(i):
+        destination = os.path.join(work_dir, f"threads_{i}.mp4")
+        with requests.Session() as http:
+            with http.get(download_url, stream=True) as response, open(destination, "wb") as f:
+                response.raise_for_status()
+                for block in response.iter_content(256 * 1024):
+                    f.write(block)
+            ChunkedUpload(http, base_url=rupload_url, chunk_size=args.chunk_kb * 1024).send(destination)
+
+    with ThreadPoolExecutor(max_workers=args.transfers) as executor:
+        futures = [executor.submit(transfer, i) for i in range(args.transfers)]
+    return [future.exception() for future in futures]
+
+
+def run_aio(args, download_url, rupload_url, work_dir):
+    from bot.aio import IOEngine, AsyncChunkedUpload
+
+    async def transfer(engine, i):
+        destination = await engine.fetch(download_url, os.path.join(work_dir, f"aio_{i}.mp4"))
+        await AsyncChunkedUpload(engine.session, base_url=rupload_url, chunk_size=args.chunk_kb * 1024).send(
+            destination)
+
+    with IOEngine(max_tasks=args.transfers, max_connections=args.connections_per_host * 2,
+                  connections_per_host=args.connections_per_host) as engine:
+        futures = [engine.submit(transfer(engine, i)) for i in range(args.transfers)]
+        return [future.exception() for future in futures]
+
+
+def main():
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    sys.path.insert(0, BASE_DIR)
+
+    from metrics import registry
+    from benchmarks.pipeline_bench import ThreadSampler
+
+    work_dir = tempfile.mkdtemp(prefix="aio_bench_")
+    with open(os.path.join(work_dir, "payload.mp4"), "wb") as f:
+        f.write(os.urandom(args.size_kb * 1024))
+
+    parent, child = multiprocessing.Pipe()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, daemon=True,
+                                     args=(work_dir, args.latency_ms / 1000, args.drop_rate, child, stop))
+    server.start()
+    fixture_url, rupload_url = parent.recv()
+
+    run = run_aio if args.engine == "aio" else run_threads
+    start = time.perf_counter()
+    with ThreadSampler(interval=0.01) as threads:
+        errors = run(args, f"{fixture_url}/payload.mp4", rupload_url, work_dir)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    drops = parent.recv()
+    server.join()
+
+    failed = [error for error in errors if error is not None]
+    completed = len(errors) - len(failed)
+    moved_mb = completed * args.size_kb * 2 / 1024
+    upload = registry.snapshot().get("upload.chunk_mbps", {})
+    results = {
+        "engine": args.engine,
+        "transfers": args.transfers,
+        "completed": completed,
+        "failed": len(failed),
+        "errors": sorted({str(error) for error in failed})[:5],
+        "elapsed_seconds": elapsed,
+        "transfers_per_second": completed / elapsed,
+        "mb_per_second": moved_mb / elapsed,
+        "peak_threads": threads.peak,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "upload_chunk_mbps": upload,
+        "dropped_connections": drops,
+    }
+
+    print(f"{args.engine}: {completed}/{args.transfers} transfers of {args.size_kb} KB in {elapsed:.2f}s: "
+          f"{results['transfers_per_second']:.1f} transfers/s, {results['mb_per_second']:.1f} MB/s")
+    print(f"  peak threads {threads.peak}, peak RSS {results['peak_rss_mb']:.1f} MB, "
+          f"upload chunks p50 {upload.get('p50', 0):.1f} Mbit/s, {drops} dropped connections")
+    for error in results["errors"]:
+        print(f"  error: {error}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Requests/sec on an authenticated endpoint with the user cache disabled and enabled.
+
+Runs against a throwaway SQLite database through Flask's test client, so it
+measures the per-request cost of the user_loader (plus the endpoint itself)
+without network latency. Against a remote Postgres the saved round trip is larger.
+
+Usage: python -m benchmarks.auth_bench [--requests 2000] [--endpoint /settings]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(client, endpoint, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(endpoint)
+        if response.status_code != 200:
+            raise RuntimeError(f"{endpoint} returned HTTP {response.status_code}")
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--endpoint", default="/settings")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    sys.path.insert(0, BASE_DIR)
+
+    from sqlalchemy import event
+    from app import app, db
+    from models import User
+    from user_cache import user_cache
+
+    queries = {"count": 0}
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", instagram_username="bench")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.commit()
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda *_: queries.__setitem__("count", queries["count"] + 1))
+
+    client = app.test_client()
+    client.post("/login", data={"username": "bench", "password": "bench"})
+
+    results = {}
+    ttl = user_cache.ttl
+    for label, cache_ttl in (("uncached", 0), ("cached", ttl or 60)):
+        user_cache.ttl = cache_ttl
+        user_cache.invalidate()
+        run(client, args.endpoint, min(100, args.requests))  # warm up
+        queries["count"] = 0
+        rps = run(client, args.endpoint, args.requests)
+        results[label] = {"requests_per_sec": rps, "queries_per_request": queries["count"] / args.requests}
+        print(f"{label:>9}: {rps:8.1f} req/s, {queries['count'] / args.requests:.2f} queries/request")
+    user_cache.ttl = ttl
+
+    speedup = results["cached"]["requests_per_sec"] / results["uncached"]["requests_per_sec"]
+    print(f"speedup: {speedup:.2f}x on {args.endpoint}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"endpoint": args.endpoint, "requests": args.requests, **results, "speedup": speedup}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Local stand-ins for the Instagram backends, for benchmarks that must run offline.
+
+- FixtureServer serves fixture files over HTTP from a local directory, with
+  optional per-request latency.
+- FakeInstaloader / FakeReelDownloader download "posts" from that server instead
+  of instagram.com.
+- FakeInstagramClient replaces instagrapi.Client: clip_upload reads the video in
+  chunks with configurable per-chunk latency and a random connection-drop rate.
+- FakeRuploadServer is a local rupload endpoint for the chunked uploader: it
+  tracks acknowledged offsets per upload and drops connections on purpose.
+"""
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import urllib.request
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+class _Server(ThreadingHTTPServer):
+    # Benchmarks open hundreds of connections at once; the default backlog of 5 turns that into SYN retries
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """Serve `directory` on 127.0.0.1 from a background thread"""
+
+    def __init__(self, directory, latency=0.0):
+        handler = type("Handler", (_FixtureHandler,), {"latency": latency})
+        self.httpd = _Server(("127.0.0.1", 0), partial(handler, directory=directory))
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _RuploadHandler(BaseHTTPRequestHandler):
+    server_state = None  # set per server: uploads, lock, latency, drop_rate, random, drops
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _upload_name(self):
+        return self.path.rstrip("/").rsplit("/", 1)[-1]
+
+    def do_GET(self):
+        state = self.server_state
+        with state["lock"]:
+            offset = len(state["uploads"].get(self._upload_name(), b""))
+        self._reply(200, {"offset": offset})
+
+    def do_POST(self):
+        state = self.server_state
+        name = self._upload_name()
+        offset = int(self.headers.get("Offset", 0))
+        length = int(self.headers.get("Content-Length", 0))
+        if state["latency"]:
+            time.sleep(state["latency"])
+
+        with state["lock"]:
+            received = state["uploads"].setdefault(name, bytearray())
+            if offset != len(received):
+                self._reply(400, {"offset": len(received), "message": "offset mismatch"})
+                return
+            drop = state["random"].random() < state["drop_rate"]
+
+        if drop:
+            # Read part of the chunk, then hang up without acknowledging any of it
+            self.rfile.read(length // 2)
+            with state["lock"]:
+                state["drops"] += 1
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        data = self.rfile.read(length)
+        with state["lock"]:
+            received.extend(data)
+            acknowledged = len(received)
+        self._reply(200, {"offset": acknowledged, "status": "ok"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeRuploadServer:
+    """Local rupload_igvideo endpoint that drops `drop_rate` of the chunk requests mid-body"""
+
+    def __init__(self, latency=0.0, drop_rate=0.0, seed=None):
+        self.state = {"uploads": {}, "lock": threading.Lock(), "latency": latency, "drop_rate": drop_rate,
+                      "random": random.Random(seed), "drops": 0}
+        handler = type("Handler", (_RuploadHandler,), {"server_state": self.state})
+        self.httpd = _Server(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/rupload_igvideo"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def received(self, upload_id):
+        """Bytes received for the upload with this upload id"""
+        with self.state["lock"]:
+            for name, data in self.state["uploads"].items():
+                if name.startswith(f"{upload_id}_"):
+                    return bytes(data)
+        return b""
+
+    @property
+    def drops(self):
+        return self.state["drops"]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeInstaloader:
+    """Just enough of instaloader.Instaloader for InstagramReelDownloader"""
+
+    context = None
+
+    def __init__(self, base_url, fixtures):
+        self.base_url = base_url
+        self.fixtures = fixtures
+
+    def login(self, username, password):
+        pass
+
+    def fixture_url(self, post):
+        # `post` is the shortcode; pick a fixture deterministically from it
+        return f"{self.base_url}/{self.fixtures[hash(post) % len(self.fixtures)]}"
+
+    def download_post(self, post, target):
+        os.makedirs(target, exist_ok=True)
+        destination = os.path.join(target, f"{post}.mp4")  # dirname_pattern "{target}", filename_pattern "{shortcode}"
+        with urllib.request.urlopen(self.fixture_url(post)) as response, open(destination, "wb") as f:
+            shutil.copyfileobj(response, f)
+        return True
+
+
+def fake_downloader_factory(base_url, fixtures):
+    """Return a factory of InstagramReelDownloader instances backed by FakeInstaloader"""
+    from bot.scraper import InstagramReelDownloader
+
+    class FakeReelDownloader(InstagramReelDownloader):
+        def _get_post(self, shortcode):
+            return shortcode
+
+        def _video_url(self, shortcode):
+            return self.loader.fixture_url(shortcode)
+
+    return lambda: FakeReelDownloader(loader=FakeInstaloader(base_url, fixtures))
+
+
+class FakeInstagramClient:
+    """Stand-in for instagrapi.Client with configurable upload latency and failure rate"""
+
+    def __init__(self, chunk_size=1024 * 1024, chunk_latency=0.0, error_rate=0.0, seed=None, rupload=None):
+        import requests
+
+        self.private = requests.Session()  # the chunked uploader sends its requests over this
+        self.rupload = rupload  # FakeRuploadServer checked by clip_configure
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.challenge_code_handler = None
+        self.settings = {"uuids": {"fake": True}}
+        self.uploaded_bytes = 0
+
+    def login(self, username, password, relogin=False):
+        return True
+
+    def set_settings(self, settings):
+        self.settings = settings
+
+    def get_settings(self):
+        return self.settings
+
+    def account_info(self):
+        return SimpleNamespace(username="fake")
+
+    def set_trusted_device(self, device):
+        pass
+
+    def clip_upload(self, path, caption, extra_data=None):
+        offset = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                if self.chunk_latency:
+                    time.sleep(self.chunk_latency)
+                if self.random.random() < self.error_rate:
+                    raise ConnectionError(f"Fake connection dropped at offset {offset}")
+                offset += len(chunk)
+                self.uploaded_bytes += len(chunk)
+        code = f"FAKE{self.random.randrange(10 ** 8):08d}"
+        return SimpleNamespace(id=code, code=code)
+
+    def clip_configure(self, upload_id, thumbnail, width, height, duration, caption, usertags=None,
+                       location=None, extra_data=None):
+        if self.rupload is not None and not self.rupload.received(upload_id):
+            raise Exception(f"Unknown upload {upload_id}")
+        code = f"FAKE{self.random.randrange(10 ** 8):08d}"
+        return {"media": {"id": code, "code": code}}
+
+
+def fake_uploader_factory(rupload=None, **client_options):
+    """
+    Return a factory of InstagramUploader instances backed by FakeInstagramClient.
+    With a FakeRuploadServer the chunked upload path is used, else clip_upload.
+    """
+    from bot.uploader import InstagramUploader
+
+    class FakeUploader(InstagramUploader):
+        def _analyze(self, video_path):
+            return 1080, 1920, 0.0, None
+
+    return lambda: FakeUploader(client=FakeInstagramClient(rupload=rupload, **client_options),
+                                chunked=rupload is not None, rupload_url=rupload.url if rupload else None)
@@ -0,0 +1,144 @@
+"""
+Per-frame stage microbenchmark on the synthetic benchmark clips.
+
+Decodes the first --frames frames of each clip (see benchmarks.video_bench) into
+memory, repeats each one --repeat times the way MoviePy does when it raises the
+frame rate, and times each stage implementation over that stream, so stage
+changes can be compared without the decoder and encoder in the measurement.
+
+Usage: python -m benchmarks.frame_bench --sizes 720x1280,1080x1920,2160x3840 --repeat 2 --json frames.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_SIZE = (1080, 1920)
+
+
+def legacy_scaling(width, height):
+    # attached_assets/video_processor.upscale_and_smooth: always resize to 1080x1920 with cubic + blur
+    import cv2
+
+    def stage(frame):
+        frame = cv2.resize(frame, TARGET_SIZE, interpolation=cv2.INTER_CUBIC)
+        return cv2.GaussianBlur(frame, (3, 3), 0)
+    return stage
+
+
+def bot_scaling(width, height):
+    from bot.encode_profiles import select_profile
+    from bot.scaling import FrameScaler, DuplicateFrameSkipper
+
+    profile = select_profile({"width": width, "height": height, "fps": 30})
+    return DuplicateFrameSkipper(FrameScaler((profile.width, profile.height)))
+
+
+def legacy_hdr(width, height):
+    # attached_assets/video_processor.apply_hdr_effect: a PIL ImageEnhance chain, new images at every step
+    import numpy as np
+    from PIL import Image, ImageEnhance
+
+    def stage(frame):
+        image = Image.fromarray(frame)
+        image = ImageEnhance.Brightness(image).enhance(1.1)
+        image = ImageEnhance.Contrast(image).enhance(1.3)
+        image = ImageEnhance.Sharpness(image).enhance(1.4)
+        image = ImageEnhance.Color(image).enhance(1.25)
+        return np.array(image)
+    return stage
+
+
+def bot_hdr(width, height):
+    from bot.frame_pool import FramePool, apply_hdr
+
+    pool = FramePool()
+    return lambda frame: apply_hdr(frame, pool)
+
+
+# name -> factory(width, height) returning stage(frame)
+STAGES = {
+    "scaling.legacy": legacy_scaling,
+    "scaling.bot": bot_scaling,
+    "hdr.legacy": legacy_hdr,
+    "hdr.bot": bot_hdr,
+}
+
+
+def decode_frames(path, count):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame.flags.writeable = False  # like MoviePy's decoded frames
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def time_stage(stage, frames, repeat):
+    start = time.perf_counter()
+    for frame in frames:
+        for _ in range(repeat):
+            stage(frame)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "frames_per_second": len(frames) * repeat / elapsed}
+
+
+def peak_allocation(stage, frames, repeat):
+    """Peak bytes allocated while running the stage (numpy reports its buffers to tracemalloc)"""
+    import tracemalloc
+
+    tracemalloc.start()
+    for frame in frames:
+        for _ in range(repeat):
+            stage(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="720x1280,1080x1920,2160x3840", help="comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--frames", type=int, default=120, help="frames decoded per clip")
+    parser.add_argument("--repeat", type=int, default=2, help="times each frame is handed to the stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages")
+    parser.add_argument("--clips-dir", default=os.path.join(tempfile.gettempdir(), "video_bench_clips"))
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BASE_DIR)
+    from benchmarks.video_bench import generate_clip
+
+    os.makedirs(args.clips_dir, exist_ok=True)
+    duration = max(1, -(-args.frames // args.fps))
+    results = []
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.lower().split("x"))
+        frames = decode_frames(generate_clip(args.clips_dir, width, height, args.fps, duration), args.frames)
+        for name in args.stages.split(","):
+            result = {"stage": name, "size": size, "frames": len(frames), "repeat": args.repeat,
+                      **time_stage(STAGES[name](width, height), frames, args.repeat)}
+            # Separate, traced pass on a fresh stage so tracing doesn't skew the timing
+            result["peak_allocated_mb"] = peak_allocation(STAGES[name](width, height), frames[:10], 1) / 1024 / 1024
+            results.append(result)
+            print(f"{size:<11} {name:<20} {result['frames_per_second']:9.1f} frames/s "
+                  f"{result['peak_allocated_mb']:8.1f} MB peak allocated")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
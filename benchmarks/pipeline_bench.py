@@ -0,0 +1,213 @@
+"""
+End-to-end pipeline benchmark against local fake Instagram backends.
+
+Creates N synthetic tasks in a throwaway SQLite database and drives them either
+directly through bot.pipeline.run_task on a thread pool (--mode direct), on the
+asyncio engine (--mode aio, needs aiohttp), on the per-stage pools of
+bot.staged (--mode staged, --concurrency sets the download and upload pools) or
+through the scheduler/worker loop (--mode worker). Downloads come from a local
+HTTP server serving fixture MP4s. Uploads go either through the resumable
+chunked path to a fake rupload endpoint that drops --upload-error-rate of the
+chunk requests (--upload-mode chunked), or whole-file to a fake instagrapi
+client that fails the same way and restarts from zero (--upload-mode single).
+
+Reports tasks/min, per-stage latency percentiles, peak RSS, peak thread count and
+database query counts, optionally as JSON for comparison between runs.
+
+Usage: python -m benchmarks.pipeline_bench --tasks 20 --concurrency 4 --json results.json
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ThreadSampler:
+    """Track the peak number of live threads"""
+
+    def __init__(self, interval=0.05):
+        self.peak = threading.active_count()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=("direct", "aio", "staged", "worker"), default="direct")
+    parser.add_argument("--fixtures", default=os.path.join(BASE_DIR, "downloads"),
+                        help="directory of fixture .mp4 files to serve")
+    parser.add_argument("--download-latency-ms", type=float, default=50)
+    parser.add_argument("--upload-chunk-kb", type=int, default=512)
+    parser.add_argument("--upload-chunk-latency-ms", type=float, default=20)
+    parser.add_argument("--upload-error-rate", type=float, default=0.0,
+                        help="probability that any upload chunk drops the connection")
+    parser.add_argument("--upload-mode", choices=("chunked", "single"), default="chunked",
+                        help="resumable chunked uploads to a fake rupload endpoint, or clip_upload")
+    parser.add_argument("--slot-in", type=float, default=0,
+                        help="schedule every task this many seconds ahead (worker mode prefetches them; "
+                             "see pipeline.publish_delay_seconds)")
+    parser.add_argument("--timeout", type=float, default=600, help="give up after this many seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    fixture_dir = os.path.abspath(args.fixtures)
+    json_path = os.path.abspath(args.json) if args.json else None
+    fixtures = sorted(os.path.basename(path) for path in glob.glob(os.path.join(fixture_dir, "*.mp4")))
+    if not fixtures:
+        sys.exit(f"No .mp4 fixtures found in {fixture_dir}")
+
+    # Everything the pipeline writes (downloads, processed videos, sessions, DB) goes to a scratch dir
+    work_dir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    os.chdir(work_dir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ.setdefault("UPLOAD_RETRY_DELAY", "0.1")
+    os.environ.setdefault("UPLOAD_HUMAN_DELAY", "0")
+    os.environ.setdefault("UPLOAD_RESUME_DELAY", "0.1")
+    os.environ.setdefault("UPLOAD_CHUNK_SIZE", str(args.upload_chunk_kb * 1024))
+    # The fixtures repeat across tasks, which duplicate detection would (rightly) skip processing for
+    os.environ.setdefault("DEDUP_ENABLED", "false")
+    sys.path.insert(0, BASE_DIR)
+
+    from sqlalchemy import event
+    from app import app, db, session_scope
+    from models import User, ReelTask
+    from metrics import registry
+    from bot.pipeline import Backends, run_task
+    from bot.worker import Worker
+    from benchmarks.fakes import FixtureServer, FakeRuploadServer, fake_downloader_factory, fake_uploader_factory
+
+    with app.app_context():
+        db.create_all()
+        query_count = {"value": 0}
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda *_: query_count.__setitem__("value", query_count["value"] + 1))
+
+    with session_scope() as session:
+        user = User(username="bench", instagram_username="bench_account")
+        user.set_password("bench")
+        session.add(user)
+        session.flush()
+        # Due now (as routes.add_reel schedules tasks without an explicit time) or all in one later slot
+        slot = datetime.utcnow() + timedelta(seconds=args.slot_in)
+        tasks = [ReelTask(url=f"https://www.instagram.com/reel/BENCH{i:05d}/", status="pending",
+                          scheduled_for=slot, user_id=user.id) for i in range(args.tasks)]
+        session.add_all(tasks)
+        session.flush()
+        task_ids = [task.id for task in tasks]
+
+    chunked = args.upload_mode == "chunked"
+    with FixtureServer(fixture_dir, latency=args.download_latency_ms / 1000) as server, \
+            FakeRuploadServer(latency=args.upload_chunk_latency_ms / 1000,
+                              drop_rate=args.upload_error_rate if chunked else 0.0) as rupload:
+        backends = Backends(
+            downloader=fake_downloader_factory(server.url, fixtures),
+            uploader=fake_uploader_factory(rupload=rupload if chunked else None,
+                                           chunk_size=args.upload_chunk_kb * 1024,
+                                           chunk_latency=args.upload_chunk_latency_ms / 1000,
+                                           error_rate=0.0 if chunked else args.upload_error_rate),
+        )
+
+        query_count["value"] = 0
+        start = time.perf_counter()
+        with ThreadSampler() as threads:
+            if args.mode == "direct":
+                with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                    list(executor.map(lambda task_id: run_task(task_id, backends=backends), task_ids))
+            elif args.mode == "aio":
+                from bot.aio import IOEngine
+                with IOEngine(max_tasks=args.concurrency) as engine:
+                    futures = [engine.submit(engine.run_task(task_id, backends=backends)) for task_id in task_ids]
+                    for future in futures:
+                        future.result()
+            elif args.mode == "staged":
+                from bot.staged import StagedExecutor
+                staged = StagedExecutor(backends=backends, download_workers=args.concurrency,
+                                        upload_workers=args.concurrency).start()
+                for task_id in task_ids:
+                    staged.submit(task_id)
+                staged.shutdown()
+            else:
+                worker = Worker(concurrency=args.concurrency, poll_interval=0.5, backends=backends)
+                runner = threading.Thread(target=worker.run, daemon=True)
+                runner.start()
+                deadline = time.monotonic() + args.timeout
+                while time.monotonic() < deadline:
+                    with session_scope() as session:
+                        remaining = session.query(ReelTask).filter(
+                            ReelTask.status.in_(["pending", "processing"])).count()
+                    if not remaining:
+                        break
+                    time.sleep(0.2)
+                worker.stop()
+                runner.join()
+        elapsed = time.perf_counter() - start
+
+    with session_scope() as session:
+        statuses = dict(session.query(ReelTask.status, db.func.count()).group_by(ReelTask.status).all())
+
+    snapshot = registry.snapshot()
+    results = {
+        "mode": args.mode,
+        "upload_mode": args.upload_mode,
+        "tasks": args.tasks,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": elapsed,
+        "statuses": statuses,
+        "tasks_per_minute": statuses.get("completed", 0) / elapsed * 60,
+        "stages": {name: value for name, value in snapshot.items() if name.startswith("pipeline.")},
+        "stage_pools": {name: value for name, value in snapshot.items() if name.startswith("stage.")},
+        "upload": {name: value for name, value in snapshot.items() if name.startswith("upload.")},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_threads": threads.peak,
+        "db_queries": query_count["value"],
+        "db_queries_per_task": query_count["value"] / args.tasks,
+    }
+
+    print(f"{args.tasks} tasks ({args.mode}, concurrency {args.concurrency}) in {elapsed:.2f}s: "
+          f"{results['tasks_per_minute']:.1f} tasks/min, statuses {statuses}")
+    for name, stats in results["stages"].items():
+        print(f"  {name:<32} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  max {stats['max']:.3f}s")
+    for name, value in results["stage_pools"].items():
+        if name.endswith(".utilization"):
+            print(f"  {name:<32} {value:.0%}")
+    upload = results["upload"]
+    if "upload.chunk_mbps" in upload:
+        print(f"  upload chunks p50 {upload['upload.chunk_mbps']['p50']:.1f} Mbit/s, "
+              f"{upload.get('upload.bytes_sent', 0) / 1e6:.1f} MB sent, {upload.get('upload.resumed', 0)} resumes, "
+              f"{rupload.drops} dropped connections")
+    print(f"  peak RSS {results['peak_rss_mb']:.1f} MB, peak threads {threads.peak}, "
+          f"{results['db_queries_per_task']:.1f} DB queries/task")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
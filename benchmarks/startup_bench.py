@@ -0,0 +1,120 @@
+"""
+Cold-start benchmark for the web entry point.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, reports the
+slowest imports, fails if the total exceeds the budget or if any of the heavy bot
+dependencies were imported, then times a fresh process serving its first /login.
+
+Usage: python -m benchmarks.startup_bench [--budget-ms 500] [--request-budget-ms 1000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only a worker running a task should ever import these
+HEAVY_MODULES = ("instaloader", "instagrapi", "moviepy", "cv2", "numpy", "PIL")
+
+FIRST_REQUEST_SNIPPET = """
+import time
+start = time.perf_counter()
+from app import app
+client = app.test_client()
+response = client.get('/login')
+print(response.status_code, (time.perf_counter() - start) * 1000)
+"""
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure_imports():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def measure_first_request():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST_SNIPPET],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"first request failed:\n{result.stderr[-2000:]}")
+    status, in_process_ms = result.stdout.split()[-2:]
+    return int(status), float(in_process_ms), wall_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=500, help="budget for importing app")
+    parser.add_argument("--request-budget-ms", type=float, default=1000,
+                        help="budget for a fresh process to serve /login, interpreter start included")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    entries = measure_imports()
+    total_ms = sum(self_us for _, self_us, _, _ in entries) / 1000
+    heavy = sorted({name for name, _, _, _ in entries if name.split(".")[0] in HEAVY_MODULES})
+
+    print(f"import app: {total_ms:.1f} ms across {len(entries)} modules (budget {args.budget_ms:.0f} ms)")
+    print("Slowest top-level imports (cumulative):")
+    top_level = sorted((e for e in entries if e[3] == 0), key=lambda e: e[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    status, in_process_ms, wall_ms = measure_first_request()
+    print(f"first GET /login: HTTP {status}, {in_process_ms:.1f} ms in process, "
+          f"{wall_ms:.1f} ms including interpreter start (budget {args.request_budget_ms:.0f} ms)")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    if wall_ms > args.request_budget_ms:
+        failures.append(f"first request {wall_ms:.1f} ms exceeds budget of {args.request_budget_ms:.0f} ms")
+    if heavy:
+        failures.append(f"heavy modules imported by the web tier: {', '.join(heavy)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "import_ms": total_ms,
+                "import_budget_ms": args.budget_ms,
+                "first_request_ms": wall_ms,
+                "first_request_in_process_ms": in_process_ms,
+                "request_budget_ms": args.request_budget_ms,
+                "heavy_modules": heavy,
+                "slowest": [{"module": name, "cumulative_ms": cumulative_us / 1000}
+                            for name, _, cumulative_us, _ in top_level[:args.top]],
+            }, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
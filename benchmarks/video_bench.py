@@ -0,0 +1,271 @@
+"""
+Video processing benchmark on synthetic clips.
+
+Generates test clips (ffmpeg testsrc2 + tone) for every combination of --sizes,
+--fps and --durations, runs each pipeline configuration on each clip in a child
+process, and reports wall time, frames/sec, CPU utilization, peak memory, output
+bitrate and quality (PSNR/SSIM against the source clip). Runs fully offline on a
+CPU-only box; only ffmpeg/ffprobe on PATH are required.
+
+Usage:
+    python -m benchmarks.video_bench --list
+    python -m benchmarks.video_bench --configs bot.balanced --concurrency 4   # peak RSS per concurrent encode
+    python -m benchmarks.video_bench --sizes 720x1280,1080x1920 --fps 30,60 --durations 15,90 \\
+        --configs bot.balanced,legacy.full --json video_results.json
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGO_PATH = os.path.join(BASE_DIR, "attached_assets", "llr.png")
+
+
+def _bot_copy(input_path, output_dir):
+    from bot.video_processor import process_video
+    return process_video(input_path, transforms=())
+
+
+def _bot_full(tier):
+    # Same transformations as the legacy pipeline, encoded with a bot.encode_profiles tier
+    def run(input_path, output_dir):
+        from bot.video_processor import process_video
+        return process_video(input_path, transforms=("border", "hdr", "logo"), tier=tier, logo_path=LOGO_PATH)
+    return run
+
+
+def _legacy_hdr_frame(frame):
+    # upscale_and_smooth() + apply_hdr_effect() of attached_assets/video_processor.py
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageEnhance
+
+    frame = cv2.resize(frame, (1080, 1920), interpolation=cv2.INTER_CUBIC)
+    frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    image = Image.fromarray(frame)
+    image = ImageEnhance.Brightness(image).enhance(1.1)
+    image = ImageEnhance.Contrast(image).enhance(1.3)
+    image = ImageEnhance.Sharpness(image).enhance(1.4)
+    image = ImageEnhance.Color(image).enhance(1.25)
+    return np.array(image)
+
+
+def _legacy_full(input_path, output_dir):
+    """
+    attached_assets/video_processor.py's process_video(path) (border, then the
+    60 fps upscale + HDR pass, no logo) ported to the moviepy 2 API: the script
+    imports moviepy.editor and moviepy.video.fx.all, which moviepy 2 removed.
+    Same steps, codecs, bitrates and presets; errors propagate instead of being
+    printed and ignored.
+    """
+    from moviepy import VideoFileClip, vfx
+
+    bordered_path = os.path.join(output_dir, "bordered_processed_video.mp4")
+    hdr_path = os.path.join(output_dir, "hdr_processed_video.mp4")
+    with VideoFileClip(input_path) as video:
+        video.with_effects([vfx.Margin(10, color=(0, 0, 0))]).write_videofile(
+            bordered_path, codec="libx264", bitrate="5000k")
+    with VideoFileClip(bordered_path) as video:
+        video.with_fps(60).image_transform(_legacy_hdr_frame).write_videofile(
+            hdr_path, codec="libx264", bitrate="10M", fps=60, preset="slow", threads=4)
+    return hdr_path
+
+
+# name -> callable(input_path, output_dir) returning the output path
+CONFIGS = {
+    "bot.copy": _bot_copy,
+    "bot.fast": _bot_full("fast"),
+    "bot.balanced": _bot_full("balanced"),
+    "bot.quality": _bot_full("quality"),
+    "legacy.full": _legacy_full,
+}
+
+
+def _run(command):
+    return subprocess.run(command, capture_output=True, text=True, check=True)
+
+
+def generate_clip(clips_dir, width, height, fps, duration):
+    """Create (or reuse) a synthetic clip; it doubles as the quality reference"""
+    path = os.path.join(clips_dir, f"synthetic_{width}x{height}_{fps}fps_{duration}s.mp4")
+    if not os.path.exists(path):
+        _run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "12", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", path,
+        ])
+    return path
+
+
+def probe(path):
+    output = _run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration,bit_rate:stream=codec_type,width,height,r_frame_rate",
+        "-of", "json", path,
+    ]).stdout
+    info = json.loads(output)
+    video = next(s for s in info["streams"] if s["codec_type"] == "video")
+    num, den = video["r_frame_rate"].split("/")
+    return {
+        "width": video["width"],
+        "height": video["height"],
+        "fps": float(num) / float(den),
+        "duration": float(info["format"]["duration"]),
+        "bitrate": int(info["format"].get("bit_rate", 0)),
+    }
+
+
+def quality(output_path, reference_path, reference):
+    """PSNR and SSIM of the output, rescaled/retimed to the reference's geometry and rate"""
+    scores = {}
+    for metric, pattern in (("ssim", r"All:([\d.]+)"), ("psnr", r"average:([\d.inf]+)")):
+        result = subprocess.run([
+            "ffmpeg", "-loglevel", "info", "-i", output_path, "-i", reference_path,
+            "-lavfi", f"[0:v]scale={reference['width']}:{reference['height']}:flags=bicubic,"
+                      f"fps={reference['fps']}[out];[out][1:v]{metric}",
+            "-f", "null", "-",
+        ], capture_output=True, text=True)
+        match = re.findall(pattern, result.stderr)
+        scores[metric] = float(match[-1]) if match else None
+    return scores
+
+
+def run_one(config, input_path, output_dir, concurrency=1):
+    """
+    Child process entry point: run one configuration, `concurrency` times in
+    parallel threads like a worker does, and print the first output path
+    """
+    sys.path.insert(0, BASE_DIR)
+    os.chdir(output_dir)
+    if concurrency == 1:
+        output_path = CONFIGS[config](input_path, output_dir)
+    else:
+        # Distinct input names so the encodes don't overwrite each other's output
+        inputs = []
+        for i in range(concurrency):
+            path = os.path.join(output_dir, f"input_{i}{os.path.splitext(input_path)[1]}")
+            shutil.copyfile(input_path, path)
+            inputs.append(path)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outputs = list(executor.map(lambda path: CONFIGS[config](path, output_dir), inputs))
+        output_path = outputs[0] if all(outputs) else None
+    print(json.dumps({"output": os.path.abspath(output_path) if output_path else None}))
+
+
+def measure(config, clip_path, reference, concurrency=1):
+    """Run a configuration in a child process and collect its resource usage"""
+    output_dir = tempfile.mkdtemp(prefix="video_bench_out_")
+    # The child's output goes to files: it can exceed a pipe buffer (moviepy progress bars),
+    # and nothing would drain a pipe while wait4 blocks
+    with tempfile.TemporaryFile("w+") as stdout_file, tempfile.TemporaryFile("w+") as stderr_file:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.video_bench", "--run-one", config, clip_path, output_dir,
+             "--concurrency", str(concurrency)],
+            cwd=BASE_DIR, stdout=stdout_file, stderr=stderr_file, text=True,
+        )
+        # wait4 reports the child's usage including the ffmpeg processes it waited for
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stdout_file.seek(0)
+        stderr_file.seek(0)
+        stdout, stderr = stdout_file.read(), stderr_file.read()
+
+    result = {"config": config, "concurrency": concurrency, "wall_seconds": wall}
+    output_path = None
+    if process.returncode == 0:
+        lines = [line for line in stdout.splitlines() if line.startswith("{")]
+        output_path = json.loads(lines[-1])["output"] if lines else None
+    if not output_path or not os.path.exists(output_path):
+        result["error"] = (stderr.strip().splitlines() or ["no output produced"])[-1]
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return result
+
+    frames = reference["fps"] * reference["duration"] * concurrency
+    output = probe(output_path)
+    result.update({
+        "frames_per_second": frames / wall,
+        "cpu_utilization": (usage.ru_utime + usage.ru_stime) / wall,  # 1.0 = one core fully busy
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "peak_rss_mb_per_encode": usage.ru_maxrss / 1024 / concurrency,
+        "output_bitrate_kbps": output["bitrate"] / 1000,
+        "output": {key: output[key] for key in ("width", "height", "fps", "duration")},
+        **quality(output_path, clip_path, reference),
+    })
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="720x1280,1080x1920", help="comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--fps", default="30,60", help="comma-separated frame rates")
+    parser.add_argument("--durations", default="15", help="comma-separated durations in seconds")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma-separated configurations")
+    parser.add_argument("--clips-dir", default=os.path.join(tempfile.gettempdir(), "video_bench_clips"),
+                        help="where synthetic clips are generated and cached")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="encodes run in parallel threads of one process, as in a worker")
+    parser.add_argument("--list", action="store_true", help="list the available configurations")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--run-one", nargs=3, metavar=("CONFIG", "INPUT", "OUTPUT_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(*args.run_one, concurrency=args.concurrency)
+        return
+    if args.list:
+        print("\n".join(CONFIGS))
+        return
+    if not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        sys.exit("ffmpeg and ffprobe must be on PATH")
+
+    configs = parse_list(args.configs)
+    unknown = [config for config in configs if config not in CONFIGS]
+    if unknown:
+        sys.exit(f"Unknown configurations: {', '.join(unknown)} (see --list)")
+
+    if args.concurrency > 1 and "legacy.full" in configs:
+        sys.exit("legacy.full writes fixed output file names and can only run with --concurrency 1")
+
+    os.makedirs(args.clips_dir, exist_ok=True)
+    results = []
+    for size in parse_list(args.sizes):
+        width, height = (int(v) for v in size.lower().split("x"))
+        for fps in parse_list(args.fps, int):
+            for duration in parse_list(args.durations, int):
+                clip_path = generate_clip(args.clips_dir, width, height, fps, duration)
+                reference = probe(clip_path)
+                for config in configs:
+                    result = measure(config, clip_path, reference, args.concurrency)
+                    result["clip"] = {"width": width, "height": height, "fps": fps, "duration": duration}
+                    results.append(result)
+
+                    label = f"{width}x{height}@{fps} {duration}s {config}"
+                    if "error" in result:
+                        print(f"{label:<40} FAILED: {result['error']}")
+                    else:
+                        print(f"{label:<40} {result['wall_seconds']:7.2f}s {result['frames_per_second']:7.1f} fps "
+                              f"cpu {result['cpu_utilization']:4.1f} rss {result['peak_rss_mb_per_encode']:6.0f}MB/encode "
+                              f"{result['output_bitrate_kbps']:7.0f}kbps psnr {result['psnr']} ssim {result['ssim']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,20 @@
-from .scraper import InstagramReelDownloader
-from .uploader import upload_with_retry
-from .video_processor import process_video
+# The bot modules pull in instaloader, instagrapi and the video stack, so they are
+# imported on first attribute access rather than with the package. The web tier
+# can then import bot.scheduler / bot.pipeline without paying for them.
+_LAZY_EXPORTS = {
+    "InstagramReelDownloader": ".scraper",
+    "upload_with_retry": ".uploader",
+    "process_video": ".video_processor",
+}
 
-__all__ = ["InstagramReelDownloader", "upload_with_retry", "process_video"]
\ No newline at end of file
+__all__ = ["InstagramReelDownloader", "upload_with_retry", "process_video"]
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,310 @@
+"""
+asyncio engine for the network-bound pipeline stages (WORKER_ENGINE=aio).
+
+Video downloads and chunked uploads run as coroutines on one event loop thread
+and share a single aiohttp session, whose connector keeps a pool of keep-alive
+connections per host. A transfer in flight costs a socket and a few KB rather
+than an OS thread, so one worker can drive hundreds of them. The calls that
+stay blocking run on two small thread pools: database access, instaloader's
+post lookup and instagrapi's login/configure calls on one, video encoding on a
+pool sized to the CPUs.
+
+aiohttp is optional (pip install aiohttp); the default thread engine in
+bot.worker does not need it.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from functools import partial
+
+import config
+from metrics import registry
+from . import pipeline
+from .artifacts import file_checksum, mapped, iter_chunks
+from .rupload import ChunkedUpload, new_upload_name
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_BLOCK_SIZE = 256 * 1024
+
+
+class AsyncChunkedUpload(ChunkedUpload):
+    """
+    ChunkedUpload over an aiohttp session: same protocol and resume semantics.
+    `on_progress(upload_name, offset)` must be a coroutine function.
+    """
+
+    async def acknowledged_offset(self, upload_name, length):
+        async with self.http.get(f"{self.base_url}/{upload_name}",
+                                 headers=self._headers(upload_name, length)) as response:
+            if response.status == 404:
+                return 0
+            response.raise_for_status()
+            return int((await response.json(content_type=None)).get('offset', 0))
+
+    async def send(self, path, upload_name=None):
+        upload_name = upload_name or new_upload_name()
+        throughput = registry.histogram('upload.chunk_mbps')
+        sent_bytes = registry.counter('upload.bytes_sent')
+
+        with mapped(path) as view:
+            length = len(view)
+            offset = await self.acknowledged_offset(upload_name, length)
+            if offset:
+                logger.info(f"Resuming upload {upload_name} at byte {offset} of {length}")
+                registry.counter('upload.resumed').inc()
+
+            for start, chunk in iter_chunks(view, self.chunk_size, offset):
+                # aiohttp holds on to the request body, so it gets a copy and the slice is released now
+                body = chunk.tobytes()
+                chunk.release()
+                headers = self._headers(upload_name, length)
+                headers.update({
+                    'Offset': str(start),
+                    'Content-Type': 'application/octet-stream',
+                })
+                chunk_start = time.perf_counter()
+                async with self.http.post(f"{self.base_url}/{upload_name}", data=body,
+                                          headers=headers) as response:
+                    response.raise_for_status()
+                elapsed = time.perf_counter() - chunk_start
+
+                offset = start + len(body)
+                sent_bytes.inc(len(body))
+                throughput.observe(len(body) * 8 / 1e6 / max(elapsed, 1e-6))
+                logger.debug(f"Upload {upload_name}: {offset}/{length} bytes acknowledged")
+                if self.on_progress:
+                    await self.on_progress(upload_name, offset)
+
+        return upload_name
+
+
+class IOEngine:
+    """
+    Event loop thread plus the executors around it. Coroutines are handed in
+    from any thread with submit(); run_task() is the async counterpart of
+    bot.pipeline.run_task and shares its checkpoints.
+    """
+
+    def __init__(self, max_tasks=config.AIO_MAX_TASKS, max_connections=config.AIO_MAX_CONNECTIONS,
+                 connections_per_host=config.AIO_CONNECTIONS_PER_HOST,
+                 blocking_workers=config.AIO_BLOCKING_WORKERS, cpu_workers=config.AIO_CPU_WORKERS):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio engine needs aiohttp: pip install aiohttp")
+        self.max_tasks = max_tasks
+        self.max_connections = max_connections
+        self.connections_per_host = connections_per_host
+        self.blocking_executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="reel-io")
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="reel-cpu")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.blocking_executor)
+        self.session = None
+        self._slots = None
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._in_flight = 0
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="reel-aio", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._open())
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.session.close())
+        self.loop.close()
+
+    async def _open(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.connections_per_host,
+                                         keepalive_timeout=config.AIO_KEEPALIVE_TIMEOUT)
+        # No cookie jar: tasks of different accounts share the session, so cookies are sent per request
+        self.session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=config.AIO_READ_TIMEOUT))
+        self._slots = asyncio.Semaphore(self.max_tasks)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        logger.info(f"I/O engine started: {self.max_tasks} tasks, {self.max_connections} connections "
+                    f"({self.connections_per_host} per host)")
+        return self
+
+    def submit(self, coroutine):
+        """Run a coroutine on the engine's loop from any thread; returns a concurrent future"""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def stop(self):
+        """Wait for submitted coroutines, then close the HTTP session and the executors"""
+        if self._thread.is_alive():
+            with self._pending_lock:
+                pending = list(self._pending)
+            wait(pending)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self.blocking_executor.shutdown(wait=True)
+        self.cpu_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def blocking(self, fn, *args, **kwargs):
+        return await self.loop.run_in_executor(self.blocking_executor, partial(fn, *args, **kwargs))
+
+    async def cpu_bound(self, fn, *args, **kwargs):
+        return await self.loop.run_in_executor(self.cpu_executor, partial(fn, *args, **kwargs))
+
+    async def fetch(self, url, destination, headers=None):
+        """Stream `url` into `destination` (written under a temporary name, then renamed)"""
+        tmp_path = f"{destination}.part"
+        received = 0
+        start = time.perf_counter()
+        async with self.session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            # Small sequential writes land in the page cache; not worth an executor round trip each
+            with open(tmp_path, 'wb') as f:
+                async for block in response.content.iter_chunked(DOWNLOAD_BLOCK_SIZE):
+                    f.write(block)
+                    received += len(block)
+        os.replace(tmp_path, destination)
+        registry.counter('download.bytes').inc(received)
+        registry.histogram('download.mbps').observe(received * 8 / 1e6 / max(time.perf_counter() - start, 1e-6))
+        return destination
+
+    async def _download(self, task, instagram_username, backends):
+        await self.blocking(pipeline._set_stage, task, pipeline.DOWNLOADING)
+        if await self.blocking(pipeline._reuse_download, task):
+            return
+        logger.info(f"Starting download for task {task.id}")
+        downloader = await self.blocking(backends.downloader)
+        shortcode, video_url = await self.blocking(downloader.resolve, task.url, instagram_username,
+                                                   os.environ.get('INSTAGRAM_PASSWORD'))
+        os.makedirs("downloads", exist_ok=True)
+        video_path = await self.fetch(video_url, os.path.join("downloads", f"{shortcode}_{task.id}.mp4"))
+        logger.info(f"Download completed for task {task.id}: {video_path}")
+        checksum = await self.blocking(file_checksum, video_path)
+        await self.blocking(pipeline._set_stage, task, pipeline.DOWNLOADED, video_path=video_path,
+                            video_checksum=checksum, media_info=None, fingerprint=None, fingerprinted_at=None,
+                            duplicate_of=None)
+
+    async def _upload(self, task, instagram_username, backends, max_retries=3):
+        from .uploader import InstagramUploader
+
+        uploader = await self.blocking(lambda: backends.uploader() or InstagramUploader())
+        if not uploader.chunked:
+            # Whole-file clip_upload has no async equivalent; keep it off the loop
+            await self.blocking(pipeline._upload, task, backends)
+            return
+
+        async def record_progress(upload_session, upload_offset):
+            task.upload_session, task.upload_offset = upload_session, upload_offset
+            await self.blocking(pipeline._update_task, task.id, upload_session=upload_session,
+                                upload_offset=upload_offset)
+
+        await self.blocking(pipeline._set_stage, task, pipeline.UPLOADING)
+        logger.info(f"Uploading video for task {task.id}"
+                    + (f", resuming {task.upload_session} at byte {task.upload_offset or 0}"
+                       if task.upload_session else ""))
+        password = uploader.password()
+        errors = []
+        for attempt in range(max_retries):
+            offset_before = task.upload_offset
+            try:
+                if not await self.blocking(uploader.login, instagram_username, password):
+                    raise Exception(f"Failed to login to Instagram on attempt {attempt + 1}")
+                await asyncio.sleep(config.UPLOAD_HUMAN_DELAY)
+
+                analysis = await self.blocking(uploader.analyze_clip, task.processed_path)
+                upload = AsyncChunkedUpload(self.session, base_url=uploader.rupload_url,
+                                            headers=uploader.session_headers(),
+                                            on_progress=record_progress, media=analysis[:3])
+                upload_name = await upload.send(task.processed_path, task.upload_session)
+                timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                caption = f"{pipeline.DEFAULT_CAPTION}\n\nUploaded at {timestamp} #repost"
+                media = await self.blocking(uploader.configure_clip, upload_name, task.processed_path, caption,
+                                            analysis)
+                if not media:
+                    raise Exception("Clip configuration returned no media")
+                logger.info(f"Upload completed for task {task.id}: "
+                            f"https://www.instagram.com/reel/{media.get('code')}/")
+                await self.blocking(uploader.log_event, "INFO",
+                                    f"Upload successful for video: {os.path.basename(task.processed_path)}")
+                return
+            except Exception as e:
+                error_msg = f"Upload attempt {attempt + 1} for task {task.id} failed: {str(e)}"
+                logger.error(error_msg)
+                errors.append(error_msg)
+
+            if attempt < max_retries - 1:
+                wait_time = config.UPLOAD_RETRY_DELAY * (attempt + 1)
+                if task.upload_offset != offset_before:
+                    # The connection dropped mid-upload; resume from the acknowledged offset right away
+                    wait_time = config.UPLOAD_RESUME_DELAY
+                await asyncio.sleep(wait_time)
+
+        await self.blocking(uploader.log_event, "ERROR", "\n".join(errors)[:500])
+        raise Exception(f"Failed to upload video for task {task.id}")
+
+    async def run_task(self, task_id, resume=False, on_reschedule=None, backends=None, prefetch=False):
+        """Same stages, checkpoints and outcome as bot.pipeline.run_task, with the transfers on the loop"""
+        backends = backends or pipeline.default_backends
+        async with self._slots:
+            self._in_flight += 1
+            registry.gauge('aio.tasks_in_flight').set(self._in_flight)
+            task = None
+            try:
+                started = await self.blocking(pipeline._start, task_id, resume)
+                if not started:
+                    return
+                task, instagram_username, stage = started
+
+                if stage == pipeline.DOWNLOADING:
+                    with pipeline._timed('download'):
+                        await self._download(task, instagram_username, backends)
+                    stage = pipeline.PROCESSING
+                if stage == pipeline.PROCESSING:
+                    with pipeline._timed('probe'):
+                        await self.blocking(pipeline._probe, task)
+                    with pipeline._timed('fingerprint'):
+                        reused = await self.cpu_bound(pipeline._dedupe, task, instagram_username)
+                    if not reused:
+                        with pipeline._timed('process'):
+                            await self.cpu_bound(pipeline._process, task)
+                if prefetch and await self.blocking(pipeline._hold, task, on_reschedule):
+                    return
+                with pipeline._timed('upload'):
+                    await self._upload(task, instagram_username, backends)
+
+                await self.blocking(pipeline._finish, task, on_reschedule)
+
+            except Exception as e:
+                if task:
+                    if not (prefetch and await self.blocking(pipeline._release_prefetch, task, e, on_reschedule)):
+                        await self.blocking(pipeline._fail, task, e, on_reschedule)
+                else:
+                    logger.error(f"Error processing task {task_id}: {str(e)}")
+            finally:
+                if task is not None:
+                    pipeline.heartbeat.remove(task_id)
+                self._in_flight -= 1
+                registry.gauge('aio.tasks_in_flight').set(self._in_flight)
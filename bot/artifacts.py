@@ -0,0 +1,86 @@
+import errno
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents (btrfs, XFS, overlayfs on those)
+
+
+@contextmanager
+def mapped(path):
+    """Map a file read-only and yield a memoryview of it (empty files yield an empty view)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b"")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+def iter_chunks(view, chunk_size=CHUNK_SIZE, offset=0):
+    """Yield (offset, memoryview slice) pairs over a mapped file without copying"""
+    for start in range(offset, len(view), chunk_size):
+        yield start, view[start:start + chunk_size]
+
+
+def file_checksum(path):
+    """Return the SHA-256 hex digest of a file, read through the page cache mapping"""
+    with mapped(path) as view:
+        return hashlib.sha256(view).hexdigest()
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+def link_or_copy(src, dst):
+    """
+    Make `dst` the same content as `src` without rewriting it where possible:
+    a hardlink on the same filesystem, else a reflink, else a plain copy.
+    Artifacts are never modified in place, so sharing the data is safe.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return dst
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return dst
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+    try:
+        _reflink(src, dst)
+        shutil.copystat(src, dst)
+        return dst
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+    logger.debug(f"Could not link {src} to {dst}, copying")
+    shutil.copy2(src, dst)
+    return dst
+
+
+def artifact_is_valid(path, checksum):
+    """Check that a recorded stage artifact still exists and matches its checksum"""
+    if not path or not checksum or not os.path.exists(path):
+        return False
+    try:
+        if file_checksum(path) == checksum:
+            return True
+        logger.warning(f"Checksum mismatch for artifact {path}, discarding checkpoint")
+    except OSError as e:
+        logger.warning(f"Could not verify artifact {path}: {str(e)}")
+    return False
@@ -0,0 +1,185 @@
+"""
+Adaptive sizing of the staged executor's pools (python -m bot.worker --engine staged --autoscale).
+
+Every AUTOSCALE_INTERVAL seconds the controller looks at each stage (its queue,
+how busy its threads were and the mean time per task) and at the host (load
+average per CPU and available memory, including a cgroup memory limit), and
+resizes the download, render and upload pools within their bounds, AIMD style:
+
+- grow by one thread when tasks are queued and the pool was busy
+  (AUTOSCALE_BUSY) and the host has room;
+- halve when the host is overloaded (render: load average above AUTOSCALE_MAX_LOAD
+  per CPU; every pool: available memory below AUTOSCALE_MIN_MEMORY), or when
+  the stage got slower per task after the previous increase, which means the
+  extra thread only added contention;
+- shrink by one thread when nothing is queued and the pool was mostly idle
+  (AUTOSCALE_IDLE), so a quiet night does not keep a full pool around.
+
+After halving, a stage neither grows nor halves again for AUTOSCALE_COOLDOWN
+seconds: load average trails the actual load by about a minute. Decisions are logged and
+exported as metrics (autoscale.* and stage.<name>.workers).
+"""
+import logging
+import os
+import time
+
+import config
+from metrics import registry
+from .staged import physical_cores
+
+logger = logging.getLogger(__name__)
+
+# Stage -> the pipeline histogram holding its time per task
+STAGE_LATENCY = {'download': 'download', 'render': 'process', 'upload': 'upload'}
+LATENCY_SMOOTHING = 0.3  # weight of the newest interval in the latency baseline
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_per_cpu():
+    """One-minute load average per usable CPU, or None where the OS doesn't report it"""
+    try:
+        return os.getloadavg()[0] / cpu_count()
+    except (AttributeError, OSError):
+        return None
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == 'max' else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def memory_available_ratio():
+    """Share of memory still available to this process (host or cgroup, whichever is tighter), or None"""
+    try:
+        meminfo = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                meminfo[name] = int(value.split()[0]) * 1024
+        total, available = meminfo['MemTotal'], meminfo['MemAvailable']
+    except (OSError, KeyError, ValueError):
+        return None
+    limit = _read_int('/sys/fs/cgroup/memory.max')
+    used = _read_int('/sys/fs/cgroup/memory.current')
+    if limit and used is not None and limit < total:
+        total, available = limit, min(available, limit - used)
+    return max(0.0, available / total)
+
+
+class _StageState:
+    def __init__(self, stage, minimum, maximum):
+        self.stage = stage
+        self.minimum = minimum
+        self.maximum = maximum
+        self.busy = stage.busy_seconds()
+        self.sampled_at = time.monotonic()
+        histogram = registry.histogram(f'pipeline.{STAGE_LATENCY[stage.name]}_seconds')
+        self.latency_histogram = histogram
+        self.latency_count, self.latency_total = histogram.count, histogram.total
+        self.baseline = None  # smoothed seconds per task
+        self.last_action = None
+        self.cooldown_until = 0.0
+
+    def sample(self, now):
+        """(utilization, mean seconds per task or None) since the previous sample"""
+        busy = self.stage.busy_seconds()
+        elapsed = now - self.sampled_at
+        utilization = (busy - self.busy) / (elapsed * self.stage.workers) if elapsed > 0 else 0.0
+        self.busy, self.sampled_at = busy, now
+
+        histogram = self.latency_histogram
+        count, total = histogram.count, histogram.total
+        latency = (total - self.latency_total) / (count - self.latency_count) if count > self.latency_count else None
+        self.latency_count, self.latency_total = count, total
+        return min(1.0, utilization), latency
+
+
+class Autoscaler:
+    def __init__(self, executor, interval=config.AUTOSCALE_INTERVAL, busy=config.AUTOSCALE_BUSY,
+                 idle=config.AUTOSCALE_IDLE, max_load=config.AUTOSCALE_MAX_LOAD,
+                 min_memory=config.AUTOSCALE_MIN_MEMORY, cooldown=config.AUTOSCALE_COOLDOWN,
+                 latency_factor=config.AUTOSCALE_LATENCY_FACTOR, bounds=None):
+        self.executor = executor
+        self.interval = interval
+        self.busy = busy
+        self.idle = idle
+        self.max_load = max_load
+        self.min_memory = min_memory
+        self.cooldown = cooldown
+        self.latency_factor = latency_factor
+        bounds = bounds or {
+            'download': (config.AUTOSCALE_IO_MIN, config.AUTOSCALE_IO_MAX),
+            'render': (config.AUTOSCALE_RENDER_MIN, config.AUTOSCALE_RENDER_MAX or physical_cores()),
+            'upload': (config.AUTOSCALE_IO_MIN, config.AUTOSCALE_IO_MAX),
+        }
+        self._states = {name: _StageState(executor.stages[name], *bounds[name]) for name in bounds}
+
+    def _decide(self, state, queued, utilization, latency, load, memory):
+        """(new worker count, kind, reason) for one stage; kind is 'up', 'down', 'backoff' or None"""
+        workers = state.stage.workers
+        if memory is not None and memory < self.min_memory:
+            return workers // 2, 'backoff', f"memory available {memory:.0%}"
+        if state.stage.name == 'render' and load is not None and load > self.max_load:
+            return workers // 2, 'backoff', f"load {load:.2f} per CPU"
+        if (latency is not None and state.baseline and state.last_action == 'up'
+                and latency > state.baseline * self.latency_factor):
+            return workers // 2, 'backoff', f"{latency:.1f}s per task after growing, was {state.baseline:.1f}s"
+        if queued and utilization >= self.busy:
+            if state.stage.name == 'render' and load is not None and load > self.max_load * 0.9:
+                return workers, None, None  # close to the limit: hold
+            return workers + 1, 'up', f"{queued} queued, {utilization:.0%} busy"
+        if not queued and utilization < self.idle:
+            return workers - 1, 'down', f"{utilization:.0%} busy, nothing queued"
+        return workers, None, None
+
+    def tick(self, now=None):
+        """Sample every stage and the host once and apply the decisions; returns the changes made"""
+        now = now or time.monotonic()
+        load, memory = load_per_cpu(), memory_available_ratio()
+        if load is not None:
+            registry.gauge('autoscale.load_per_cpu').set(round(load, 2))
+        if memory is not None:
+            registry.gauge('autoscale.memory_available').set(round(memory, 3))
+
+        changes = []
+        for name, state in self._states.items():
+            utilization, latency = state.sample(now)
+            registry.gauge(f'autoscale.{name}.utilization').set(round(utilization, 3))
+            workers = state.stage.workers
+            target, kind, reason = self._decide(state, len(state.stage), utilization, latency, load, memory)
+            target = min(max(target, state.minimum), state.maximum)
+            if latency is not None and state.last_action != 'up':
+                # Only intervals at a settled size feed the baseline
+                state.baseline = latency if state.baseline is None else \
+                    (1 - LATENCY_SMOOTHING) * state.baseline + LATENCY_SMOOTHING * latency
+
+            if target == workers or (kind in ('up', 'backoff') and now < state.cooldown_until):
+                state.last_action = None
+                continue
+            if kind == 'backoff':
+                state.cooldown_until = now + self.cooldown
+            state.last_action = kind
+            self.executor.resize(name, target)
+            registry.counter(f'autoscale.{name}.{kind}').inc()
+            logger.info(f"Autoscaler: {name} pool {workers} -> {target} ({reason})")
+            changes.append((name, workers, target, reason))
+        return changes
+
+    def run(self, stop_event):
+        logger.info("Autoscaler started: " + ", ".join(
+            f"{name} {state.minimum}-{state.maximum}" for name, state in self._states.items()))
+        while not stop_event.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error in autoscaler: {str(e)}")
@@ -0,0 +1,118 @@
+"""
+Encode profiles for processed reels.
+
+probe_video() reads the source's geometry, frame rate, bitrate and duration with
+ffprobe (bot.probe reads the same from MP4 headers without spawning it), and
+select_profile() picks the cheapest encode that still meets the Reels
+constraints below: the source size and frame rate are kept unless they
+fall outside the limits (never upscaled; the frame rate is clamped to
+MIN_FPS..MAX_FPS), quality is set with
+CRF and the bitrate is only capped, and the speed/quality tier picks the x264
+preset. Encoder threads are left to ffmpeg so profiles work on any host.
+"""
+import json
+import logging
+import subprocess
+from collections import namedtuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Instagram Reels limits
+MAX_WIDTH = 1080
+MAX_HEIGHT = 1920
+MIN_FPS = 23
+MAX_FPS = 60
+MIN_DURATION = 3  # seconds
+MAX_DURATION = 90  # seconds
+
+# tier -> x264 preset, CRF and bitrate cap (kbps)
+TIERS = {
+    'fast': {'preset': 'veryfast', 'crf': 26, 'maxrate': 4000},
+    'balanced': {'preset': 'faster', 'crf': 23, 'maxrate': 6000},
+    'quality': {'preset': 'slow', 'crf': 20, 'maxrate': 8000},
+}
+
+EncodeProfile = namedtuple('EncodeProfile', 'tier width height fps crf preset maxrate bufsize')
+
+
+def probe_video(path):
+    """Return the source's codecs, width, height, fps, bitrate (kbps) and duration, or None"""
+    try:
+        output = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'stream=codec_type,codec_name,width,height,avg_frame_rate,bit_rate:format=duration,bit_rate',
+            '-of', 'json', path,
+        ], capture_output=True, text=True, check=True).stdout
+        info = json.loads(output)
+        streams = info.get('streams', [])
+        stream = next(s for s in streams if s.get('codec_type') == 'video')
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        num, den = stream['avg_frame_rate'].split('/')
+        bitrate = stream.get('bit_rate') or info['format'].get('bit_rate') or 0
+        return {
+            'codec': stream.get('codec_name'),
+            'audio_codec': audio.get('codec_name') if audio else None,
+            'width': int(stream['width']),
+            'height': int(stream['height']),
+            'fps': float(num) / float(den) if float(den) else 0.0,
+            'bitrate': int(bitrate) // 1000,
+            'duration': float(info['format'].get('duration', 0)),
+        }
+    except Exception as e:
+        logger.error(f"Error probing video {path}: {str(e)}")
+        return None
+
+
+def _even(value):
+    return max(2, int(value) // 2 * 2)
+
+
+def select_profile(info, tier=None):
+    """Pick the encode profile for a probed source and a speed/quality tier"""
+    tier = tier if tier in TIERS else config.ENCODE_TIER
+    settings = TIERS[tier]
+
+    # Downscale only, keeping the aspect ratio, to fit inside the Reels frame
+    width, height = info['width'], info['height']
+    scale = min(1.0, MAX_WIDTH / min(width, height), MAX_HEIGHT / max(width, height))
+    width, height = _even(width * scale), _even(height * scale)
+
+    fps = info['fps'] or 30
+    fps = min(max(fps, MIN_FPS), MAX_FPS)
+
+    # A cap above the source bitrate buys nothing: x264 at the CRF will not need it
+    maxrate = settings['maxrate']
+    if info.get('bitrate'):
+        maxrate = min(maxrate, max(info['bitrate'] * 3 // 2, 1000))
+
+    return EncodeProfile(tier=tier, width=width, height=height, fps=round(fps, 3), crf=settings['crf'],
+                         preset=settings['preset'], maxrate=maxrate, bufsize=maxrate * 2)
+
+
+def needs_reencode(info, profile):
+    """
+    Whether the source's streams can't be uploaded as they are, so pixels have to
+    be touched even without visual transformations
+    """
+    return (
+        info.get('codec') != 'h264'
+        or info.get('audio_codec') not in (None, 'aac')
+        or (info['width'], info['height']) != (profile.width, profile.height)
+        # Clamped into MIN_FPS..MAX_FPS by select_profile; a remux would keep the source rate
+        or not MIN_FPS <= (info['fps'] or profile.fps) <= MAX_FPS
+        # Players don't all honour the rotation flag, so it is baked into the pixels
+        or bool(info.get('rotation'))
+    )
+
+
+def ffmpeg_params(profile):
+    """Extra ffmpeg output options for a profile (codec, preset and fps are passed separately)"""
+    return [
+        '-crf', str(profile.crf),
+        '-maxrate', f'{profile.maxrate}k',
+        '-bufsize', f'{profile.bufsize}k',
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+    ]
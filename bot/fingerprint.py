@@ -0,0 +1,163 @@
+"""
+Perceptual fingerprints of downloaded videos, for spotting the same content
+behind different URLs or submitted by different users.
+
+video_fingerprint() decodes DEDUP_SAMPLES frames spread over the video and
+takes a 64-bit difference hash (dHash) of each: the frame is shrunk to 9x8
+grey pixels and every bit says whether a pixel is brighter than its right-hand
+neighbour. Re-encoding, rescaling and mild colour changes flip only a few bits,
+while different content differs in about half of them. Flat frames (black
+fades, solid title cards) hash alike for any video and are left out.
+
+Two videos are compared by the share of one's frames that have a frame in the
+other within DEDUP_FRAME_DISTANCE bits, so trimmed copies and copies of a
+different length still line up. FingerprintIndex finds candidates without
+scanning every video: each frame hash is split into four 16-bit bands and
+indexed by band, and only videos sharing bands with the query are scored
+(frames within 3 bits always share a band; further apart they usually do).
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import config
+
+logger = logging.getLogger(__name__)
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+FLAT_FRAME_STDDEV = 4.0  # grey levels; frames flatter than this carry no content
+RESYNC_OVERLAP = timedelta(minutes=5)  # covers clock skew between workers
+# Reading on is cheaper than seeking, which decodes again from the previous
+# keyframe, unless the next sample is more than a couple of seconds ahead
+SEEK_AFTER_FRAMES = 60
+
+
+def _dhash(frame):
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    if gray.std() < FLAT_FRAME_STDDEV:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
+
+def video_fingerprint(path, samples=config.DEDUP_SAMPLES):
+    """dHashes of up to `samples` evenly spread, non-flat frames of a video"""
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return []
+        hashes = []
+        position = 0
+        for target in sorted({int((index + 0.5) * frame_count / samples) for index in range(samples)}):
+            if target - position > SEEK_AFTER_FRAMES:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+                position = target
+            while position < target and capture.grab():
+                position += 1
+            ok, frame = capture.read()
+            position += 1
+            if not ok:
+                break
+            value = _dhash(frame)
+            if value is not None:
+                hashes.append(value)
+        return hashes
+    finally:
+        capture.release()
+
+
+def encode(hashes):
+    return ''.join(f'{value:016x}' for value in hashes)
+
+
+def decode(fingerprint):
+    return [int(fingerprint[i:i + 16], 16) for i in range(0, len(fingerprint or ''), 16)]
+
+
+def overlap(hashes, other, max_distance=config.DEDUP_FRAME_DISTANCE):
+    """Share of `hashes` with a frame in `other` at most `max_distance` bits away"""
+    if not hashes or not other:
+        return 0.0
+    matched = sum(1 for value in hashes if any((value ^ o).bit_count() <= max_distance for o in other))
+    return matched / len(hashes)
+
+
+def _bands(value):
+    return [(band, (value >> (band * BAND_BITS)) & 0xFFFF) for band in range(BANDS)]
+
+
+class FingerprintIndex:
+    """In-memory band index over the fingerprints of every downloaded video"""
+
+    def __init__(self, max_distance=config.DEDUP_FRAME_DISTANCE, min_overlap=config.DEDUP_MIN_OVERLAP):
+        self.max_distance = max_distance
+        self.min_overlap = min_overlap
+        self._videos = {}  # task id -> hashes
+        self._buckets = defaultdict(set)  # (band, value) -> task ids
+        self._lock = threading.Lock()
+        self._synced_at = None
+
+    def __len__(self):
+        return len(self._videos)
+
+    def add(self, task_id, hashes):
+        with self._lock:
+            self._remove(task_id)
+            self._videos[task_id] = list(hashes)
+            for value in hashes:
+                for key in _bands(value):
+                    self._buckets[key].add(task_id)
+
+    def _remove(self, task_id):
+        for value in self._videos.pop(task_id, ()):
+            for key in _bands(value):
+                self._buckets[key].discard(task_id)
+                if not self._buckets[key]:
+                    del self._buckets[key]
+
+    def remove(self, task_id):
+        with self._lock:
+            self._remove(task_id)
+
+    def query(self, hashes, exclude=()):
+        """(task id, overlap) of the indexed videos matching `hashes`, best first"""
+        with self._lock:
+            votes = Counter()
+            for value in hashes:
+                for key in _bands(value):
+                    votes.update(self._buckets.get(key, ()))
+            candidates = [(task_id, self._videos[task_id]) for task_id in votes if task_id not in exclude]
+        matches = []
+        for task_id, other in candidates:
+            score = overlap(hashes, other, self.max_distance)
+            if score >= self.min_overlap:
+                matches.append((task_id, score))
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def sync(self):
+        """Pick up the fingerprints recorded (by any worker) since the last sync"""
+        from app import session_scope
+        from models import ReelTask
+
+        started = datetime.utcnow()
+        with session_scope() as session:
+            query = session.query(ReelTask.id, ReelTask.fingerprint).filter(ReelTask.fingerprint.isnot(None))
+            if self._synced_at:
+                query = query.filter(ReelTask.fingerprinted_at >= self._synced_at - RESYNC_OVERLAP)
+            rows = query.all()
+        for task_id, fingerprint in rows:
+            self.add(task_id, decode(fingerprint))
+        if self._synced_at is None:
+            logger.info(f"Loaded {len(rows)} video fingerprints")
+        self._synced_at = started
+
+
+fingerprint_index = FingerprintIndex()
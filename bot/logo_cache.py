@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import config
+from .artifacts import file_checksum
+
+logger = logging.getLogger(__name__)
+
+
+class LogoOverlay:
+    """
+    A logo pre-rendered for one frame size: its bounding box in the frame plus
+    the premultiplied colour (rgb * alpha) and inverse alpha (255 - alpha) as
+    uint16, so blending is out = (frame * inv_alpha + premultiplied) // 255 over
+    the box only. The sum never exceeds 255 * 255, so uint16 cannot overflow.
+    """
+
+    def __init__(self, x, y, premultiplied, inv_alpha):
+        self.x = x
+        self.y = y
+        self.premultiplied = premultiplied
+        self.inv_alpha = inv_alpha
+        self.height, self.width = inv_alpha.shape[:2]
+        self._scratch = threading.local()
+
+    def _buffer(self):
+        import numpy as np
+
+        buffer = getattr(self._scratch, 'buffer', None)
+        if buffer is None:
+            buffer = self._scratch.buffer = np.empty(self.premultiplied.shape, dtype=np.uint16)
+        return buffer
+
+    def blend(self, frame, pool=None):
+        """Blend the logo into `frame` in place (copying it into `pool` first if it is read-only)"""
+        import numpy as np
+
+        if not frame.flags.writeable:
+            frame = pool.writable(frame) if pool is not None else frame.copy()
+        roi = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        buffer = self._buffer()
+        np.multiply(roi, self.inv_alpha, out=buffer)
+        buffer += self.premultiplied
+        buffer //= 255
+        roi[...] = buffer
+        return frame
+
+
+def _position(frame_size, logo_size, position):
+    (frame_w, frame_h), (logo_w, logo_h) = frame_size, logo_size
+    horizontal, vertical = position
+    x = {'left': 0, 'center': (frame_w - logo_w) // 2, 'right': frame_w - logo_w}[horizontal]
+    y = {'top': 0, 'center': (frame_h - logo_h) // 2, 'bottom': frame_h - logo_h}[vertical]
+    return x, y
+
+
+def render_overlay(logo_path, frame_size, opacity, position):
+    """Resize the logo to 1/15 of the frame height and premultiply its alpha"""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(logo_path) as image:
+        image = image.convert('RGBA')
+        logo_h = max(1, min(frame_size[1], frame_size[1] // 15))
+        logo_w = max(1, min(frame_size[0], round(image.width * logo_h / image.height)))
+        image = image.resize((logo_w, logo_h), Image.LANCZOS)
+        rgba = np.asarray(image, dtype=np.uint16)
+
+    alpha = np.rint(rgba[..., 3:4] * opacity).astype(np.uint16)
+    premultiplied = rgba[..., :3] * alpha
+    inv_alpha = 255 - alpha
+    x, y = _position(frame_size, (logo_w, logo_h), position)
+    return LogoOverlay(x, y, premultiplied, inv_alpha)
+
+
+class LogoCache:
+    """
+    Pre-rendered logo overlays keyed by (logo hash, frame size, opacity,
+    position), kept in an in-process LRU and as .npz files on disk so other
+    workers and restarts reuse them.
+    """
+
+    def __init__(self, cache_dir=config.LOGO_CACHE_DIR, max_size=16):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._hashes = {}  # (path, mtime, size) -> sha256, so the logo is hashed once per change
+        self._lock = threading.Lock()
+
+    def _logo_hash(self, logo_path):
+        stat = os.stat(logo_path)
+        key = (os.path.abspath(logo_path), stat.st_mtime_ns, stat.st_size)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = self._hashes[key] = file_checksum(logo_path)
+        return digest
+
+    def _disk_path(self, key):
+        digest, (width, height), opacity, (horizontal, vertical) = key
+        return os.path.join(self.cache_dir, f"{digest[:16]}_{width}x{height}_{opacity:.3f}_{horizontal}_{vertical}.npz")
+
+    def _load(self, path):
+        import numpy as np
+
+        try:
+            with np.load(path) as data:
+                return LogoOverlay(int(data['x']), int(data['y']), data['premultiplied'], data['inv_alpha'])
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable logo cache file {path}: {str(e)}")
+            return None
+
+    def _save(self, path, overlay):
+        import numpy as np
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Unique per thread too: two threads of a worker can build the same overlay at once
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+            np.savez(tmp_path, x=overlay.x, y=overlay.y, premultiplied=overlay.premultiplied,
+                     inv_alpha=overlay.inv_alpha)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write logo cache file {path}: {str(e)}")
+
+    def get(self, logo_path, frame_size, opacity=0.5, position=('center', 'bottom')):
+        """Return the LogoOverlay for a logo composited onto frames of `frame_size` (width, height)"""
+        key = (self._logo_hash(logo_path), tuple(frame_size), float(opacity), tuple(position))
+        with self._lock:
+            overlay = self._entries.get(key)
+            if overlay is not None:
+                self._entries.move_to_end(key)
+                return overlay
+
+        path = self._disk_path(key)
+        overlay = self._load(path) if os.path.exists(path) else None
+        if overlay is None:
+            logger.info(f"Rendering logo overlay {os.path.basename(path)}")
+            overlay = render_overlay(logo_path, frame_size, opacity, position)
+            self._save(path, overlay)
+
+        with self._lock:
+            self._entries[key] = overlay
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return overlay
+
+
+logo_cache = LogoCache()
@@ -0,0 +1,556 @@
+import os
+import re
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import or_
+
+import config
+from metrics import registry
+from .artifacts import file_checksum, artifact_is_valid, link_or_copy
+from .scheduler import next_occurrence
+
+logger = logging.getLogger(__name__)
+
+# The download/process/upload modules import heavy third-party libraries, so
+# each stage imports its module only when a worker actually runs it.
+
+# Task stages, in pipeline order. `status` stays the coarse, user-facing state
+# (pending/processing/completed/failed); `stage` records how far a task got.
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+PROCESSING = 'processing'
+PROCESSED = 'processed'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+
+HEARTBEAT_INTERVAL = 30  # seconds between heartbeats of running tasks
+STALE_AFTER = 120  # a processing task without a heartbeat for this long has lost its worker
+
+DEFAULT_CAPTION = "Check out this amazing content! #fitness #motivation"
+
+
+# Columns a running task needs; they are copied out of the session so that no
+# ORM object (and no pooled connection) is held across network or video I/O
+TASK_FIELDS = (
+    'id', 'url', 'status', 'stage', 'scheduled_for', 'repeat_interval', 'user_id',
+    'video_path', 'video_checksum', 'processed_path', 'processed_checksum', 'occurrence_count', 'failure_count',
+    'encode_tier', 'upload_session', 'upload_offset', 'media_info', 'shortcode', 'fingerprint', 'duplicate_of',
+)
+
+
+class Heartbeat:
+    """Periodically stamps heartbeat_at on every task this process is running"""
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL):
+        self._interval = interval
+        self._running = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, task_id):
+        with self._lock:
+            self._running.add(task_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def remove(self, task_id):
+        with self._lock:
+            self._running.discard(task_id)
+
+    def _run(self):
+        from app import session_scope
+        from models import ReelTask
+
+        while True:
+            time.sleep(self._interval)
+            with self._lock:
+                task_ids = list(self._running)
+            if not task_ids:
+                continue
+            try:
+                with session_scope() as session:
+                    session.query(ReelTask).filter(ReelTask.id.in_(task_ids)).update(
+                        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            except Exception as e:
+                logger.error(f"Error updating task heartbeats: {str(e)}")
+
+
+heartbeat = Heartbeat()
+
+
+def _load_task(task_id):
+    """Return a detached snapshot of the task's pipeline fields, or None"""
+    from app import session_scope
+    from models import ReelTask
+
+    with session_scope() as session:
+        task = session.get(ReelTask, task_id)
+        if task is None:
+            return None
+        return SimpleNamespace(**{name: getattr(task, name) for name in TASK_FIELDS})
+
+
+def _update_task(task_id, **fields):
+    from app import session_scope
+    from models import ReelTask
+
+    with session_scope() as session:
+        session.query(ReelTask).filter_by(id=task_id).update(fields, synchronize_session=False)
+
+
+def _set_stage(task, stage, **fields):
+    """Record a stage transition (and its artifacts) durably before moving on"""
+    now = datetime.utcnow()
+    fields.update(stage=stage, stage_updated_at=now, heartbeat_at=now)
+    _update_task(task.id, **fields)
+    for name, value in fields.items():
+        setattr(task, name, value)
+    logger.info(f"Task {task.id} stage set to {stage}")
+
+
+def _resume_stage(task):
+    """Pick the first stage still to run from the last durable checkpoint"""
+    if artifact_is_valid(task.processed_path, task.processed_checksum):
+        return UPLOADING
+    if artifact_is_valid(task.video_path, task.video_checksum):
+        return PROCESSING
+    return DOWNLOADING
+
+
+def _claim(task_id, resume):
+    """
+    Atomically take ownership of a task. New runs claim pending tasks; recovery
+    claims processing tasks whose worker stopped sending heartbeats.
+    """
+    from app import session_scope
+    from models import ReelTask
+
+    now = datetime.utcnow()
+    with session_scope() as session:
+        query = session.query(ReelTask).filter(ReelTask.id == task_id)
+        if resume:
+            query = query.filter(
+                ReelTask.status == 'processing',
+                or_(ReelTask.heartbeat_at.is_(None), ReelTask.heartbeat_at < now - timedelta(seconds=STALE_AFTER))
+            )
+        else:
+            query = query.filter(ReelTask.status == 'pending')
+
+        claimed = query.update({'status': 'processing', 'heartbeat_at': now}, synchronize_session=False)
+    return bool(claimed)
+
+
+def _instagram_username(user_id):
+    from app import session_scope
+    from models import User
+
+    with session_scope() as session:
+        user = session.get(User, user_id)
+        return user.instagram_username if user else None
+
+
+class Backends:
+    """Factories for the Instagram clients the stages use; benchmarks plug in local fakes"""
+
+    def __init__(self, downloader=None, uploader=None):
+        self._downloader = downloader
+        self._uploader = uploader
+
+    def downloader(self):
+        if self._downloader:
+            return self._downloader()
+        from .scraper import InstagramReelDownloader
+        return InstagramReelDownloader()
+
+    def uploader(self):
+        # None lets upload_with_retry build the real InstagramUploader
+        return self._uploader() if self._uploader else None
+
+
+default_backends = Backends()
+
+
+@contextmanager
+def _timed(name):
+    """Record the duration of a stage in the pipeline.<name>_seconds histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.histogram(f'pipeline.{name}_seconds').observe(time.perf_counter() - start)
+
+
+class DuplicateContent(Exception):
+    """The task would post content its account has already posted (DEDUP_DOUBLE_POST=skip)"""
+
+
+def _task_artifact(path, task):
+    """A link to another task's artifact under a name of this task's own, so neither overwrites the other's"""
+    root, ext = os.path.splitext(path)
+    root = re.sub(r'_task\d+$', '', root)
+    return link_or_copy(path, f"{root}_task{task.id}{ext}")
+
+
+def _reuse_download(task):
+    """Take over the download of an earlier task for the same post if its file is intact; returns True if so"""
+    from app import session_scope
+    from models import ReelTask
+    from .reel_urls import parse_shortcode, InvalidReelURL
+
+    if not task.shortcode:
+        try:
+            task.shortcode = parse_shortcode(task.url)
+        except InvalidReelURL:
+            return False
+        _update_task(task.id, shortcode=task.shortcode)
+
+    with session_scope() as session:
+        earlier = session.query(
+            ReelTask.id, ReelTask.video_path, ReelTask.video_checksum, ReelTask.media_info, ReelTask.fingerprint
+        ).filter(
+            ReelTask.shortcode == task.shortcode,
+            ReelTask.id != task.id,
+            ReelTask.video_checksum.isnot(None),
+        ).order_by(ReelTask.id.desc()).limit(5).all()
+    for other_id, video_path, checksum, media_info, fingerprint in earlier:
+        if artifact_is_valid(video_path, checksum):
+            video_path = _task_artifact(video_path, task)
+            logger.info(f"Task {task.id} is the same post as task {other_id}, reusing its download: {video_path}")
+            registry.counter('dedup.downloads_reused').inc()
+            _set_stage(task, DOWNLOADED, video_path=video_path, video_checksum=checksum, media_info=media_info,
+                       fingerprint=fingerprint, fingerprinted_at=datetime.utcnow() if fingerprint is not None else None,
+                       duplicate_of=None)
+            return True
+    return False
+
+
+def _download(task, instagram_username, backends):
+    _set_stage(task, DOWNLOADING)
+    if _reuse_download(task):
+        return
+    logger.info(f"Starting download for task {task.id}")
+    downloader = backends.downloader()
+    # Named after the task, like bot.aio's downloads, so concurrent downloads of one post don't collide
+    video_path = downloader.download_reel(task.url, instagram_username, os.environ.get('INSTAGRAM_PASSWORD'),
+                                          destination=os.path.join("downloads", f"{task.shortcode}_{task.id}.mp4"))
+    if not video_path:
+        raise Exception(f"Failed to download reel for task {task.id}")
+
+    logger.info(f"Download completed for task {task.id}: {video_path}")
+    _set_stage(task, DOWNLOADED, video_path=video_path, video_checksum=file_checksum(video_path), media_info=None,
+               fingerprint=None, fingerprinted_at=None, duplicate_of=None)
+
+
+def _probe(task):
+    """
+    Read the downloaded video's container headers once, store them on the task
+    and reject inputs that can't become a reel before anything expensive runs
+    """
+    from .probe import probe, validate
+
+    if task.media_info:
+        info = json.loads(task.media_info)
+    else:
+        info = probe(task.video_path)
+        if info:
+            task.media_info = json.dumps(info)
+            _update_task(task.id, media_info=task.media_info)
+    validate(info)
+    logger.info(f"Task {task.id} source: {info['codec']}/{info['audio_codec']} {info['width']}x{info['height']}"
+                f"@{info['fps']:.2f} {info['duration']:.1f}s")
+    return info
+
+
+def _dedupe(task, instagram_username):
+    """
+    Fingerprint the downloaded video and look for the same content in other
+    tasks (see bot.fingerprint). A match is recorded in duplicate_of, a repost
+    to the same account is flagged (or failed with DEDUP_DOUBLE_POST=skip), and
+    the match's processed video is reused if it was rendered at the same tier.
+    Returns True if processing can be skipped.
+    """
+    from .fingerprint import fingerprint_index, video_fingerprint, encode, decode
+
+    if not config.DEDUP_ENABLED:
+        return False
+    if task.fingerprint is not None:
+        hashes = decode(task.fingerprint)
+    else:
+        hashes = video_fingerprint(task.video_path)
+        task.fingerprint = encode(hashes)
+        _update_task(task.id, fingerprint=task.fingerprint, fingerprinted_at=datetime.utcnow())
+    if not hashes:
+        logger.info(f"Task {task.id}: no frames with content to fingerprint, skipping duplicate check")
+        return False
+
+    fingerprint_index.sync()
+    matches = fingerprint_index.query(hashes, exclude={task.id})
+    fingerprint_index.add(task.id, hashes)
+    for other_id, score in matches:
+        other = _load_task(other_id)
+        if other is None:
+            fingerprint_index.remove(other_id)
+            continue
+        return _handle_duplicate(task, instagram_username, other, score)
+    return False
+
+
+def _handle_duplicate(task, instagram_username, other, score):
+    _update_task(task.id, duplicate_of=other.id)
+    task.duplicate_of = other.id
+    registry.counter('dedup.duplicates').inc()
+    logger.warning(f"Task {task.id} has the same content as task {other.id} ({score:.0%} of sampled frames match)")
+
+    if other.status != 'failed' and (other.user_id == task.user_id
+                                     or _instagram_username(other.user_id) == instagram_username):
+        registry.counter('dedup.double_posts').inc()
+        message = f"Duplicate of task {other.id}, which posts the same video to @{instagram_username}"
+        if config.DEDUP_DOUBLE_POST == 'skip':
+            raise DuplicateContent(message)
+        logger.warning(f"Task {task.id}: {message}")
+
+    if (config.DEDUP_REUSE_PROCESSED and other.encode_tier == task.encode_tier
+            and artifact_is_valid(other.processed_path, other.processed_checksum)):
+        processed_path = _task_artifact(other.processed_path, task)
+        registry.counter('dedup.processing_reused').inc()
+        logger.info(f"Task {task.id} reusing the processed video of task {other.id}: {processed_path}")
+        _set_stage(task, PROCESSED, processed_path=processed_path, processed_checksum=other.processed_checksum,
+                   upload_session=None, upload_offset=None)
+        return True
+    return False
+
+
+def _process(task):
+    from .video_processor import process_video
+
+    _set_stage(task, PROCESSING)
+    logger.info(f"Processing video for task {task.id}")
+    media_info = json.loads(task.media_info) if task.media_info else None
+    processed_video_path = process_video(task.video_path, tier=task.encode_tier, media_info=media_info)
+    if not processed_video_path:
+        raise Exception(f"Failed to process video for task {task.id}")
+
+    logger.info(f"Video processing completed for task {task.id}: {processed_video_path}")
+    # A new artifact invalidates any upload of the previous one
+    _set_stage(task, PROCESSED, processed_path=processed_video_path,
+               processed_checksum=file_checksum(processed_video_path), upload_session=None, upload_offset=None)
+
+
+def _upload(task, backends):
+    from .uploader import upload_with_retry
+
+    def record_progress(upload_session, upload_offset):
+        # Persist the acknowledged offset so a retry or another worker resumes the same upload
+        task.upload_session, task.upload_offset = upload_session, upload_offset
+        _update_task(task.id, upload_session=upload_session, upload_offset=upload_offset)
+
+    _set_stage(task, UPLOADING)
+    if task.upload_session:
+        logger.info(f"Uploading video for task {task.id}, resuming {task.upload_session} "
+                    f"at byte {task.upload_offset or 0}")
+    else:
+        logger.info(f"Uploading video for task {task.id}")
+    if not upload_with_retry(task.processed_path, DEFAULT_CAPTION, user_id=task.user_id,
+                             uploader=backends.uploader(), upload_session=task.upload_session,
+                             on_progress=record_progress):
+        raise Exception(f"Failed to upload video for task {task.id}")
+    logger.info(f"Upload completed for task {task.id}")
+
+
+def _start(task_id, resume):
+    """
+    Claim and load a task; returns (task, instagram_username, first stage) or
+    None. The task's heartbeat runs from here on and is the caller's to remove
+    only when a task was returned: a failed claim may be a duplicate of a run
+    this process owns.
+    """
+    if not _claim(task_id, resume):
+        # Workers racing for the same tasks say this a lot
+        logger.info(f"Task {task_id} is not claimable, skipping", extra={'rate_limit': True})
+        return None
+    heartbeat.add(task_id)
+
+    try:
+        task = _load_task(task_id)
+        if not task:
+            logger.error(f"Task {task_id} not found")
+            heartbeat.remove(task_id)
+            return None
+
+        # Get the user's Instagram credentials
+        instagram_username = _instagram_username(task.user_id)
+        if not instagram_username:
+            _fail(task, Exception("Instagram credentials not set"))
+            heartbeat.remove(task_id)
+            return None
+    except Exception:
+        heartbeat.remove(task_id)
+        raise
+
+    stage = _resume_stage(task)
+    if resume or stage != DOWNLOADING:
+        logger.info(f"Resuming task {task_id} at stage {stage} (last recorded stage: {task.stage})")
+    return task, instagram_username, stage
+
+
+def _hold(task, on_reschedule):
+    """
+    End a prefetch: hand the task back as pending with only the upload left, to
+    be run at its slot. Returns False if the slot has already come, in which
+    case the caller uploads right away.
+    """
+    if not task.scheduled_for or task.scheduled_for <= datetime.utcnow():
+        return False
+    _update_task(task.id, status='pending')
+    if on_reschedule:
+        on_reschedule(task.id, task.scheduled_for)
+    registry.counter('prefetch.held').inc()
+    logger.info(f"Task {task.id} prefetched, holding the processed video until {task.scheduled_for}")
+    return True
+
+
+def _release_prefetch(task, error, on_reschedule):
+    """
+    A prefetch failed ahead of the slot: hand the task back as pending at its
+    scheduled_for, so the error is retried by the run at the slot as it would
+    have been without prefetching. Returns False if the slot has already come,
+    in which case the failure is handled as usual.
+    """
+    if not task.scheduled_for or task.scheduled_for <= datetime.utcnow():
+        return False
+    logger.warning(f"Prefetch of task {task.id} failed, it will run at its slot {task.scheduled_for}: {str(error)}")
+    _update_task(task.id, status='pending', error_message=str(error))
+    if on_reschedule:
+        on_reschedule(task.id, task.scheduled_for)
+    registry.counter('prefetch.failed').inc()
+    return True
+
+
+def _finish(task, on_reschedule):
+    """Record a successful run: move a recurring task to its next occurrence, or complete it"""
+    now = datetime.utcnow()
+    if task.scheduled_for:
+        # How late the post went live, the number prefetching exists to keep low
+        registry.histogram('pipeline.publish_delay_seconds').observe((now - task.scheduled_for).total_seconds())
+    occurrence_count = (task.occurrence_count or 0) + 1
+    next_run = next_occurrence(task.scheduled_for, task.repeat_interval, now)
+    if next_run:
+        # Recurring task: only its next occurrence is materialized, and it
+        # keeps the checkpoints so the cached video is reused
+        _set_stage(task, QUEUED, status='pending', scheduled_for=next_run,
+                   completed_at=now, occurrence_count=occurrence_count, failure_count=0,
+                   upload_session=None, upload_offset=None)
+        if on_reschedule:
+            on_reschedule(task.id, next_run)
+        logger.info(f"Completed occurrence {occurrence_count} of task {task.id}, next run at {next_run}")
+    else:
+        _set_stage(task, DONE, status='completed', completed_at=now, occurrence_count=occurrence_count,
+                   upload_session=None, upload_offset=None)
+        logger.info(f"Successfully completed task {task.id}: status set to completed")
+
+
+def _fail(task, error, on_reschedule=None):
+    """
+    Record a failed run. A recurring task keeps its schedule: the error is
+    recorded and it moves on to its next occurrence, until RECURRING_MAX_FAILURES
+    occurrences in a row have failed.
+    """
+    logger.error(f"Error processing task {task.id}: {str(error)}")
+    try:
+        failure_count = (task.failure_count or 0) + 1
+        next_run = next_occurrence(task.scheduled_for, task.repeat_interval)
+        if next_run and not (config.RECURRING_MAX_FAILURES and failure_count >= config.RECURRING_MAX_FAILURES):
+            _set_stage(task, QUEUED, status='pending', scheduled_for=next_run, error_message=str(error),
+                       failure_count=failure_count, upload_session=None, upload_offset=None)
+            if on_reschedule:
+                on_reschedule(task.id, next_run)
+            logger.warning(f"Occurrence of recurring task {task.id} failed ({failure_count} in a row), "
+                           f"next run at {next_run}")
+            return
+        _set_stage(task, FAILED, status='failed', error_message=str(error), failure_count=failure_count)
+        if next_run:
+            logger.warning(f"Recurring task {task.id} failed {failure_count} occurrences in a row, "
+                           f"stopping its schedule")
+        logger.info(f"Task {task.id} failed: status set to failed")
+    except Exception as update_error:
+        logger.error(f"Error marking task {task.id} as failed: {str(update_error)}")
+
+
+def run_task(task_id, resume=False, on_reschedule=None, backends=None, prefetch=False):
+    """
+    Run a task through download -> process -> upload, starting from its last
+    durable checkpoint. Recurring tasks are moved to their next occurrence and
+    handed to `on_reschedule(task_id, next_run)`. With `prefetch` the task stops
+    before the upload and goes back to `on_reschedule(task_id, scheduled_for)`
+    unless its slot has already come (see bot.prefetch).
+    """
+    backends = backends or default_backends
+    task = None
+    try:
+        started = _start(task_id, resume)
+        if not started:
+            return
+        task, instagram_username, stage = started
+
+        if stage == DOWNLOADING:
+            with _timed('download'):
+                _download(task, instagram_username, backends)
+            stage = PROCESSING
+        if stage == PROCESSING:
+            with _timed('probe'):
+                _probe(task)
+            with _timed('fingerprint'):
+                reused = _dedupe(task, instagram_username)
+            if not reused:
+                with _timed('process'):
+                    _process(task)
+        if prefetch and _hold(task, on_reschedule):
+            return
+        with _timed('upload'):
+            _upload(task, backends)
+
+        _finish(task, on_reschedule)
+
+    except Exception as e:
+        if task:
+            if not (prefetch and _release_prefetch(task, e, on_reschedule)):
+                _fail(task, e, on_reschedule)
+        else:
+            logger.error(f"Error processing task {task_id}: {str(e)}")
+    finally:
+        if task is not None:
+            heartbeat.remove(task_id)
+
+
+def find_orphaned_tasks():
+    """Return ids of processing tasks whose worker stopped sending heartbeats"""
+    from app import session_scope
+    from models import ReelTask
+
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+    with session_scope() as session:
+        return [task_id for (task_id,) in session.query(ReelTask.id).filter(
+            ReelTask.status == 'processing',
+            or_(ReelTask.heartbeat_at.is_(None), ReelTask.heartbeat_at < cutoff)
+        ).all()]
+
+
+def recover_tasks(dispatch):
+    """Hand every orphaned task to `dispatch(task_id)` so it resumes from its checkpoint"""
+    try:
+        task_ids = find_orphaned_tasks()
+    except Exception as e:
+        logger.error(f"Error finding orphaned tasks: {str(e)}")
+        return
+
+    for task_id in task_ids:
+        logger.info(f"Recovering orphaned task {task_id}")
+        dispatch(task_id)
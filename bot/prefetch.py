@@ -0,0 +1,135 @@
+"""
+Look-ahead prefetch of scheduled tasks.
+
+A task used to start its whole download -> process -> upload chain only once
+scheduled_for had passed, so posts went live late and every render for a
+popular slot ran at the same moment. The planner instead starts the download
+and render of upcoming tasks ahead of their slot, on a small pool of its own.
+A prefetched task is handed back as pending with its processed video as a
+checkpoint (see pipeline._hold); when the slot arrives the scheduler runs it
+as usual and only the upload is left. A failed prefetch hands the task back
+the same way (see pipeline._release_prefetch) and is not tried again before
+the slot, whose run retries it.
+
+How far ahead a task starts is based on measured stage latencies: the p95 of
+download + probe + fingerprint + process, times a safety factor, and times the
+number of earlier tasks still waiting for the same prefetch pool, so a crowded
+slot starts correspondingly sooner. It is never less than PREFETCH_WINDOW nor more
+than PREFETCH_MAX_LEAD.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_STAGES = ('download', 'probe', 'fingerprint', 'process')
+
+
+def load_prefetch_candidates(until):
+    """(id, scheduled_for) of pending tasks due before `until` that still need their video processed"""
+    from app import session_scope
+    from models import ReelTask
+
+    with session_scope() as session:
+        return session.query(ReelTask.id, ReelTask.scheduled_for).filter(
+            ReelTask.status == 'pending',
+            ReelTask.scheduled_for > datetime.utcnow(),
+            ReelTask.scheduled_for <= until,
+            ReelTask.processed_checksum.is_(None),
+        ).order_by(ReelTask.scheduled_for).all()
+
+
+def estimated_prefetch_seconds():
+    """p95 seconds of the stages a prefetch runs, from this worker's pipeline metrics, or None"""
+    histograms = [registry.histogram(f'pipeline.{stage}_seconds') for stage in PREFETCH_STAGES]
+    if not any(histogram.count for histogram in histograms):
+        return None
+    return sum(histogram.percentile(95) for histogram in histograms)
+
+
+class PrefetchPlanner:
+    """
+    Periodically picks the upcoming tasks whose prefetch should start now and
+    hands them to `dispatch(task_id)`; the caller reports completion with done().
+    """
+
+    def __init__(self, dispatch, load_candidates=load_prefetch_candidates,
+                 concurrency=config.PREFETCH_CONCURRENCY, window=config.PREFETCH_WINDOW,
+                 max_lead=config.PREFETCH_MAX_LEAD, safety=config.PREFETCH_SAFETY,
+                 interval=config.WORKER_POLL_INTERVAL):
+        self._dispatch = dispatch
+        self._load_candidates = load_candidates
+        self.concurrency = concurrency
+        self.window = window
+        self.max_lead = max_lead
+        self.safety = safety
+        self.interval = interval
+        self._in_flight = set()
+        self._attempted = {}  # task_id -> slot it was prefetched for
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def lead_seconds(self, backlog=0):
+        """How long before its slot a task with `backlog` tasks queued ahead of it should start"""
+        estimate = estimated_prefetch_seconds()
+        if estimate is None:
+            return self.window
+        needed = estimate * self.safety * (backlog // max(self.concurrency, 1) + 1)
+        return min(max(self.window, needed), self.max_lead)
+
+    def done(self, task_id):
+        with self._lock:
+            self._in_flight.discard(task_id)
+        self._wakeup.set()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def plan(self, now=None):
+        """Dispatch the prefetches that are due; returns how many were started"""
+        now = now or datetime.utcnow()
+        candidates = self._load_candidates(now + timedelta(seconds=self.max_lead))
+        started = 0
+        with self._lock:
+            # One prefetch per slot: after a failure the task waits for its slot
+            self._attempted = {task_id: due for task_id, due in self._attempted.items() if due > now}
+            free = self.concurrency - len(self._in_flight)
+            waiting = [(task_id, due) for task_id, due in candidates
+                       if task_id not in self._in_flight and self._attempted.get(task_id) != due]
+        for backlog, (task_id, due) in enumerate(waiting):
+            if free <= 0:
+                break
+            lead = self.lead_seconds(backlog)
+            if now < due - timedelta(seconds=lead):
+                continue
+            with self._lock:
+                self._in_flight.add(task_id)
+                self._attempted[task_id] = due
+            logger.info(f"Prefetching task {task_id} {(due - now).total_seconds():.0f}s before its slot "
+                        f"(lead {lead:.0f}s)")
+            registry.counter('prefetch.started').inc()
+            registry.gauge('prefetch.lead_seconds').set(round(lead, 1))
+            try:
+                self._dispatch(task_id)
+            except Exception as e:
+                logger.error(f"Error dispatching prefetch of task {task_id}: {str(e)}")
+                self.done(task_id)
+                continue
+            free -= 1
+            started += 1
+        return started
+
+    def run(self, stop_event):
+        logger.info(f"Prefetch planner started: window {self.window}s, up to {self.concurrency} at a time")
+        while not stop_event.is_set():
+            try:
+                self.plan()
+            except Exception as e:
+                logger.error(f"Error planning prefetches: {str(e)}")
+            # A finished prefetch frees a slot, so plan again right away
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
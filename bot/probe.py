@@ -0,0 +1,295 @@
+"""
+Header-only probe of downloaded videos.
+
+read_mp4_info() walks the ISO base media (MP4/MOV) box tree and reads only the
+small metadata boxes: the moov box is loaded, media data (mdat) is seeked over.
+That gives duration, codecs, display size, frame rate, rotation and where the
+moov sits, in a few reads and no decoding. probe() falls back to ffprobe for
+other containers, and validate() rejects inputs Instagram won't accept before
+any expensive work is done. The result is stored on the task (media_info) and
+handed to the later stages instead of reopening the file.
+"""
+import math
+import os
+import struct
+
+from .encode_profiles import probe_video, MIN_DURATION
+
+# Sample entry fourcc -> codec name as ffprobe reports it
+VIDEO_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'vp09': 'vp9',
+    b'av01': 'av1', b'mp4v': 'mpeg4', b's263': 'h263', b'apcn': 'prores', b'apch': 'prores',
+}
+AUDIO_CODECS = {
+    b'mp4a': 'aac', b'Opus': 'opus', b'ac-3': 'ac3', b'ec-3': 'eac3', b'alac': 'alac',
+    b'.mp3': 'mp3', b'sowt': 'pcm_s16le', b'twos': 'pcm_s16be', b'fLaC': 'flac',
+}
+# MPEG-4 objectTypeIndication of an mp4a stream that is not AAC
+MP4A_OBJECT_TYPES = {0x69: 'mp3', 0x6B: 'mp3', 0xA5: 'ac3', 0xA6: 'eac3'}
+
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+class ProbeError(Exception):
+    pass
+
+
+class NotISOMedia(ProbeError):
+    """Not an MP4/MOV file at all (as opposed to a damaged one)"""
+
+
+class InvalidMedia(Exception):
+    """The input can't be turned into a reel; retrying won't help"""
+
+
+def _boxes(data, start=0, end=None):
+    """Yield (type, payload start, payload end) for the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                break
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            raise ProbeError(f"Box {box_type!r} at {position} overruns its parent")
+        yield box_type, position + header, position + size
+        position += size
+
+
+def _find(data, start, end, *path):
+    """Payload bounds of the first box along `path` below data[start:end], or None"""
+    for box_type, payload_start, payload_end in _boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload_start, payload_end
+            return _find(data, payload_start, payload_end, *path[1:])
+    return None
+
+
+def _media_header(data, start):
+    """(timescale, duration) of an mvhd/mdhd payload"""
+    if data[start] == 1:
+        return struct.unpack_from('>IQ', data, start + 20)
+    return struct.unpack_from('>II', data, start + 12)
+
+
+def _track_header(data, start):
+    """(rotation in degrees, width, height) of a tkhd payload"""
+    offset = start + (88 if data[start] == 1 else 76)
+    a, b = struct.unpack_from('>2i', data, offset - 36)
+    width, height = struct.unpack_from('>II', data, offset)
+    rotation = round(math.degrees(math.atan2(b / 65536, a / 65536))) % 360
+    return rotation, width >> 16, height >> 16
+
+
+def _descriptor(data, position):
+    """(tag, payload start) of an MPEG-4 descriptor with its variable-length size"""
+    tag = data[position]
+    position += 1
+    for _ in range(4):
+        byte = data[position]
+        position += 1
+        if not byte & 0x80:
+            break
+    return tag, position
+
+
+def _mp4a_codec(data, entry_start, entry_end):
+    """Refine an mp4a sample entry with the object type in its esds box"""
+    # Child boxes follow the sound description, which QuickTime versions 1 and 2 extend
+    version = struct.unpack_from('>H', data, entry_start + 8)[0]
+    esds = _find(data, entry_start + 28 + {1: 16, 2: 36}.get(version, 0), entry_end, b'esds')
+    if esds:
+        try:
+            tag, position = _descriptor(data, esds[0] + 4)
+            if tag == 0x03:
+                flags = data[position + 2]
+                position += 3
+                if flags & 0x80:
+                    position += 2
+                if flags & 0x40:
+                    position += data[position] + 1
+                if flags & 0x20:
+                    position += 2
+                tag, position = _descriptor(data, position)
+                if tag == 0x04:
+                    return MP4A_OBJECT_TYPES.get(data[position], 'aac')
+        except IndexError:
+            pass
+    return 'aac'
+
+
+def _sample_entry(data, stbl):
+    """(fourcc, entry start, entry end) of the first sample description"""
+    stsd = _find(data, stbl[0], stbl[1], b'stsd')
+    if not stsd:
+        return None
+    for box_type, start, end in _boxes(data, stsd[0] + 8, stsd[1]):
+        return box_type, start, end
+    return None
+
+
+def _sample_count(data, stbl):
+    stsz = _find(data, stbl[0], stbl[1], b'stsz')
+    if stsz:
+        return struct.unpack_from('>I', data, stsz[0] + 8)[0]
+    stz2 = _find(data, stbl[0], stbl[1], b'stz2')
+    if stz2:
+        return struct.unpack_from('>I', data, stz2[0] + 8)[0]
+    return 0
+
+
+def _parse_moov(data, info):
+    mvhd = _find(data, 0, len(data), b'mvhd')
+    if mvhd:
+        timescale, duration = _media_header(data, mvhd[0])
+        if timescale:
+            info['duration'] = duration / timescale
+    info['fragmented'] = _find(data, 0, len(data), b'mvex') is not None
+
+    for box_type, trak_start, trak_end in _boxes(data):
+        if box_type != b'trak':
+            continue
+        hdlr = _find(data, trak_start, trak_end, b'mdia', b'hdlr')
+        mdhd = _find(data, trak_start, trak_end, b'mdia', b'mdhd')
+        stbl = _find(data, trak_start, trak_end, b'mdia', b'minf', b'stbl')
+        if not hdlr or not mdhd or not stbl:
+            continue
+        handler = data[hdlr[0] + 8:hdlr[0] + 12]
+        entry = _sample_entry(data, stbl)
+        timescale, duration = _media_header(data, mdhd[0])
+        seconds = duration / timescale if timescale else 0.0
+
+        if handler == b'vide' and info['codec'] is None and entry:
+            fourcc, entry_start, entry_end = entry
+            coded_width, coded_height = struct.unpack_from('>HH', data, entry_start + 24)
+            tkhd = _find(data, trak_start, trak_end, b'tkhd')
+            rotation, width, height = _track_header(data, tkhd[0]) if tkhd else (0, coded_width, coded_height)
+            width, height = width or coded_width, height or coded_height
+            if rotation in (90, 270):
+                width, height = height, width
+            frame_count = _sample_count(data, stbl)
+            info.update({
+                'codec': VIDEO_CODECS.get(fourcc, fourcc.decode('latin-1').strip()),
+                'width': width,
+                'height': height,
+                'coded_width': coded_width,
+                'coded_height': coded_height,
+                'rotation': rotation,
+                'frame_count': frame_count,
+                'fps': round(frame_count / seconds, 3) if seconds and frame_count else 0.0,
+            })
+            if not info['duration']:
+                info['duration'] = seconds
+        elif handler == b'soun' and info['audio_codec'] is None and entry:
+            fourcc, entry_start, entry_end = entry
+            channels = struct.unpack_from('>H', data, entry_start + 16)[0]
+            sample_rate = struct.unpack_from('>I', data, entry_start + 24)[0] >> 16
+            codec = AUDIO_CODECS.get(fourcc, fourcc.decode('latin-1').strip())
+            if fourcc == b'mp4a':
+                codec = _mp4a_codec(data, entry_start, entry_end)
+            info.update({'audio_codec': codec, 'audio_channels': channels, 'audio_sample_rate': sample_rate})
+
+
+def read_mp4_info(path):
+    """
+    Container metadata of an MP4/MOV file from its headers, in the same shape as
+    encode_profiles.probe_video() plus rotation, frame_count and moov position.
+    Raises ProbeError for anything that isn't a readable ISO media file.
+    """
+    size = os.path.getsize(path)
+    info = {
+        'container': None, 'size': size, 'codec': None, 'audio_codec': None, 'width': 0, 'height': 0,
+        'fps': 0.0, 'duration': 0.0, 'bitrate': 0, 'rotation': 0, 'moov_offset': None, 'mdat_offset': None,
+        'faststart': False, 'truncated': False,
+    }
+    try:
+        with open(path, 'rb') as f:
+            _walk(f, size, info)
+    except (struct.error, IndexError) as e:
+        raise ProbeError(f"Corrupt MP4 headers: {str(e)}") from e
+
+    if info['moov_offset'] is None:
+        if info['truncated']:
+            raise ProbeError("File is truncated (incomplete download)")
+        raise ProbeError("No moov box: the file is incomplete or not a finished recording")
+    info['faststart'] = info['mdat_offset'] is None or info['moov_offset'] < info['mdat_offset']
+    if info['duration']:
+        info['bitrate'] = int(size * 8 / info['duration'] / 1000)
+    return info
+
+
+def _walk(f, size, info):
+    """Visit the top-level boxes: parse moov, note where mdat starts, seek over everything else"""
+    position = 0
+    while position + 8 <= size:
+        f.seek(position)
+        header = f.read(16)
+        box_size, box_type = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = size - position
+        if position == 0:
+            if box_type != b'ftyp':
+                raise NotISOMedia("Not an MP4/MOV file (no ftyp box)")
+            info['container'] = header[8:12].decode('latin-1').strip()
+        if box_size < header_size:
+            raise ProbeError(f"Corrupt box header at byte {position}")
+        if position + box_size > size:
+            # The box claims more bytes than the file has: an incomplete download
+            info['truncated'] = True
+
+        if box_type == b'moov' and info['moov_offset'] is None:
+            info['moov_offset'] = position
+            if info['truncated']:
+                return
+            if box_size > MAX_MOOV_SIZE:
+                raise ProbeError(f"moov box of {box_size} bytes is implausibly large")
+            f.seek(position + header_size)
+            _parse_moov(f.read(box_size - header_size), info)
+        elif box_type == b'mdat' and info['mdat_offset'] is None:
+            info['mdat_offset'] = position
+        position += box_size
+
+
+def probe(path):
+    """
+    Media info of a downloaded video: from its headers for MP4/MOV, from ffprobe
+    for other containers (None if ffprobe can't read it either). Raises
+    InvalidMedia for an MP4/MOV whose headers are damaged.
+    """
+    try:
+        info = read_mp4_info(path)
+        if info.get('fragmented') and not info['fps']:
+            # Fragmented MP4: the samples are described in moof boxes throughout the file
+            return probe_video(path) or info
+        return info
+    except NotISOMedia:
+        return probe_video(path)
+    except ProbeError as e:
+        raise InvalidMedia(str(e)) from e
+
+
+def validate(info):
+    """Raise InvalidMedia with the reason if the probed input can't become a reel"""
+    if not info:
+        raise InvalidMedia("Not a readable video file")
+    if info.get('truncated'):
+        raise InvalidMedia("Video file is truncated (incomplete download)")
+    if not info.get('codec') or not info.get('width') or not info.get('height'):
+        raise InvalidMedia("File has no video track")
+    if info.get('fragmented') and not info['duration']:
+        raise InvalidMedia("Fragmented MP4 that could not be probed")
+    if info['duration'] < MIN_DURATION:
+        raise InvalidMedia(f"Video is {info['duration']:.1f}s long, reels must be at least {MIN_DURATION}s")
+    if not info.get('fps'):
+        raise InvalidMedia("Video has no frames")
@@ -0,0 +1,40 @@
+"""
+Instagram post URL parsing.
+
+The same reel is shared under several URL forms: /reel/, /reels/ and /p/
+paths, the old /tv/ ones, a /<username>/ prefix, mobile and instagr.am hosts,
+tracking query strings and missing trailing slashes. parse_shortcode() pulls
+the shortcode out of any of them, and canonical_url() gives the one form
+tasks are stored under. /reels/ also prefixes pages that aren't posts
+(/reels/audio/<id>/), which are rejected.
+"""
+import re
+from urllib.parse import urlsplit
+
+HOSTS = {'instagram.com', 'www.instagram.com', 'm.instagram.com', 'instagr.am', 'www.instagr.am'}
+POST_PATHS = {'reel', 'reels', 'p', 'tv'}
+NON_POST_SEGMENTS = {'audio', 'tags', 'tagged', 'explore', 'saved', 'videos'}  # /reels/audio/<id>/ etc.
+SHORTCODE = re.compile(r'^[A-Za-z0-9_-]{5,64}$')
+
+
+class InvalidReelURL(ValueError):
+    pass
+
+
+def parse_shortcode(url):
+    """Shortcode of an Instagram post URL; raises InvalidReelURL if there is none"""
+    url = (url or '').strip()
+    parsed = urlsplit(url if '://' in url else f'https://{url}')
+    if (parsed.hostname or '').lower() not in HOSTS:
+        raise InvalidReelURL(f"Not an Instagram URL: {url}")
+    parts = [part for part in parsed.path.split('/') if part]
+    for kind, shortcode in zip(parts, parts[1:]):
+        if kind.lower() in POST_PATHS and SHORTCODE.match(shortcode) \
+                and shortcode.lower() not in NON_POST_SEGMENTS:
+            return shortcode
+    raise InvalidReelURL(f"No reel shortcode in URL: {url}")
+
+
+def canonical_url(url):
+    """https://www.instagram.com/reel/<shortcode>/ for any accepted form of a post URL"""
+    return f"https://www.instagram.com/reel/{parse_shortcode(url)}/"
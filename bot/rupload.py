@@ -0,0 +1,149 @@
+"""
+Resumable, chunked video upload over Instagram's rupload endpoint.
+
+The upload is addressed by an entity name ("<upload_id>_0_<random>"). A GET on
+it returns the number of bytes the server has acknowledged; each POST sends the
+next chunk with an Offset header. After a dropped connection the upload picks
+up from the acknowledged offset instead of byte zero, and the entity name is
+persisted by the caller so that a retry (or another worker) resumes the same
+upload. Chunks are sent straight from a read-only mapping of the file.
+"""
+import json
+import logging
+import random
+import time
+import uuid
+
+import config
+from metrics import registry
+from .artifacts import mapped, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class _ViewReader:
+    """File-like wrapper so the HTTP client streams a memoryview chunk without copying it whole"""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view) - self._position
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        data = self._view[self._position:end].tobytes()
+        self._position = end
+        return data
+
+    def close(self):
+        # The HTTP client may keep the request body around; drop the mapped slice
+        self._view = memoryview(b'')
+        self._position = 0
+
+
+def new_upload_name():
+    upload_id = str(int(time.time() * 1000))
+    return f"{upload_id}_0_{random.randint(1000000000, 9999999999)}"
+
+
+def upload_id_of(upload_name):
+    return upload_name.split('_', 1)[0]
+
+
+def waterfall_id_of(upload_name):
+    # instagrapi sends a random one per upload; derived from the name it stays the same across resumes
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, upload_name))
+
+
+class ChunkedUpload:
+    """
+    Send a file to `{base_url}/{upload_name}` in chunks. `http` is a
+    requests.Session-like object (instagrapi's Client.private in production).
+    `on_progress(upload_name, offset)` is called after every acknowledged chunk.
+    `media` is the video's (width, height, duration in seconds), sent in the
+    rupload params like instagrapi's clip upload does.
+    """
+
+    def __init__(self, http, base_url=config.UPLOAD_RUPLOAD_URL, chunk_size=config.UPLOAD_CHUNK_SIZE,
+                 headers=None, on_progress=None, media=None):
+        self.http = http
+        self.base_url = base_url.rstrip('/')
+        self.chunk_size = chunk_size
+        self.headers = headers or {}
+        self.on_progress = on_progress
+        self.media = media
+
+    def _headers(self, upload_name, length):
+        rupload_params = {
+            'retry_context': json.dumps({'num_step_auto_retry': 0, 'num_reupload': 0, 'num_step_manual_retry': 0}),
+            'media_type': '2',
+            'xsharing_user_ids': '[]',
+            'upload_id': upload_id_of(upload_name),
+            'is_clips_video': '1',
+        }
+        if self.media:
+            width, height, duration = self.media
+            rupload_params.update({
+                'upload_media_width': str(width),
+                'upload_media_height': str(height),
+                'upload_media_duration_ms': str(int(duration * 1000)),
+            })
+        return {
+            **self.headers,
+            'X-Instagram-Rupload-Params': json.dumps(rupload_params),
+            'X_FB_VIDEO_WATERFALL_ID': waterfall_id_of(upload_name),
+            'X-Entity-Type': 'video/mp4',
+            'X-Entity-Name': upload_name,
+            'X-Entity-Length': str(length),
+        }
+
+    def acknowledged_offset(self, upload_name, length):
+        """Ask the server how many bytes of this upload it already has"""
+        response = self.http.get(f"{self.base_url}/{upload_name}", headers=self._headers(upload_name, length))
+        if response.status_code == 404:
+            return 0
+        response.raise_for_status()
+        return int(response.json().get('offset', 0))
+
+    def send(self, path, upload_name=None):
+        """Upload `path`, resuming `upload_name` when given; returns the upload name"""
+        upload_name = upload_name or new_upload_name()
+        throughput = registry.histogram('upload.chunk_mbps')
+        sent_bytes = registry.counter('upload.bytes_sent')
+
+        with mapped(path) as view:
+            length = len(view)
+            offset = self.acknowledged_offset(upload_name, length)
+            if offset:
+                logger.info(f"Resuming upload {upload_name} at byte {offset} of {length}")
+                registry.counter('upload.resumed').inc()
+
+            for start, chunk in iter_chunks(view, self.chunk_size, offset):
+                size = len(chunk)
+                headers = self._headers(upload_name, length)
+                headers.update({
+                    'Offset': str(start),
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Length': str(size),
+                })
+                body = _ViewReader(chunk)
+                chunk_start = time.perf_counter()
+                try:
+                    response = self.http.post(f"{self.base_url}/{upload_name}", data=body, headers=headers)
+                    response.raise_for_status()
+                finally:
+                    # Slices must be released before the mapping can close
+                    body.close()
+                    chunk.release()
+                elapsed = time.perf_counter() - chunk_start
+
+                offset = start + size
+                sent_bytes.inc(size)
+                throughput.observe(size * 8 / 1e6 / max(elapsed, 1e-6))
+                logger.debug(f"Upload {upload_name}: {offset}/{length} bytes acknowledged")
+                if self.on_progress:
+                    self.on_progress(upload_name, offset)
+
+        return upload_name
@@ -0,0 +1,71 @@
+"""
+Per-frame scaling for the renderer.
+
+FrameScaler resizes into one reused destination buffer and picks the kernel by
+direction: INTER_AREA when shrinking (it averages source pixels, so no separate
+blur pass is needed) and INTER_LINEAR otherwise. Frames already at the target
+size pass through untouched.
+
+DuplicateFrameSkipper wraps a whole per-frame stage: when the decoder hands over
+the same frame again (MoviePy repeats frames whenever the output rate is above
+the source's), the previous output is returned instead of being recomputed.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FrameScaler:
+    def __init__(self, size, pool=None):
+        self.size = tuple(size)  # (width, height)
+        self.pool = pool  # a bot.frame_pool.FramePool; without one a single buffer is reused
+        self._dst = None
+
+    def is_noop(self, source_size):
+        return tuple(source_size) == self.size
+
+    def __call__(self, frame):
+        import cv2
+        import numpy as np
+
+        height, width = frame.shape[:2]
+        if (width, height) == self.size:
+            return frame
+
+        shape = (self.size[1], self.size[0]) + frame.shape[2:]
+        if self.pool is not None:
+            dst = self.pool.get(shape, frame.dtype, role='scaled')
+        else:
+            if self._dst is None or self._dst.shape != shape or self._dst.dtype != frame.dtype:
+                self._dst = np.empty(shape, dtype=frame.dtype)
+            dst = self._dst
+        shrinking = width * height > self.size[0] * self.size[1]
+        cv2.resize(frame, self.size, dst=dst, interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+        return dst
+
+
+class DuplicateFrameSkipper:
+    """
+    Call `stage(frame)` only for frames that differ from the previous one. The
+    returned array is reused for duplicates, so callers must consume it before
+    asking for the next frame (the encoder writes each frame out immediately).
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.skipped = 0
+        self._last_input = None
+        self._last_output = None
+
+    def __call__(self, frame):
+        import numpy as np
+
+        last = self._last_input
+        if last is not None and (frame is last or (frame.shape == last.shape and np.array_equal(frame, last))):
+            self.skipped += 1
+            return self._last_output
+
+        # Decoded frames are read-only; anything else is copied since stages may work in place
+        self._last_input = frame if not frame.flags.writeable else frame.copy()
+        self._last_output = self.stage(frame)
+        return self._last_output
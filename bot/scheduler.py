@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def next_occurrence(scheduled_for, repeat_interval, now=None):
+    """
+    Compute the next run of a recurring task, or None if it does not repeat.
+
+    Occurrences stay anchored on the original schedule (scheduled_for + k * interval)
+    so they don't drift by the processing time, and slots missed while the bot was
+    down are skipped rather than replayed back to back.
+    """
+    if not repeat_interval:
+        return None
+
+    now = now or datetime.utcnow()
+    interval = timedelta(minutes=repeat_interval)
+    anchor = scheduled_for or now
+
+    if anchor > now:
+        return anchor + interval
+
+    missed = (now - anchor) // interval
+    return anchor + (missed + 1) * interval
+
+
+class TaskScheduler:
+    """
+    In-memory timer queue of the next due run of each task.
+
+    Only one entry per task is kept: a recurring task is re-queued with its next
+    occurrence when the current one finishes. The run loop sleeps until the
+    earliest entry is due, so idle or far-future tasks cost nothing per tick.
+    `load_due(until)` is called every `resync_interval` seconds to pick up tasks
+    created by other processes; it should return (task_id, due) pairs for pending
+    tasks due before `until`. A dispatched task stays pending until a worker
+    thread claims it, so the resync skips it until done(task_id) is called (or
+    the task is scheduled again).
+    """
+
+    def __init__(self, dispatch, load_due=None, resync_interval=60):
+        self._dispatch = dispatch
+        self._load_due = load_due
+        self._resync_interval = resync_interval
+        self._heap = []
+        self._queued = {}  # task_id -> due time of its live heap entry
+        self._dispatched = set()  # handed to the executor and not finished yet
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._next_resync = 0
+
+    def schedule(self, task_id, due):
+        """Queue (or re-queue) a task to run at `due` (naive UTC)"""
+        with self._condition:
+            self._dispatched.discard(task_id)
+            self._queued[task_id] = due
+            heapq.heappush(self._heap, (due, next(self._counter), task_id))
+            self._condition.notify()
+
+    def cancel(self, task_id):
+        """Drop a task from the queue; its stale heap entry is discarded lazily"""
+        with self._condition:
+            self._queued.pop(task_id, None)
+
+    def done(self, task_id):
+        """A dispatched task finished running; let the resync pick it up again if it is still pending"""
+        with self._condition:
+            self._dispatched.discard(task_id)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queued)
+
+    def _resync(self):
+        horizon = datetime.utcnow() + timedelta(seconds=self._resync_interval * 2)
+        try:
+            due_tasks = self._load_due(horizon)
+        except Exception as e:
+            logger.error(f"Error loading scheduled tasks: {str(e)}")
+            return
+
+        with self._condition:
+            for task_id, due in due_tasks:
+                if task_id not in self._dispatched and self._queued.get(task_id) != due:
+                    self._queued[task_id] = due
+                    heapq.heappush(self._heap, (due, next(self._counter), task_id))
+
+    def _pop_due(self):
+        """Pop every task that is due now; returns (due_task_ids, seconds until the next one)"""
+        now = datetime.utcnow()
+        due = []
+        while self._heap:
+            when, _, task_id = self._heap[0]
+            if self._queued.get(task_id) != when:
+                heapq.heappop(self._heap)  # cancelled or rescheduled
+                continue
+            if when > now:
+                return due, (when - now).total_seconds()
+            heapq.heappop(self._heap)
+            del self._queued[task_id]
+            self._dispatched.add(task_id)
+            due.append(task_id)
+        return due, None
+
+    def run(self, stop_event=None):
+        """Dispatch tasks as they become due until `stop_event` is set"""
+        logger.info("Starting scheduled task checker", extra={'rate_limit': True})
+
+        while not (stop_event and stop_event.is_set()):
+            if self._load_due and time.monotonic() >= self._next_resync:
+                self._resync()
+                self._next_resync = time.monotonic() + self._resync_interval
+
+            with self._condition:
+                due, wait = self._pop_due()
+                if not due:
+                    timeout = self._resync_interval
+                    if self._load_due:
+                        timeout = min(timeout, self._next_resync - time.monotonic())
+                    if wait is not None:
+                        timeout = min(timeout, wait)
+                    self._condition.wait(timeout=max(timeout, 0))
+                    continue
+
+            for task_id in due:
+                logger.info(f"Found scheduled task {task_id} ready for processing")
+                try:
+                    self._dispatch(task_id)
+                except Exception as e:
+                    logger.error(f"Error dispatching task {task_id}: {str(e)}")
+                    self.done(task_id)
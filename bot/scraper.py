@@ -1,58 +1,79 @@
 
 import os
 import logging
+import shutil
+import tempfile
 import instaloader
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
+from .reel_urls import parse_shortcode
 
 logger = logging.getLogger(__name__)
 
 class InstagramReelDownloader:
-    def __init__(self):
-        self.loader = instaloader.Instaloader(
+    def __init__(self, loader=None):
+        # `loader` lets benchmarks substitute a local stand-in for instaloader
+        self.loader = loader or instaloader.Instaloader(
             download_videos=True, 
             download_comments=False, 
             save_metadata=False, 
-            dirname_pattern="downloads"
+            # Each download gets a directory of its own (see download_reel) and a known file name
+            dirname_pattern="{target}",
+            filename_pattern="{shortcode}"
         )
+
+    def _get_post(self, shortcode):
+        return instaloader.Post.from_shortcode(self.loader.context, shortcode)
     
-    def download_reel(self, reel_url, username=None, password=None):
+    def _login(self, username, password):
+        if username and password:
+            try:
+                logger.info(f"Logging in as {username}")
+                self.loader.login(username, password)
+            except Exception as e:
+                logger.error(f"Login failed: {str(e)}")
+                # Continue without login
+
+    def _video_url(self, shortcode):
+        return self._get_post(shortcode).video_url
+
+    def resolve(self, reel_url, username=None, password=None):
+        """
+        Look up a reel without downloading it; returns (shortcode, video URL).
+        Lets an async client fetch the video itself (see bot/aio.py).
+        """
+        self._login(username, password)
+        shortcode = parse_shortcode(reel_url)
+        return shortcode, self._video_url(shortcode)
+
+    def download_reel(self, reel_url, username=None, password=None, destination=None):
+        """Download a reel to `destination` (default downloads/<shortcode>.mp4); returns the path, or None"""
         try:
             logger.info(f"Downloading reel from URL: {reel_url}")
             
             # Login if credentials provided
-            if username and password:
-                try:
-                    logger.info(f"Logging in as {username}")
-                    self.loader.login(username, password)
-                except Exception as e:
-                    logger.error(f"Login failed: {str(e)}")
-                    # Continue without login
+            self._login(username, password)
 
             # Extract shortcode from URL
-            shortcode = reel_url.split('/')[-2]
-            post = instaloader.Post.from_shortcode(self.loader.context, shortcode)
-            self.loader.download_post(post, target="downloads")
-            logger.info(f"Downloaded reel with shortcode: {shortcode}")
-
-            # Verify the actual saved file name
-            download_dir = "downloads"
-            actual_files = [f for f in os.listdir(download_dir) if f.endswith('.mp4')]
-            if actual_files:
-                actual_file_path = max([os.path.join(download_dir, f) for f in actual_files], key=os.path.getctime)
-                logger.info(f"Actual downloaded file path: {actual_file_path}")
-                return actual_file_path
-            else:
-                logger.error("No .mp4 files found in the downloads directory after download")
-                return None
+            shortcode = parse_shortcode(reel_url)
+            destination = destination or os.path.join("downloads", f"{shortcode}.mp4")
+            download_dir = os.path.dirname(destination) or "."
+            os.makedirs(download_dir, exist_ok=True)
+            post = self._get_post(shortcode)
+
+            # A fresh directory per download: concurrent downloads can't pick up each other's files,
+            # and instaloader never skips the post because an earlier copy of it is lying around
+            target = tempfile.mkdtemp(prefix=f".{shortcode}_", dir=download_dir)
+            try:
+                self.loader.download_post(post, target=target)
+                downloaded = os.path.join(target, f"{shortcode}.mp4")
+                if not os.path.exists(downloaded):
+                    logger.error(f"No video was saved for reel {shortcode}")
+                    return None
+                os.replace(downloaded, destination)
+            finally:
+                shutil.rmtree(target, ignore_errors=True)
+            logger.info(f"Downloaded reel with shortcode {shortcode} to {destination}")
+            return destination
                 
         except Exception as e:
             logger.error(f"Failed to download reel: {str(e)}")
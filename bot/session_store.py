@@ -0,0 +1,132 @@
+"""
+Shared storage for logged-in Instagram sessions.
+
+Every worker, container or serverless instance loads the account's instagrapi
+settings from the same store, so one successful login is reused everywhere.
+Each entry carries a version: save() only succeeds if the entry is still at the
+version the caller loaded (optimistic concurrency), so when several nodes
+refresh a session at once exactly one write wins and the others reload it
+instead of logging in again.
+"""
+import abc
+import errno
+import fcntl
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(abc.ABC):
+    @abc.abstractmethod
+    def load(self, username):
+        """Return (settings, version) for the account, or (None, None)"""
+
+    @abc.abstractmethod
+    def save(self, username, settings, expected_version):
+        """
+        Write the settings if the stored version is still `expected_version`
+        (None: no entry yet). Returns the new version, or None on a conflict.
+        """
+
+
+class DatabaseSessionStore(SessionStore):
+    """Sessions in the InstagramSession table, shared by every node using the database"""
+
+    def load(self, username):
+        from app import session_scope
+        from models import InstagramSession
+
+        with session_scope() as session:
+            row = session.query(InstagramSession.settings, InstagramSession.version).filter_by(
+                username=username).first()
+        if row is None:
+            return None, None
+        return json.loads(row.settings), row.version
+
+    def save(self, username, settings, expected_version):
+        from sqlalchemy.exc import IntegrityError
+        from app import session_scope
+        from models import InstagramSession
+
+        data = json.dumps(settings)
+        now = datetime.utcnow()
+        try:
+            with session_scope() as session:
+                if expected_version is None:
+                    session.add(InstagramSession(username=username, settings=data, version=1, updated_at=now))
+                    return 1
+                # Conditional UPDATE: matches nothing if a peer wrote in the meantime
+                updated = session.query(InstagramSession).filter_by(
+                    username=username, version=expected_version
+                ).update({'settings': data, 'version': expected_version + 1, 'updated_at': now},
+                         synchronize_session=False)
+                return expected_version + 1 if updated else None
+        except IntegrityError:
+            # Another node created the entry first
+            return None
+
+
+class FileSessionStore(SessionStore):
+    """
+    Sessions as JSON files in a directory, for single-host setups or a shared
+    volume. save() holds an exclusive flock on a sidecar lock file while it
+    checks the version and replaces the file, so concurrent writers can't both
+    pass the check. Filesystems without working locks make save() fail; use
+    SESSION_STORE=database there.
+    """
+
+    def __init__(self, directory=config.SESSION_DIR):
+        self.directory = directory
+
+    def _path(self, username):
+        return os.path.join(self.directory, f"session_{username}.json")
+
+    def load(self, username):
+        try:
+            with open(self._path(username)) as f:
+                entry = json.load(f)
+            return entry['settings'], entry['version']
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable session file for {username}: {str(e)}")
+            return None, None
+
+    def save(self, username, settings, expected_version):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(username)
+        with open(f"{path}.lock", 'a') as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            except OSError as e:
+                if e.errno in (errno.ENOLCK, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise RuntimeError(f"{self.directory} does not support file locks, "
+                                       f"use SESSION_STORE=database: {str(e)}") from e
+                raise
+            try:
+                _, current_version = self.load(username)
+                if current_version != expected_version:
+                    return None
+                version = (expected_version or 0) + 1
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({'settings': settings, 'version': version}, f)
+                os.replace(tmp_path, path)
+                return version
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def get_session_store(kind=None):
+    kind = kind or config.SESSION_STORE
+    if kind == 'file':
+        return FileSessionStore()
+    if kind == 'database':
+        return DatabaseSessionStore()
+    raise ValueError(f"Unknown session store: {kind}")
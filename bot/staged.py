@@ -0,0 +1,316 @@
+"""
+Stage-pipelined task execution (WORKER_ENGINE=staged).
+
+Instead of one thread carrying a task through download, render and upload in
+turn, each stage has its own pool and tasks flow between them through bounded
+queues: while one task encodes, the next one downloads and the previous one
+uploads, so neither the CPU nor the network sits idle waiting for the other.
+
+- download: I/O pool (STAGE_DOWNLOAD_WORKERS); also claims and loads the task
+- render: probe, fingerprint and process, sized to the physical cores
+  (STAGE_RENDER_WORKERS)
+- upload: STAGE_UPLOAD_WORKERS threads, at most STAGE_UPLOADS_PER_ACCOUNT
+  uploads per Instagram account at a time
+
+A full render or upload queue blocks the stage feeding it (backpressure), so a
+fast downloader can't pile up more videos than the renderers can take. Each
+stage reports its utilization (share of worker time spent in the stage's
+work), queue depth, queue wait and time blocked on the next stage, and pools
+can be resized while running.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import config
+from metrics import registry
+from . import pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def physical_cores():
+    """Physical cores this process may run on (hyperthreads don't add encode throughput)"""
+    try:
+        cpus = os.sched_getaffinity(0)
+    except AttributeError:
+        cpus = range(os.cpu_count() or 1)
+    cores = set()
+    for cpu in cpus:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as f:
+                package = f.read().strip()
+            with open(f"{topology}/core_id") as f:
+                cores.add((package, f.read().strip()))
+        except OSError:
+            cores.add(cpu)
+    return max(1, len(cores))
+
+
+class Stage:
+    """
+    A pool of threads running `handler(job)` over a bounded queue. The handler
+    returns the next Stage for the job, or None when the job is finished.
+    With `key`, at most `per_key_limit` jobs with the same key run at once;
+    other jobs overtake the ones that have to wait.
+    """
+
+    def __init__(self, name, handler, workers, capacity=0, key=None, per_key_limit=None, on_done=None):
+        self.name = name
+        self.handler = handler
+        self.capacity = capacity
+        self.key = key
+        self.per_key_limit = per_key_limit
+        self.on_done = on_done
+        self.workers = workers
+        self._items = deque()
+        self._active_keys = Counter()
+        self._condition = threading.Condition()
+        self._threads = set()
+        self._busy_since = {}  # thread -> start of the job it is running
+        self._busy_seconds = 0.0
+        self._sampled_at = time.monotonic()
+        self._sampled_busy = 0.0
+        self._closed = False
+        self._queue_wait = registry.histogram(f'stage.{name}.queue_wait_seconds')
+        self._blocked = registry.histogram(f'stage.{name}.blocked_seconds')
+
+    def put(self, job):
+        """Queue a job, waiting while the queue is full"""
+        with self._condition:
+            while self.capacity and len(self._items) >= self.capacity:
+                self._condition.wait()
+            job.enqueued_at = time.monotonic()
+            self._items.append(job)
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    def _take(self):
+        for index, job in enumerate(self._items):
+            if self.key is None or self._active_keys[self.key(job)] < self.per_key_limit:
+                del self._items[index]
+                return job
+        return None
+
+    def _next_job(self):
+        """Wait for a runnable job; None when this thread should exit"""
+        current = threading.current_thread()
+        with self._condition:
+            while True:
+                if len(self._threads) > self.workers:
+                    # Pool was shrunk: retire this thread
+                    self._threads.discard(current)
+                    return None
+                job = self._take()
+                if job is not None:
+                    if self.key is not None:
+                        self._active_keys[self.key(job)] += 1
+                    self._busy_since[current] = time.monotonic()
+                    self._condition.notify_all()  # room in the queue for producers
+                    return job
+                if self._closed and not self._items:
+                    self._threads.discard(current)
+                    return None
+                self._condition.wait()
+
+    def _run(self):
+        current = threading.current_thread()
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._queue_wait.observe(self._busy_since[current] - job.enqueued_at)
+            next_stage, error = None, None
+            try:
+                next_stage = self.handler(job)
+            except Exception as e:
+                error = e
+            with self._condition:
+                self._busy_seconds += time.monotonic() - self._busy_since.pop(current)
+                if self.key is not None:
+                    self._active_keys[self.key(job)] -= 1
+                self._condition.notify_all()
+
+            if next_stage is not None:
+                blocked_from = time.monotonic()
+                next_stage.put(job)
+                self._blocked.observe(time.monotonic() - blocked_from)
+            elif self.on_done:
+                self.on_done(job, error)
+
+    def _spawn(self):
+        thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._threads.add(thread)
+        thread.start()
+
+    def resize(self, workers):
+        """Grow or shrink the pool; surplus threads exit after their current job"""
+        workers = max(1, int(workers))
+        with self._condition:
+            self.workers = workers
+            while len(self._threads) < workers and not self._closed:
+                self._spawn()
+            self._condition.notify_all()
+        registry.gauge(f'stage.{self.name}.workers').set(workers)
+
+    def start(self):
+        self.resize(self.workers)
+
+    def close(self):
+        """Let the threads exit once the queue is empty, and wait for them"""
+        with self._condition:
+            self._closed = True
+            threads = list(self._threads)
+            self._condition.notify_all()
+        for thread in threads:
+            thread.join()
+
+    def busy_seconds(self):
+        """Thread-seconds spent running jobs so far, including the jobs running now"""
+        with self._condition:
+            return self._busy_seconds + sum(time.monotonic() - start for start in self._busy_since.values())
+
+    def stats(self):
+        """Utilization since the previous call, plus current queue and pool state"""
+        busy = self.busy_seconds()
+        with self._condition:
+            now = time.monotonic()
+            elapsed = now - self._sampled_at
+            utilization = (busy - self._sampled_busy) / (elapsed * self.workers) if elapsed > 0 else 0.0
+            self._sampled_at, self._sampled_busy = now, busy
+            return {
+                'workers': self.workers,
+                'busy': len(self._busy_since),
+                'queued': len(self._items),
+                'utilization': min(1.0, utilization),
+            }
+
+
+class StagedExecutor:
+    """Runs tasks through the download, render and upload stages; see the module docstring"""
+
+    def __init__(self, backends=None, on_reschedule=None, download_workers=config.STAGE_DOWNLOAD_WORKERS,
+                 render_workers=config.STAGE_RENDER_WORKERS, upload_workers=config.STAGE_UPLOAD_WORKERS,
+                 uploads_per_account=config.STAGE_UPLOADS_PER_ACCOUNT, queue_size=config.STAGE_QUEUE_SIZE,
+                 report_interval=config.STAGE_REPORT_INTERVAL):
+        self.backends = backends or pipeline.default_backends
+        self.on_reschedule = on_reschedule
+        self.report_interval = report_interval
+        render_workers = render_workers or physical_cores()
+        # The scheduler hands tasks to the download stage, so its intake is never blocked
+        self.download = Stage('download', self._download, download_workers, on_done=self._done)
+        self.render = Stage('render', self._render, render_workers,
+                            capacity=queue_size or 2 * render_workers, on_done=self._done)
+        self.upload = Stage('upload', self._upload, upload_workers, capacity=queue_size or 2 * upload_workers,
+                            key=lambda job: job.instagram_username, per_key_limit=uploads_per_account,
+                            on_done=self._done)
+        self.stages = {stage.name: stage for stage in (self.download, self.render, self.upload)}
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._stop = threading.Event()
+        self._reporter = None
+
+    def start(self):
+        for stage in self.stages.values():
+            stage.start()
+        self._reporter = threading.Thread(target=self._report_loop, name="stage-report", daemon=True)
+        self._reporter.start()
+        logger.info("Staged executor started: " + ", ".join(
+            f"{stage.name} x{stage.workers}" for stage in self.stages.values())
+            + f" ({self.upload.per_key_limit} upload(s) per account)")
+        return self
+
+    def submit(self, task_id, resume=False, prefetch=False, on_done=None):
+        """Queue a task; `on_done(task_id)` is called when it leaves the pipeline"""
+        with self._idle:
+            self._in_flight += 1
+        self.download.put(SimpleNamespace(task_id=task_id, resume=resume, prefetch=prefetch, on_done=on_done,
+                                          task=None, instagram_username=None, enqueued_at=None))
+
+    def resize(self, stage_name, workers):
+        self.stages[stage_name].resize(workers)
+        logger.info(f"Stage {stage_name} resized to {self.stages[stage_name].workers} workers")
+
+    def _download(self, job):
+        started = pipeline._start(job.task_id, job.resume)
+        if not started:
+            return None
+        job.task, job.instagram_username, stage = started
+        if stage == pipeline.DOWNLOADING:
+            with pipeline._timed('download'):
+                pipeline._download(job.task, job.instagram_username, self.backends)
+            return self.render
+        return self.render if stage == pipeline.PROCESSING else self._before_upload(job)
+
+    def _render(self, job):
+        with pipeline._timed('probe'):
+            pipeline._probe(job.task)
+        with pipeline._timed('fingerprint'):
+            reused = pipeline._dedupe(job.task, job.instagram_username)
+        if not reused:
+            with pipeline._timed('process'):
+                pipeline._process(job.task)
+        return self._before_upload(job)
+
+    def _before_upload(self, job):
+        if job.prefetch and pipeline._hold(job.task, self.on_reschedule):
+            return None
+        return self.upload
+
+    def _upload(self, job):
+        with pipeline._timed('upload'):
+            pipeline._upload(job.task, self.backends)
+        pipeline._finish(job.task, self.on_reschedule)
+        return None
+
+    def _done(self, job, error):
+        try:
+            if error is not None:
+                if job.task:
+                    if not (job.prefetch and pipeline._release_prefetch(job.task, error, self.on_reschedule)):
+                        pipeline._fail(job.task, error, self.on_reschedule)
+                else:
+                    logger.error(f"Error processing task {job.task_id}: {str(error)}")
+        finally:
+            if job.task is not None:
+                pipeline.heartbeat.remove(job.task_id)
+            if job.on_done:
+                job.on_done(job.task_id)
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def report(self):
+        """Publish per-stage utilization and queue depth as metrics and a log line"""
+        stats = self.stats()
+        for name, values in stats.items():
+            registry.gauge(f'stage.{name}.utilization').set(round(values['utilization'], 3))
+            registry.gauge(f'stage.{name}.queue_depth').set(values['queued'])
+        logger.info("Stage utilization: " + ", ".join(
+            f"{name} {values['utilization']:.0%} of {values['workers']} ({values['queued']} queued)"
+            for name, values in stats.items()))
+        return stats
+
+    def _report_loop(self):
+        while not self._stop.wait(self.report_interval):
+            self.report()
+
+    def shutdown(self):
+        """Finish every queued task, then stop the pools"""
+        with self._idle:
+            while self._in_flight:
+                self._idle.wait()
+        self._stop.set()
+        for stage in self.stages.values():
+            stage.close()
+        self.report()
@@ -8,15 +8,10 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
+from logging_setup import configure_logging
+
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('function_test.log'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging(log_file='function_test.log')
 logger = logging.getLogger(__name__)
 
 # Import our bot modules
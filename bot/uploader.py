@@ -3,51 +3,113 @@ import os
 import time
 import logging
 import pickle
+import subprocess
 from instagrapi import Client
 from datetime import datetime
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
+import config
+from .rupload import ChunkedUpload, upload_id_of
+from .session_store import get_session_store
 
 logger = logging.getLogger(__name__)
 
+# Configuring a clip fails until Instagram has transcoded the uploaded video
+CONFIGURE_ATTEMPTS = 20
+CONFIGURE_RETRY_DELAY = 3
+
+# The parts of instagrapi's settings that make up the login; other fields (rur
+# cookies, timestamps) change on most requests and aren't worth a write
+SESSION_AUTH_SETTINGS = ('authorization_data',)
+SESSION_AUTH_COOKIES = ('sessionid', 'ds_user_id', 'csrftoken')
+
+CLIP_EXTRA_DATA = {
+    "like_and_view_counts_disabled": False,
+    "disable_comments": False,
+}
+
+def _session_auth(settings):
+    cookies = settings.get('cookies') or {}
+    return ([settings.get(name) for name in SESSION_AUTH_SETTINGS],
+            [cookies.get(name) for name in SESSION_AUTH_COOKIES])
+
 class InstagramUploader:
-    def __init__(self):
-        self.client = Client()
+    def __init__(self, client=None, chunked=config.UPLOAD_CHUNKED, rupload_url=config.UPLOAD_RUPLOAD_URL,
+                 session_store=None):
+        # `client` lets benchmarks substitute a fake for instagrapi.Client
+        self.client = client or Client()
+        self.session_store = session_store or get_session_store()
+        self.chunked = chunked
+        self.rupload_url = rupload_url
         # Set sensible timeouts and user agent
         self.client.request_timeout = 30
         self.client.user_agent = "Mozilla/5.0 (iPhone; CPU iPhone OS 14_8 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 123.1.0.26.115 (iPhone11,8; iOS 14_8; en_US; en-US; scale=2.00; 828x1792; 190542906)"
 
+    def _restore_session(self, settings):
+        """Load saved settings into the client and check that they are still logged in"""
+        self.client.set_settings(settings)
+        self.client.account_info()
+
+    def _legacy_session(self, username):
+        """Settings from the account's per-host pickle file earlier versions wrote, if any"""
+        # Only the per-account file: attached_assets/session_settings.pkl isn't tied to an account
+        path = os.path.join(config.SESSION_DIR, f"session_{username}.pkl")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read legacy session file {path}: {str(e)}")
+            return None
+
+    def _share_session(self, username, version):
+        """Write the client's current settings to the shared store"""
+        new_version = self.session_store.save(username, self.client.get_settings(), version)
+        if new_version is None:
+            logger.info(f"Session for {username} was updated by another worker, keeping the stored one")
+        else:
+            logger.info(f"Session for {username} saved to the shared store (version {new_version})")
+        return new_version
+
     def login(self, username, password, use_session=True):
-        """Login to Instagram with session caching"""
+        """Login to Instagram, reusing the session shared by all workers when possible"""
         try:
-            # Create sessions directory if it doesn't exist
-            if not os.path.exists('sessions'):
-                os.makedirs('sessions')
-                
-            session_file = f"sessions/session_{username}.pkl"
-            
-            if use_session and os.path.exists(session_file):
-                logger.info(f"Attempting to login with cached session for {username}...")
-                with open(session_file, "rb") as f:
-                    cached_settings = pickle.load(f)
-                    self.client.set_settings(cached_settings)
-                    
-                # Verify the session is still valid by getting profile info
+            settings, version = self.session_store.load(username) if use_session else (None, None)
+
+            if settings:
+                logger.info(f"Attempting to login with shared session for {username} (version {version})...")
                 try:
-                    self.client.account_info()
+                    self._restore_session(settings)
                     logger.info("Session is valid, login successful")
+                    # Write a refreshed login back once so peers pick it up
+                    if _session_auth(self.client.get_settings()) != _session_auth(settings):
+                        self._share_session(username, version)
                     return True
                 except Exception as e:
-                    logger.warning(f"Cached session invalid, will perform fresh login: {str(e)}")
-                    # Continue to regular login if session is invalid
+                    logger.warning(f"Shared session invalid, will perform fresh login: {str(e)}")
+            elif use_session:
+                # First run against the shared store: migrate a session saved by an older version
+                legacy_settings = self._legacy_session(username)
+                if legacy_settings:
+                    try:
+                        logger.info(f"Trying legacy session file for {username}...")
+                        self._restore_session(legacy_settings)
+                        self._share_session(username, None)
+                        logger.info("Legacy session login successful")
+                        return True
+                    except Exception as e:
+                        logger.warning(f"Legacy session login failed: {str(e)}")
+
+            if use_session:
+                # Another worker may have logged in while we were checking; use its session
+                latest, latest_version = self.session_store.load(username)
+                if latest and latest_version != version:
+                    try:
+                        self._restore_session(latest)
+                        logger.info(f"Using session for {username} refreshed by another worker")
+                        return True
+                    except Exception as e:
+                        logger.warning(f"Refreshed shared session invalid: {str(e)}")
+                version = latest_version
             
             # Configure challenge resolver for 2FA/unusual login
             logger.info("Setting up challenge resolver for login verification...")
@@ -55,57 +117,30 @@ class InstagramUploader:
             
             # Regular username/password login with extended settings
             logger.info(f"Logging in with username and password for {username}...")
-            login_via_session = False
-            login_via_password = False
-            
-            # First try login directly 
             try:
                 self.client.login(username, password)
-                login_via_password = True
             except Exception as e:
                 logger.warning(f"Direct login failed: {str(e)}")
-            
-            # If login failed, try alternative methods
-            if not login_via_password:
-                # Try to use pre-saved session from attached assets if available
-                alternative_session = "attached_assets/session_settings.pkl"
-                if os.path.exists(alternative_session):
-                    try:
-                        logger.info("Trying login with alternative session file...")
-                        with open(alternative_session, "rb") as f:
-                            cached_settings = pickle.load(f)
-                            self.client.set_settings(cached_settings)
-                            self.client.account_info()
-                            login_via_session = True
-                            logger.info("Alternative session login successful")
-                    except Exception as e:
-                        logger.warning(f"Alternative session login failed: {str(e)}")
-                
+
                 # Last resort - full login with new configuration
-                if not login_via_session:
-                    # Add short delay to avoid rate limiting
-                    time.sleep(3)
-                    
-                    # Set trusted device to potentially bypass security measures
-                    self.client.set_trusted_device("ANDROID")
-                    
-                    # Try with force login which bypasses some checks
-                    try:
-                        logger.info("Attempting forced login...")
-                        self.client.login(username, password, relogin=True)
-                        login_via_password = True
-                    except Exception as e:
-                        logger.error(f"All login attempts failed: {str(e)}")
-                        return False
-            
-            # Save session for future use if any login method worked
-            if login_via_password or login_via_session:
-                with open(session_file, "wb") as f:
-                    pickle.dump(self.client.get_settings(), f)
-                logger.info("Login successful and session saved")
-                return True
+                # Add short delay to avoid rate limiting
+                time.sleep(3)
+                
+                # Set trusted device to potentially bypass security measures
+                self.client.set_trusted_device("ANDROID")
+                
+                # Try with force login which bypasses some checks
+                try:
+                    logger.info("Attempting forced login...")
+                    self.client.login(username, password, relogin=True)
+                except Exception as e:
+                    logger.error(f"All login attempts failed: {str(e)}")
+                    return False
             
-            return False
+            # Share the new session so other workers don't log in again
+            self._share_session(username, version)
+            logger.info("Login successful")
+            return True
             
         except Exception as e:
             logger.error(f"Login failed: {str(e)}")
@@ -129,8 +164,90 @@ class InstagramUploader:
             logger.error(f"Error in challenge handler: {str(e)}")
             return None
 
-    def upload_reel(self, video_path, caption):
-        """Upload a reel to Instagram with proper error handling"""
+    def _analyze(self, video_path):
+        """Return (width, height, duration, thumbnail path) as instagrapi's clip_upload computes them"""
+        from .probe import read_mp4_info, ProbeError
+
+        try:
+            # Size and duration come from the container headers; only the thumbnail needs a decoded frame
+            info = read_mp4_info(video_path)
+            thumbnail = f"{video_path}.jpg"
+            subprocess.run([
+                'ffmpeg', '-y', '-loglevel', 'error', '-ss', str(min(1.0, info['duration'] / 2)), '-i', video_path,
+                '-frames:v', '1', '-q:v', '2', thumbnail,
+            ], capture_output=True, check=True)
+            return info['width'], info['height'], info['duration'], thumbnail
+        except (ProbeError, OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Header probe of {video_path} failed, using instagrapi's analysis: {str(e)}")
+
+        from pathlib import Path
+        from instagrapi.mixins.video import analyze_video
+
+        return analyze_video(Path(video_path))
+
+    def _configure_clip(self, upload_name, video_path, caption, extra_data, analysis=None):
+        width, height, duration, thumbnail = analysis or self._analyze(video_path)
+        for attempt in range(CONFIGURE_ATTEMPTS):
+            try:
+                configured = self.client.clip_configure(upload_id_of(upload_name), thumbnail, width, height,
+                                                        duration, caption, extra_data=extra_data)
+            except Exception as e:
+                if "Transcode not finished" not in str(e) or attempt == CONFIGURE_ATTEMPTS - 1:
+                    raise
+                time.sleep(CONFIGURE_RETRY_DELAY)
+                continue
+            if configured:
+                return configured.get("media")
+        return None
+
+    # Entry points for callers that send the video themselves (bot.aio); the
+    # underscored helpers above may change without notice
+
+    @staticmethod
+    def password():
+        """Password of the Instagram accounts the bot posts to"""
+        return _instagram_password()
+
+    @staticmethod
+    def log_event(level, message):
+        """Record a BotLog entry, as the uploads run here do"""
+        _log_to_db(level, message)
+
+    def session_headers(self):
+        """Headers and cookies of the logged-in session, for requests sent with another HTTP client"""
+        http = self.client.private
+        headers = dict(http.headers)
+        cookies = http.cookies.get_dict()
+        if cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in cookies.items())
+        return headers
+
+    def analyze_clip(self, video_path):
+        """(width, height, duration, thumbnail path) of a video, for the rupload params and configure_clip"""
+        return self._analyze(video_path)
+
+    def configure_clip(self, upload_name, video_path, caption, analysis=None):
+        """Publish an uploaded video as a reel; returns the media dict, or None"""
+        return self._configure_clip(upload_name, video_path, caption, dict(CLIP_EXTRA_DATA), analysis)
+
+    def _upload_chunked(self, video_path, caption, extra_data, upload_session, on_progress):
+        """Send the video in resumable chunks over the logged-in session, then configure the clip"""
+        analysis = self._analyze(video_path)
+        upload = ChunkedUpload(self.client.private, base_url=self.rupload_url, on_progress=on_progress,
+                               media=analysis[:3])
+        upload_name = upload.send(video_path, upload_session)
+        media = self._configure_clip(upload_name, video_path, caption, extra_data, analysis)
+        if media:
+            logger.info(f"Media ID: {media.get('id')}, Media code: {media.get('code')}")
+            logger.info(f"Media URL: https://www.instagram.com/reel/{media.get('code')}/")
+        return media
+
+    def upload_reel(self, video_path, caption, upload_session=None, on_progress=None):
+        """
+        Upload a reel to Instagram with proper error handling. In chunked mode
+        `upload_session` resumes an earlier upload and `on_progress(upload_session,
+        offset)` is called after every acknowledged chunk.
+        """
         try:
             logger.info(f"Attempting to upload reel: {video_path}")
             
@@ -139,16 +256,22 @@ class InstagramUploader:
                 return False
             
             # Add a small delay to simulate human behavior
-            time.sleep(2)
+            time.sleep(config.UPLOAD_HUMAN_DELAY)
+
+            extra_data = dict(CLIP_EXTRA_DATA)
+            if self.chunked:
+                media = self._upload_chunked(video_path, caption, extra_data, upload_session, on_progress)
+                if media:
+                    logger.info(f"Successfully uploaded reel: {video_path}")
+                    return True
+                logger.error("Clip configuration returned no media")
+                return False
             
             # Upload clip with proper parameters
             media = self.client.clip_upload(
                 video_path, 
                 caption=caption,
-                extra_data={
-                    "like_and_view_counts_disabled": False,
-                    "disable_comments": False,
-                }
+                extra_data=extra_data
             )
             
             if media:
@@ -164,145 +287,132 @@ class InstagramUploader:
             logger.error(f"Failed to upload reel: {str(e)}")
             return False
 
+def _log_to_db(level, message):
+    """Record a BotLog entry in its own short-lived session"""
+    from app import session_scope
+    from models import BotLog
+
+    try:
+        with session_scope() as session:
+            session.add(BotLog(level=level, message=message))
+    except Exception as e:
+        logger.error(f"Failed to log to database: {str(e)}")
+
+def _instagram_username(user_id):
+    """Look up the Instagram username of the task owner (or the first user as a fallback)"""
+    from app import session_scope
+    from models import User
+
+    with session_scope() as session:
+        # Use the credentials of the task owner when known
+        user = session.get(User, user_id) if user_id else None
+        if user:
+            logger.info(f"Using credentials for user_id: {user_id}")
+        else:
+            logger.warning("No task owner given, falling back to first user")
+            user = session.query(User).first()
+        return user.instagram_username if user else None
+
+def _instagram_password():
+    # Get password from environment or .env file
+    return os.environ.get('INSTAGRAM_PASSWORD', "Ghazanfar@1234")
+
 # Upload function with retry logic 
-def upload_with_retry(video_path, caption, max_retries=3):
-    """Upload with retry mechanism using instagrapi"""
-    from app import app
-    from models import User, BotLog
-    import os
-    
-    with app.app_context():
-        # Track errors for better debugging
-        errors = []
-        
-        # Try to determine which task is being processed
+def upload_with_retry(video_path, caption, max_retries=3, user_id=None, uploader=None,
+                      upload_session=None, on_progress=None):
+    """
+    Upload with retry mechanism using instagrapi. Chunked uploads resume from
+    the last acknowledged offset; `upload_session` continues an upload started
+    earlier and `on_progress(upload_session, offset)` reports every chunk.
+    """
+    # Database access happens in short scopes so no connection is held
+    # across the login/upload network calls or the retry sleeps
+    errors = []
+
+    instagram_username = _instagram_username(user_id)
+
+    # Log the attempt to the database for tracking
+    _log_to_db("INFO", f"Starting upload process for video: {os.path.basename(video_path)}")
+
+    if not instagram_username:
+        error_msg = "No user with Instagram credentials found"
+        logger.error(error_msg)
+        errors.append(error_msg)
+        _log_to_db("ERROR", error_msg)
+        return False
+
+    instagram_password = _instagram_password()
+
+    if not instagram_password:
+        error_msg = "No Instagram password available"
+        logger.error(error_msg)
+        errors.append(error_msg)
+        _log_to_db("ERROR", error_msg)
+        return False
+
+    logger.info(f"Starting upload with user: {instagram_username}")
+
+    # Create uploader and attempt login/upload with retries
+    uploader = uploader or InstagramUploader()
+
+    progress = {'session': upload_session, 'offset': None}
+
+    def record_progress(session, offset):
+        progress['session'], progress['offset'] = session, offset
+        if on_progress:
+            on_progress(session, offset)
+
+    for attempt in range(max_retries):
+        offset_before = progress['offset']
         try:
-            from routes import current_processing_task_id
-            if current_processing_task_id:
-                from models import ReelTask
-                task = ReelTask.query.get(current_processing_task_id)
-                if task:
-                    user = User.query.get(task.user_id)
-                    logger.info(f"Using credentials for task {current_processing_task_id}, user_id: {task.user_id}")
-                else:
-                    logger.warning(f"Task {current_processing_task_id} not found, falling back to first user")
-                    user = User.query.first()
+            logger.info(f"Upload attempt {attempt + 1}/{max_retries}")
+
+            # Login first (with session if available)
+            login_success = uploader.login(instagram_username, instagram_password)
+
+            if not login_success:
+                error_msg = f"Failed to login to Instagram on attempt {attempt + 1}"
+                logger.error(error_msg)
+                errors.append(error_msg)
+                _log_to_db("ERROR", error_msg)
+
+                if attempt < max_retries - 1:
+                    time.sleep(config.UPLOAD_RETRY_DELAY / 2)  # Wait before retry
+                continue
+
+            # Then upload
+            current_timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            full_caption = f"{caption}\n\nUploaded at {current_timestamp} #repost"
+
+            if uploader.upload_reel(video_path, full_caption, upload_session=progress['session'],
+                                    on_progress=record_progress):
+                success_msg = f"Upload successful for video: {os.path.basename(video_path)}"
+                logger.info(success_msg)
+                _log_to_db("INFO", success_msg)
+                return True
             else:
-                logger.warning("No current task ID found, falling back to first user")
-                user = User.query.first()
-        except (ImportError, NameError):
-            logger.warning("Could not import current_processing_task_id, falling back to first user")
-            user = User.query.first()
-        
-        # Log the attempt to the database for tracking
-        try:
-            log_entry = BotLog(
-                level="INFO",
-                message=f"Starting upload process for video: {os.path.basename(video_path)}"
-            )
-            db.session.add(log_entry)
-            db.session.commit()
-        except Exception as e:
-            logger.error(f"Failed to log to database: {str(e)}")
-        
-        if not user or not user.instagram_username:
-            error_msg = "No user with Instagram credentials found"
-            logger.error(error_msg)
-            errors.append(error_msg)
-            try:
-                log_entry = BotLog(level="ERROR", message=error_msg)
-                db.session.add(log_entry)
-                db.session.commit()
-            except Exception as e:
-                logger.error(f"Failed to log to database: {str(e)}")
-            return False
-        
-        # Get password from environment or .env file
-        instagram_password = os.environ.get('INSTAGRAM_PASSWORD', "Ghazanfar@1234")
-        
-        if not instagram_password:
-            error_msg = "No Instagram password available"
-            logger.error(error_msg)
-            errors.append(error_msg)
-            try:
-                log_entry = BotLog(level="ERROR", message=error_msg)
-                db.session.add(log_entry)
-                db.session.commit()
-            except Exception as e:
-                logger.error(f"Failed to log to database: {str(e)}")
-            return False
-            
-        logger.info(f"Starting upload with user: {user.instagram_username}")
-        
-        # Create uploader and attempt login/upload with retries
-        uploader = InstagramUploader()
-        
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Upload attempt {attempt + 1}/{max_retries}")
-                
-                # Login first (with session if available)
-                login_success = uploader.login(user.instagram_username, instagram_password)
-                
-                if not login_success:
-                    error_msg = f"Failed to login to Instagram on attempt {attempt + 1}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    try:
-                        log_entry = BotLog(level="ERROR", message=error_msg)
-                        db.session.add(log_entry)
-                        db.session.commit()
-                    except Exception as e:
-                        logger.error(f"Failed to log to database: {str(e)}")
-                        
-                    if attempt < max_retries - 1:
-                        time.sleep(30)  # Wait before retry
-                    continue
-                
-                # Then upload
-                current_timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                full_caption = f"{caption}\n\nUploaded at {current_timestamp} #repost"
-                
-                if uploader.upload_reel(video_path, full_caption):
-                    success_msg = f"Upload successful for video: {os.path.basename(video_path)}"
-                    logger.info(success_msg)
-                    try:
-                        log_entry = BotLog(level="INFO", message=success_msg)
-                        db.session.add(log_entry)
-                        db.session.commit()
-                    except Exception as e:
-                        logger.error(f"Failed to log to database: {str(e)}")
-                    return True
-                else:
-                    error_msg = f"Upload failed but no exception was raised on attempt {attempt + 1}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                
-            except Exception as e:
-                error_msg = f"Upload attempt {attempt + 1} failed: {str(e)}"
+                error_msg = f"Upload failed but no exception was raised on attempt {attempt + 1}"
                 logger.error(error_msg)
                 errors.append(error_msg)
-                try:
-                    log_entry = BotLog(level="ERROR", message=error_msg)
-                    db.session.add(log_entry)
-                    db.session.commit()
-                except Exception as log_e:
-                    logger.error(f"Failed to log to database: {str(log_e)}")
-            
-            if attempt < max_retries - 1:
-                wait_time = 60 * (attempt + 1)
-                logger.info(f"Waiting {wait_time} seconds before retry...")
-                time.sleep(wait_time)  # Increasing backoff
-        
-        # Log all errors encountered
-        all_errors = "\n".join(errors)
-        final_error_msg = f"All {max_retries} upload attempts failed. Errors:\n{all_errors}"
-        logger.error(final_error_msg)
-        try:
-            log_entry = BotLog(level="ERROR", message=final_error_msg[:500])  # Truncate if too long
-            db.session.add(log_entry)
-            db.session.commit()
+
         except Exception as e:
-            logger.error(f"Failed to log to database: {str(e)}")
-            
-        return False
+            error_msg = f"Upload attempt {attempt + 1} failed: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+            _log_to_db("ERROR", error_msg)
+
+        if attempt < max_retries - 1:
+            wait_time = config.UPLOAD_RETRY_DELAY * (attempt + 1)
+            if progress['offset'] != offset_before:
+                # The connection dropped mid-upload; resume from the acknowledged offset right away
+                wait_time = config.UPLOAD_RESUME_DELAY
+            logger.info(f"Waiting {wait_time} seconds before retry...")
+            time.sleep(wait_time)  # Increasing backoff
+
+    # Log all errors encountered
+    all_errors = "\n".join(errors)
+    final_error_msg = f"All {max_retries} upload attempts failed. Errors:\n{all_errors}"
+    logger.error(final_error_msg)
+    _log_to_db("ERROR", final_error_msg[:500])  # Truncate if too long
+
+    return False
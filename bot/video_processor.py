@@ -1,42 +1,149 @@
-
 import os
 import logging
-import shutil
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
+import subprocess
+
+import config
+from metrics import registry
+from .encode_profiles import select_profile, needs_reencode, ffmpeg_params, MAX_DURATION
+from .probe import probe
+from .artifacts import link_or_copy
+from .logo_cache import logo_cache
+from .scaling import FrameScaler, DuplicateFrameSkipper
+from .frame_pool import FramePool, apply_hdr
 
 logger = logging.getLogger(__name__)
 
-def process_video(input_path):
+# Visual transformations, applied in this order in a single decode/encode pass
+TRANSFORMS = ('border', 'hdr', 'logo')
+BORDER_SIZE = 10
+LOGO_OPACITY = 0.5
+
+
+def parse_transforms(value):
+    """Turn a comma-separated transform list into a tuple in pipeline order"""
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = set(value) - set(TRANSFORMS)
+    if unknown:
+        raise ValueError(f"Unknown video transforms: {', '.join(sorted(unknown))}")
+    return tuple(name for name in TRANSFORMS if name in value)
+
+
+def _add_border(frame, pool, border_size=BORDER_SIZE):
+    # Drawn inside the frame so the output keeps the profile's size
+    frame = pool.writable(frame)
+    frame[:border_size] = 0
+    frame[-border_size:] = 0
+    frame[:, :border_size] = 0
+    frame[:, -border_size:] = 0
+    return frame
+
+
+def remux(input_path, output_path, duration=None):
+    """
+    Rewrite the container without decoding: streams are copied as they are, the
+    moov atom moves to the front and metadata is dropped. With `duration` the
+    copy stops there, so no frames are re-encoded to trim.
+    """
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error', '-i', input_path,
+        '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy',
+        '-map_metadata', '-1', '-movflags', '+faststart',
+    ]
+    if duration:
+        command += ['-t', str(duration)]
+    subprocess.run(command + [output_path], capture_output=True, text=True, check=True)
+
+
+def render(input_path, output_path, transforms, profile, logo_path=None, duration=None):
+    """Decode once, apply the transforms per frame and encode with the given profile"""
+    from moviepy import VideoFileClip
+
+    size = (profile.width, profile.height)
+    # The logo is pre-rendered once per size and blended over its bounding box only
+    overlay = logo_cache.get(logo_path, size, LOGO_OPACITY) if 'logo' in transforms and logo_path else None
+    # Per-render buffers: every stage writes into a pooled frame instead of allocating one
+    pool = FramePool()
+    scaler = FrameScaler(size, pool)
+    with VideoFileClip(input_path) as video:
+        needs_scaling = not scaler.is_noop(video.size)
+        source = video.subclipped(0, duration) if duration else video
+
+        def process_frame(frame):
+            if needs_scaling:
+                frame = scaler(frame)
+            if 'hdr' in transforms:
+                frame = apply_hdr(frame, pool)
+            if 'border' in transforms:
+                frame = _add_border(frame, pool)
+            if overlay:
+                frame = overlay.blend(frame, pool)
+            return frame
+
+        clip = source
+        if needs_scaling or overlay or {'hdr', 'border'} & set(transforms):
+            clip = source.image_transform(DuplicateFrameSkipper(process_frame))
+
+        clip.write_videofile(
+            output_path,
+            codec='libx264',
+            audio_codec='aac',
+            fps=profile.fps,
+            preset=profile.preset,
+            ffmpeg_params=ffmpeg_params(profile),
+            logger=None
+        )
+
+
+def process_video(input_path, transforms=None, tier=None, logo_path=None, media_info=None):
     """
-    Process a video file (mock implementation)
-    In a real implementation, this would use libraries like MoviePy or FFmpeg
+    Process a video file for upload. `transforms` (default config.VIDEO_TRANSFORMS)
+    selects the visual changes; `tier` (default config.ENCODE_TIER) trades encode
+    speed for quality. Without visual changes the streams are copied into a new
+    container instead of being re-encoded, or the file is passed on as it is when
+    it is already uploadable. `media_info` is the source's bot.probe result, if
+    the caller has it.
     """
     try:
         logger.info(f"Processing video: {input_path}")
-        
-        # Create processed_videos directory if it doesn't exist
-        os.makedirs("processed_videos", exist_ok=True)
-        
-        # Get the filename from the input path
-        filename = os.path.basename(input_path)
-        output_path = os.path.join("processed_videos", filename)
-        
-        # For demo purposes, just copy the file
-        # In a real implementation, we would transform the video
-        shutil.copy2(input_path, output_path)
-        
+        transforms = parse_transforms(config.VIDEO_TRANSFORMS if transforms is None else transforms)
+        logo_path = logo_path or config.LOGO_PATH
+
+        os.makedirs(config.PROCESSED_DIR, exist_ok=True)
+        output_path = os.path.join(config.PROCESSED_DIR, os.path.basename(input_path))
+
+        info = media_info or probe(input_path)
+        if not info:
+            if transforms:
+                return None
+            # Can't inspect the file (e.g. no ffprobe): hand it over unchanged
+            link_or_copy(input_path, output_path)
+            logger.info(f"Processed video saved to: {output_path}")
+            return output_path
+
+        duration = None
+        if info['duration'] > MAX_DURATION:
+            logger.info(f"Trimming {input_path} from {info['duration']:.0f}s to the {MAX_DURATION}s Reels limit")
+            duration = MAX_DURATION
+
+        profile = select_profile(info, tier)
+        if not transforms and not needs_reencode(info, profile):
+            if not duration and info.get('faststart'):
+                # Right codecs, size and layout already: nothing to rewrite
+                link_or_copy(input_path, output_path)
+                registry.counter('video.passed_through').inc()
+            else:
+                remux(input_path, output_path, duration)
+                registry.counter('video.remuxed').inc()
+        else:
+            logger.info(f"Encoding {input_path} ({info['width']}x{info['height']}@{info['fps']:.2f}) "
+                        f"as {profile.width}x{profile.height}@{profile.fps} with the {profile.tier} profile")
+            render(input_path, output_path, transforms, profile, logo_path, duration)
+            registry.counter('video.encoded').inc()
+
         logger.info(f"Processed video saved to: {output_path}")
         return output_path
-        
+
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         return None
@@ -0,0 +1,195 @@
+"""
+Standalone task worker: python -m bot.worker
+
+The web app only inserts ReelTask rows. Workers poll the database for pending
+tasks that are coming due, claim each one atomically (see bot.pipeline) and run
+the download/process/upload pipeline on a bounded thread pool, with --engine
+aio on an asyncio loop that keeps hundreds of transfers in flight (see
+bot.aio), or with --engine staged on separate download, render and upload
+pools so consecutive tasks overlap (see bot.staged), optionally resized to the
+load by an autoscaler (see bot.autoscaler). Tasks scheduled for later
+are downloaded and rendered ahead of their slot by a prefetch planner (see
+bot.prefetch), so only the upload runs at the scheduled time. Any number of
+workers can run against the same database, sized independently of the web tier.
+"""
+import argparse
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+from logging_setup import configure_logging
+from .pipeline import run_task, recover_tasks
+from .prefetch import PrefetchPlanner
+from .scheduler import TaskScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def load_due_tasks(until):
+    """Return (id, scheduled_for) of pending tasks due before `until`"""
+    from app import session_scope
+    from models import ReelTask
+
+    with session_scope() as session:
+        return [
+            (task_id, scheduled_for or datetime.utcnow())
+            for task_id, scheduled_for in session.query(ReelTask.id, ReelTask.scheduled_for).filter(
+                ReelTask.status == 'pending',
+                ReelTask.scheduled_for <= until
+            ).all()
+        ]
+
+
+class Worker:
+    def __init__(self, concurrency=None, poll_interval=config.WORKER_POLL_INTERVAL, backends=None,
+                 engine=config.WORKER_ENGINE, prefetch=config.PREFETCH_ENABLED,
+                 autoscale=config.AUTOSCALE_ENABLED):
+        self.backends = backends
+        self.engine = None
+        self.executor = None
+        self.staged = None
+        self.scheduler = TaskScheduler(dispatch=self.submit, load_due=load_due_tasks,
+                                       resync_interval=poll_interval)
+        if engine == 'aio':
+            from .aio import IOEngine
+            concurrency = concurrency or config.AIO_MAX_TASKS
+            self.engine = IOEngine(max_tasks=concurrency)
+        elif engine == 'staged':
+            from .staged import StagedExecutor
+            self.staged = StagedExecutor(backends=backends, on_reschedule=self.scheduler.schedule)
+        elif engine == 'threads':
+            concurrency = concurrency or config.WORKER_CONCURRENCY
+            self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="reel-task")
+        else:
+            raise ValueError(f"Unknown worker engine: {engine}")
+        self.autoscaler = None
+        if autoscale:
+            if self.staged:
+                from .autoscaler import Autoscaler
+                self.autoscaler = Autoscaler(self.staged)
+            else:
+                logger.warning("Autoscaling only applies to --engine staged; pool sizes stay fixed")
+        self.stop_event = threading.Event()
+        self.concurrency = concurrency
+        self.prefetcher = None
+        self.prefetch_executor = None
+        if prefetch:
+            self.prefetcher = PrefetchPlanner(dispatch=self.prefetch, interval=poll_interval)
+            if self.executor:
+                # Its own threads, so renders for later slots never hold up tasks that are due
+                self.prefetch_executor = ThreadPoolExecutor(max_workers=self.prefetcher.concurrency,
+                                                            thread_name_prefix="reel-prefetch")
+
+    def submit(self, task_id, resume=False):
+        # The task stays pending while it waits for a thread; the scheduler must not dispatch it again meanwhile
+        if self.engine:
+            future = self.engine.submit(self.engine.run_task(task_id, resume, on_reschedule=self.scheduler.schedule,
+                                                             backends=self.backends))
+            future.add_done_callback(lambda _: self.scheduler.done(task_id))
+        elif self.staged:
+            self.staged.submit(task_id, resume, on_done=self.scheduler.done)
+        else:
+            self.executor.submit(self._run, task_id, resume)
+
+    def prefetch(self, task_id):
+        if self.engine:
+            future = self.engine.submit(self.engine.run_task(task_id, on_reschedule=self.scheduler.schedule,
+                                                             backends=self.backends, prefetch=True))
+            future.add_done_callback(lambda _: self.prefetcher.done(task_id))
+        elif self.staged:
+            self.staged.submit(task_id, prefetch=True, on_done=self.prefetcher.done)
+        else:
+            self.prefetch_executor.submit(self._prefetch, task_id)
+
+    def _prefetch(self, task_id):
+        try:
+            run_task(task_id, on_reschedule=self.scheduler.schedule, backends=self.backends, prefetch=True)
+        except Exception as e:
+            logger.error(f"Unhandled error prefetching task {task_id}: {str(e)}")
+        finally:
+            self.prefetcher.done(task_id)
+
+    def _run(self, task_id, resume):
+        try:
+            run_task(task_id, resume=resume, on_reschedule=self.scheduler.schedule, backends=self.backends)
+        except Exception as e:
+            logger.error(f"Unhandled error running task {task_id}: {str(e)}")
+        finally:
+            self.scheduler.done(task_id)
+
+    def stop(self, *_):
+        logger.info("Worker stopping, waiting for running tasks to finish")
+        self.stop_event.set()
+        if self.prefetcher:
+            self.prefetcher.wake()
+
+    def run(self):
+        if self.engine:
+            self.engine.start()
+            logger.info(f"Worker started with up to {self.concurrency} tasks on the asyncio engine")
+        elif self.staged:
+            self.staged.start()
+            logger.info("Worker started on the staged executor")
+        else:
+            logger.info(f"Worker started with {self.concurrency} task threads")
+        # Resume tasks orphaned by a dead worker from their last checkpoint before taking new work
+        recover_tasks(lambda task_id: self.submit(task_id, resume=True))
+        planner = None
+        if self.prefetcher:
+            planner = threading.Thread(target=self.prefetcher.run, args=(self.stop_event,),
+                                       name="prefetch-planner", daemon=True)
+            planner.start()
+        autoscaler = None
+        if self.autoscaler:
+            autoscaler = threading.Thread(target=self.autoscaler.run, args=(self.stop_event,),
+                                          name="autoscaler", daemon=True)
+            autoscaler.start()
+        try:
+            self.scheduler.run(self.stop_event)
+        finally:
+            if planner:
+                planner.join()
+            if autoscaler:
+                autoscaler.join()
+            if self.prefetch_executor:
+                self.prefetch_executor.shutdown(wait=True)
+            if self.engine:
+                self.engine.stop()
+            elif self.staged:
+                self.staged.shutdown()
+            else:
+                self.executor.shutdown(wait=True)
+        logger.info("Worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run reel tasks from the database queue")
+    parser.add_argument("--engine", choices=("threads", "aio", "staged"), default=config.WORKER_ENGINE,
+                        help="run tasks on a thread pool, on the asyncio engine (needs aiohttp), "
+                             "or on per-stage pools (sized with the STAGE_* settings)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="number of tasks run in parallel (default: WORKER_CONCURRENCY, "
+                             "or AIO_MAX_TASKS with --engine aio; unused with --engine staged)")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="only start tasks at their scheduled time instead of preparing them ahead")
+    parser.add_argument("--autoscale", action="store_true", default=config.AUTOSCALE_ENABLED,
+                        help="resize the staged engine's pools to the queue and host load "
+                             "(within the AUTOSCALE_* bounds)")
+    parser.add_argument("--poll-interval", type=float, default=config.WORKER_POLL_INTERVAL,
+                        help="seconds between checks for newly queued tasks")
+    args = parser.parse_args()
+
+    configure_logging()
+
+    worker = Worker(concurrency=args.concurrency, poll_interval=args.poll_interval, engine=args.engine,
+                    prefetch=config.PREFETCH_ENABLED and not args.no_prefetch, autoscale=args.autoscale)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,7 @@ def generate_caption():
 #fit #lifestyle #sport #healthy #gymlife #fitfam #bodybuilding #exercise
 #wellness #crossfit #personaltrainer #strong #weightloss #muscle"""
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists
@@ -45,3 +46,117 @@ PROCESSED_DIR = "processed_videos"
 # General settings
 MAX_RETRIES = 3
 DEBUG = True
+
+# Logging (see logging_setup.py)
+LOG_FILE = os.environ.get('LOG_FILE', 'instagram_bot.log')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Per-logger overrides, e.g. "bot.uploader=DEBUG"; instagrapi's request logging stays quiet by default
+LOG_LEVELS = os.environ.get(
+    'LOG_LEVELS', 'instagrapi=WARNING,private_request=WARNING,public_request=WARNING,urllib3=WARNING')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))  # Rotate the log file at this size
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))  # Gzipped backups kept
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # Records beyond this are dropped, never waited on
+LOG_RATE_LIMIT_INTERVAL = float(os.environ.get('LOG_RATE_LIMIT_INTERVAL', 60))  # Seconds; 0 disables
+LOG_RATE_LIMIT_BURST = int(os.environ.get('LOG_RATE_LIMIT_BURST', 10))  # Similar messages let through per interval
+# Loggers whose records are all rate limited; other code opts in per call with extra={'rate_limit': True}
+LOG_RATE_LIMITED = os.environ.get('LOG_RATE_LIMITED', 'instagrapi,private_request,public_request,urllib3')
+
+# Upload pacing
+UPLOAD_RETRY_DELAY = float(os.environ.get('UPLOAD_RETRY_DELAY', 60))  # Seconds, multiplied by the attempt number
+UPLOAD_HUMAN_DELAY = float(os.environ.get('UPLOAD_HUMAN_DELAY', 2))  # Pause before each upload
+UPLOAD_RESUME_DELAY = float(os.environ.get('UPLOAD_RESUME_DELAY', 5))  # Retry delay after an attempt made progress
+
+# Where logged-in Instagram sessions are shared between workers: database or file
+SESSION_STORE = os.environ.get('SESSION_STORE', 'database')
+SESSION_DIR = os.environ.get('SESSION_DIR', 'sessions')  # Used by the file store and for legacy pickles
+
+# Resumable chunked uploads (see bot/rupload.py)
+# Off by default: the rupload client has only been exercised against benchmarks/fakes.py so far
+UPLOAD_CHUNKED = os.environ.get('UPLOAD_CHUNKED', 'false').lower() == 'true'
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))  # Bytes per request
+UPLOAD_RUPLOAD_URL = os.environ.get('UPLOAD_RUPLOAD_URL', 'https://i.instagram.com/rupload_igvideo')
+
+# Worker settings (python -m bot.worker)
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 2))  # Tasks run in parallel per worker
+WORKER_POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', 5))  # Seconds between queue checks
+WORKER_ENGINE = os.environ.get('WORKER_ENGINE', 'threads')  # threads, aio (needs aiohttp, see bot/aio.py) or staged
+# Consecutive failed occurrences after which a recurring task stops; 0 = keep going
+RECURRING_MAX_FAILURES = int(os.environ.get('RECURRING_MAX_FAILURES', 5))
+
+# Look-ahead prefetch of scheduled tasks (see bot/prefetch.py)
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_WINDOW = float(os.environ.get('PREFETCH_WINDOW', 600))  # Seconds before scheduled_for, at least
+PREFETCH_MAX_LEAD = float(os.environ.get('PREFETCH_MAX_LEAD', 3600))  # Never earlier than this
+PREFETCH_SAFETY = float(os.environ.get('PREFETCH_SAFETY', 1.5))  # Multiplier on the measured stage latency
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', 1))  # Prefetches run at once per worker
+
+# asyncio engine (WORKER_ENGINE=aio)
+AIO_MAX_TASKS = int(os.environ.get('AIO_MAX_TASKS', 200))  # Tasks in flight per worker
+AIO_MAX_CONNECTIONS = int(os.environ.get('AIO_MAX_CONNECTIONS', 100))  # Open HTTP connections in total
+AIO_CONNECTIONS_PER_HOST = int(os.environ.get('AIO_CONNECTIONS_PER_HOST', 32))
+AIO_KEEPALIVE_TIMEOUT = float(os.environ.get('AIO_KEEPALIVE_TIMEOUT', 30))  # Seconds an idle connection is kept
+AIO_READ_TIMEOUT = float(os.environ.get('AIO_READ_TIMEOUT', 60))  # Seconds without data before a transfer fails
+AIO_BLOCKING_WORKERS = int(os.environ.get('AIO_BLOCKING_WORKERS', 8))  # Threads for database and client calls
+AIO_CPU_WORKERS = int(os.environ.get('AIO_CPU_WORKERS', os.cpu_count() or 2))  # Threads for video encoding
+
+# Stage-pipelined engine (WORKER_ENGINE=staged, see bot/staged.py)
+STAGE_DOWNLOAD_WORKERS = int(os.environ.get('STAGE_DOWNLOAD_WORKERS', 8))  # Downloads at once
+STAGE_RENDER_WORKERS = int(os.environ.get('STAGE_RENDER_WORKERS', 0))  # Renders at once; 0 = physical cores
+STAGE_UPLOAD_WORKERS = int(os.environ.get('STAGE_UPLOAD_WORKERS', 4))  # Uploads at once across accounts
+STAGE_UPLOADS_PER_ACCOUNT = int(os.environ.get('STAGE_UPLOADS_PER_ACCOUNT', 1))  # Uploads at once per account
+STAGE_QUEUE_SIZE = int(os.environ.get('STAGE_QUEUE_SIZE', 0))  # Tasks waiting per stage; 0 = twice its workers
+STAGE_REPORT_INTERVAL = float(os.environ.get('STAGE_REPORT_INTERVAL', 60))  # Seconds between utilization logs
+
+# Adaptive pool sizing for the staged engine (see bot/autoscaler.py)
+AUTOSCALE_ENABLED = os.environ.get('AUTOSCALE_ENABLED', 'false').lower() == 'true'
+AUTOSCALE_INTERVAL = float(os.environ.get('AUTOSCALE_INTERVAL', 15))  # Seconds between sizing decisions
+AUTOSCALE_BUSY = float(os.environ.get('AUTOSCALE_BUSY', 0.8))  # Utilization above which a backlogged pool grows
+AUTOSCALE_IDLE = float(os.environ.get('AUTOSCALE_IDLE', 0.3))  # Utilization below which an empty pool shrinks
+AUTOSCALE_MAX_LOAD = float(os.environ.get('AUTOSCALE_MAX_LOAD', 1.0))  # Load average per CPU that halves renders
+AUTOSCALE_MIN_MEMORY = float(os.environ.get('AUTOSCALE_MIN_MEMORY', 0.15))  # Available memory share that halves pools
+AUTOSCALE_COOLDOWN = float(os.environ.get('AUTOSCALE_COOLDOWN', 60))  # Seconds a pool is held after halving
+AUTOSCALE_LATENCY_FACTOR = float(os.environ.get('AUTOSCALE_LATENCY_FACTOR', 1.5))  # Slowdown that undoes growth
+AUTOSCALE_IO_MIN = int(os.environ.get('AUTOSCALE_IO_MIN', 1))  # Download and upload pool bounds
+AUTOSCALE_IO_MAX = int(os.environ.get('AUTOSCALE_IO_MAX', 32))
+AUTOSCALE_RENDER_MIN = int(os.environ.get('AUTOSCALE_RENDER_MIN', 1))  # Render pool bounds; max 0 = physical cores
+AUTOSCALE_RENDER_MAX = int(os.environ.get('AUTOSCALE_RENDER_MAX', 0))
+
+# Duplicate content detection (see bot/fingerprint.py)
+DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_SAMPLES = int(os.environ.get('DEDUP_SAMPLES', 16))  # Frames hashed per video
+DEDUP_FRAME_DISTANCE = int(os.environ.get('DEDUP_FRAME_DISTANCE', 8))  # Bits (of 64) two matching frames may differ
+DEDUP_MIN_OVERLAP = float(os.environ.get('DEDUP_MIN_OVERLAP', 0.75))  # Share of frames that must match
+DEDUP_REUSE_PROCESSED = os.environ.get('DEDUP_REUSE_PROCESSED', 'true').lower() == 'true'
+DEDUP_DOUBLE_POST = os.environ.get('DEDUP_DOUBLE_POST', 'flag')  # flag, or skip to fail reposts to the same account
+
+# Cache of authenticated users in front of Flask-Login's user_loader (see user_cache.py)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))  # Seconds; 0 disables the cache
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+# Touched to tell the other workers on this host to drop their cached users
+USER_CACHE_SIGNAL_PATH = os.environ.get(
+    'USER_CACHE_SIGNAL_PATH', os.path.join(tempfile.gettempdir(), 'reel_bot_user_cache.signal'))
+
+# HTTP caching and compression of the dashboard (see http_cache.py)
+HTTP_CACHE_ENABLED = os.environ.get('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+HTTP_CACHE_REVALIDATE = float(os.environ.get('HTTP_CACHE_REVALIDATE', 30))  # Seconds before cached views roll over
+# Touched after every commit to tasks, logs or users; put it on shared storage to cover several hosts
+HTTP_DATA_VERSION_PATH = os.environ.get(
+    'HTTP_DATA_VERSION_PATH', os.path.join(tempfile.gettempdir(), 'reel_bot_data.version'))
+HTTP_COMPRESS = os.environ.get('HTTP_COMPRESS', 'true').lower() == 'true'
+HTTP_COMPRESS_MIN_SIZE = int(os.environ.get('HTTP_COMPRESS_MIN_SIZE', 512))  # Bytes; smaller responses are sent as is
+HTTP_GZIP_LEVEL = int(os.environ.get('HTTP_GZIP_LEVEL', 6))
+HTTP_BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', 5))  # Static files always get the maximum
+
+# Database connection pool (ignored for SQLite)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 300))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+# Video processing (see bot/video_processor.py and bot/encode_profiles.py)
+ENCODE_TIER = os.environ.get('ENCODE_TIER', 'balanced')  # fast, balanced or quality; tasks may override
+VIDEO_TRANSFORMS = os.environ.get('VIDEO_TRANSFORMS', '')  # Comma-separated: border, hdr, logo
+LOGO_PATH = os.environ.get('LOGO_PATH', '')
+# Pre-rendered logo overlays, shared by the workers on this host (see bot/logo_cache.py)
+LOGO_CACHE_DIR = os.environ.get('LOGO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'reel_bot_logo_cache'))
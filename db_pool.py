@@ -0,0 +1,22 @@
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from metrics import registry
+
+checkout_wait = registry.histogram('db.pool.checkout_wait_ms')
+checkout_timeouts = registry.counter('db.pool.checkout_timeouts')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waited (including connects)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            checkout_timeouts.inc()
+            raise
+        finally:
+            checkout_wait.observe((time.perf_counter() - start) * 1000)
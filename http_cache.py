@@ -0,0 +1,252 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from itertools import chain
+
+from flask import request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+
+import config
+from metrics import registry
+
+try:
+    import brotli
+except ImportError:  # optional: pip install .[brotli]
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Tables the cached views render; a commit touching any of them bumps the data version
+VERSIONED_TABLES = {'reel_task', 'bot_log', 'user'}
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'application/javascript', 'text/javascript',
+                      'application/json', 'image/svg+xml'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class DataVersion:
+    """
+    Version of the data behind the dashboard: the mtime of a signal file that
+    every process (web and worker) touches after committing a change to a
+    versioned table, so reading it costs a stat() instead of a query. Writers
+    on other hosts can't touch the file; cached views also expire every
+    HTTP_CACHE_REVALIDATE seconds so their changes show up within that time.
+    """
+
+    def __init__(self, signal_path=config.HTTP_DATA_VERSION_PATH):
+        self.signal_path = signal_path
+
+    def current(self):
+        try:
+            return os.stat(self.signal_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self):
+        try:
+            with open(self.signal_path, "a"):
+                os.utime(self.signal_path)
+        except OSError as e:
+            logger.warning(f"Could not bump the data version: {str(e)}")
+
+
+data_version = DataVersion()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(db_session, flush_context):
+    if any(getattr(obj, '__tablename__', None) in VERSIONED_TABLES
+           for obj in chain(db_session.new, db_session.dirty, db_session.deleted)):
+        db_session.info['data_changed'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_write(state):
+    # Query.update()/delete() and insert() statements bypass the flush
+    if (state.is_update or state.is_delete or state.is_insert) and state.bind_mapper is not None \
+            and state.bind_mapper.local_table.name in VERSIONED_TABLES:
+        state.session.info['data_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(db_session):
+    # Only after the commit: a view rendered under the new version must see the new rows
+    if db_session.info.pop('data_changed', False):
+        data_version.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(db_session):
+    db_session.info.pop('data_changed', None)
+
+
+def _compress(data, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else config.HTTP_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if static else config.HTTP_GZIP_LEVEL, mtime=0)
+
+
+class HTTPCache:
+    """
+    Conditional GETs for the dashboard views, content-hashed static URLs and
+    response compression.
+
+    - Views wrapped in conditional() answer If-None-Match / If-Modified-Since
+      with a 304 before running: the validators come from the data version, the
+      user, the URL and the build (templates and static assets), none of which
+      needs the database.
+    - url_for('static', ...) gets ?v=<content hash>; a request carrying the
+      current hash is served with an immutable, year-long Cache-Control.
+    - Text responses are brotli (if installed) or gzip compressed; static
+      files are compressed once per content hash and kept in memory.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.build_id = ''
+        self._asset_hashes = {}  # filename -> (mtime_ns, size, hash)
+        self._compressed = {}  # (filename, hash, encoding) -> bytes
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+
+    def init_app(self, app):
+        self.app = app
+        app.url_defaults(self._static_url_defaults)
+        app.after_request(self._after_request)
+        self.build_id = self._compute_build_id()
+
+    def _compute_build_id(self):
+        digest = hashlib.sha1()
+        for folder in (os.path.join(self.app.root_path, self.app.template_folder), self.app.static_folder):
+            for root, _, files in sorted(os.walk(folder)):
+                for name in sorted(files):
+                    stat = os.stat(os.path.join(root, name))
+                    digest.update(f"{os.path.join(root, name)}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        return digest.hexdigest()[:12]
+
+    def asset_hash(self, filename):
+        """Content hash of a static file (recomputed when it changes), or None if it doesn't exist"""
+        path = safe_join(self.app.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        cached = self._asset_hashes.get(filename)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        with open(path, 'rb') as f:
+            value = hashlib.sha256(f.read()).hexdigest()[:12]
+        self._asset_hashes[filename] = (stat.st_mtime_ns, stat.st_size, value)
+        return value
+
+    def _static_url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            value = self.asset_hash(values['filename'])
+            if value:
+                values['v'] = value
+
+    def validators(self, key):
+        """(etag, last_modified) of a cached view's response for `key`"""
+        version = data_version.current()
+        interval = config.HTTP_CACHE_REVALIDATE
+        epoch = int(time.time() // interval) if interval > 0 else 0
+        etag = hashlib.sha1(f"{self.build_id}:{version}:{epoch}:{key}".encode()).hexdigest()[:20]
+        modified = max(version / 1e9, self._started_at, epoch * interval)
+        return etag, datetime.fromtimestamp(int(modified), timezone.utc)
+
+    def conditional(self, view):
+        """Serve a GET view with ETag/Last-Modified, answering 304 without calling it when unchanged"""
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message must be rendered (and consumed), so never answer 304 over it
+            if not config.HTTP_CACHE_ENABLED or request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            etag, last_modified = self.validators(f"{user_id}:{request.full_path}")
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                registry.counter('http.not_modified').inc()
+                response = self.app.response_class(status=304)
+            else:
+                response = self.app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            # Private to the user, and always revalidated (which is what the 304 makes cheap)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+
+        return wrapper
+
+    def _accepted_encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _static_data(self, filename, encoding):
+        content_hash = self.asset_hash(filename)
+        key = (filename, content_hash, encoding)
+        data = self._compressed.get(key)
+        if data is None:
+            with open(safe_join(self.app.static_folder, filename), 'rb') as f:
+                data = _compress(f.read(), encoding, static=True)
+            with self._lock:
+                # Drop the versions of this file that were replaced
+                for stale in [k for k in self._compressed if k[0] == filename]:
+                    del self._compressed[stale]
+                self._compressed[key] = data
+        return data
+
+    def _after_request(self, response):
+        is_static = request.endpoint == 'static'
+        if is_static and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get('filename')
+            version = request.args.get('v')
+            if version and version == self.asset_hash(filename):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+        if (not config.HTTP_COMPRESS or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        if response.is_streamed and not is_static:
+            # Server-sent events and other streams must reach the client as they are produced
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self._accepted_encoding()
+        if not encoding or (response.content_length or 0) < config.HTTP_COMPRESS_MIN_SIZE:
+            return response
+
+        original_size = response.content_length
+        if is_static:
+            data = self._static_data(request.view_args['filename'], encoding)
+            response.direct_passthrough = False
+        else:
+            data = _compress(response.get_data(), encoding)
+        if len(data) >= original_size:
+            return response
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The bytes differ from the identity encoding's; the representation is the same
+            response.set_etag(etag, weak=True)
+        registry.counter('http.compressed').inc()
+        registry.counter('http.compressed_bytes_saved').inc(original_size - len(data))
+        return response
+
+
+http_cache = HTTPCache()
@@ -1,10 +1,66 @@
+"""
+Create or upgrade the database schema: python init_db.py
+
+Importing the app never touches the schema, so this runs before the web
+process and the worker start, and again after every deploy that adds tables,
+columns or indexes. It is idempotent and safe to run from several processes
+at once.
+
+- Replit: the deployment's build step and both workflows run it.
+- Vercel: the Python builder has no pre-start hook, so run it against the
+  production DATABASE_URL before promoting a deployment
+  (DATABASE_URL=... python init_db.py).
+- Local development: python main.py runs it before serving.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
 from app import app, db
 from models import User
 
+# Arbitrary application-wide key for the PostgreSQL advisory lock below
+SCHEMA_LOCK_KEY = 7152024
+
+
+@contextmanager
+def schema_lock():
+    """Serialize concurrent runs (web and worker starting together) on PostgreSQL"""
+    if db.engine.dialect.name != 'postgresql':
+        yield
+        return
+    with db.engine.connect() as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': SCHEMA_LOCK_KEY})
+
+def add_missing_columns():
+    """Add columns introduced since the database was first created (create_all never alters tables)"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            print(f"Added column {table.name}.{column.name}")
+
 def init_db():
-    with app.app_context():
+    with app.app_context(), schema_lock():
         # Create all tables
         db.create_all()
+        add_missing_columns()
+
+        # create_all skips tables that already exist, so add any indexes
+        # introduced since the database was first created
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
         
         # Check if admin user exists
         admin = User.query.filter_by(username='admin').first()
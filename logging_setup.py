@@ -0,0 +1,237 @@
+"""
+Process-wide logging setup, called once by each entry point (web app, worker,
+scripts). Modules only ever do logging.getLogger(__name__).
+
+Application threads only put records on a bounded in-memory queue; a
+QueueListener thread does the formatting and the I/O: JSON lines to a
+size-rotated file whose backups are gzipped, plus plain text on stderr. The
+web and worker processes share the file: rotation is serialized between them
+and the others follow it to the new file. When
+the queue is full, records are dropped rather than blocking the caller; the
+drops are counted in the log.dropped metric and reported in the log once the
+queue has room again. Repetitive messages are rate limited before they are
+queued: records logged with extra={'rate_limit': True}, and everything from the
+loggers listed in LOG_RATE_LIMITED.
+"""
+import atexit
+import fcntl
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+import config
+from metrics import registry
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': f"{record.filename}:{record.lineno}",
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `burst` records through per `interval` seconds for each kind of
+    message, where messages differing only in numbers count as the same kind.
+    The first record after a suppressed stretch says how many were dropped.
+    Only records opted in with extra={'rate_limit': True} or coming from one of
+    `loggers` (or their children) are limited; everything else passes.
+    """
+
+    _numbers = re.compile(r'\d+')
+
+    def __init__(self, interval=config.LOG_RATE_LIMIT_INTERVAL, burst=config.LOG_RATE_LIMIT_BURST,
+                 loggers=config.LOG_RATE_LIMITED):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.loggers = {name.strip() for name in loggers.split(',') if name.strip()}
+        self._windows = {}  # key -> [window start, records let through, records suppressed]
+        self._lock = threading.Lock()
+
+    def _applies(self, record):
+        if getattr(record, 'rate_limit', False):
+            return True
+        name = record.name
+        while name:
+            if name in self.loggers:
+                return True
+            name = name.rpartition('.')[0]
+        return False
+
+    def filter(self, record):
+        if self.interval <= 0 or record.levelno >= logging.ERROR or not self._applies(record):
+            return True
+        key = (record.name, self._numbers.sub('#', str(record.msg)))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    self._windows.clear()
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks: records that don't fit in the queue are
+    dropped, counted in the log.dropped metric and reported by a warning queued
+    ahead of the next record that fits
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0  # not yet reported in the log
+        self._dropped_metric = registry.counter('log.dropped')
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"{self.dropped} log records dropped, the log queue was full",
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._dropped_metric.inc()
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler for a file several processes write to. Writes hold a
+    shared flock on a sidecar lock file and the rollover an exclusive one, so no
+    record lands in a file that is being compressed away. A process whose file
+    was rotated by another reopens the new one before its next write (as
+    WatchedFileHandler does) instead of rotating it again.
+    """
+
+    _identity = None  # (device, inode) of the file self.stream writes to
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._lock_file = open(f"{self.baseFilename}.lock", 'a')
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def _on_disk(self):
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _reopen(self):
+        if self.stream:
+            self.stream.close()
+        self.stream = self._open()
+
+    def emit(self, record):
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_SH)
+        try:
+            if self.stream and self._on_disk() != self._identity:
+                self._reopen()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def doRollover(self):
+        # Called from emit(): upgrade to the exclusive lock, released when emit() returns
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        if self._on_disk() == self._identity:
+            super().doRollover()
+        else:
+            self._reopen()  # another process got there first
+
+    def close(self):
+        super().close()
+        self._lock_file.close()
+
+
+def _file_handler(path):
+    handler = SharedRotatingFileHandler(
+        path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+    # Rotation runs on the listener thread, so compressing backups costs the app nothing
+    handler.namer = lambda name: f"{name}.gz"
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def parse_levels(value):
+    """'instagrapi=WARNING,bot.uploader=DEBUG' -> {'instagrapi': 'WARNING', 'bot.uploader': 'DEBUG'}"""
+    levels = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(log_file=None, level=None):
+    """Route all logging through one queue and listener thread; safe to call more than once"""
+    global _listener, _queue_handler
+
+    if _listener is not None:
+        return _queue_handler
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(RateLimitFilter())
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    _listener = logging.handlers.QueueListener(
+        log_queue, _file_handler(log_file or config.LOG_FILE), console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level or config.LOG_LEVEL)
+    for name, module_level in parse_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(module_level)
+    return _queue_handler
@@ -1,4 +1,8 @@
 from app import app
 
+# Web entry point only; tasks are run by separate worker processes (python -m bot.worker)
 if __name__ == "__main__":
+    # Local development: create the schema before serving
+    from init_db import init_db
+    init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
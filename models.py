@@ -2,10 +2,18 @@ from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from user_cache import user_cache
 
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return user_cache.get(int(id), _load_user_from_db)
+
+def _load_user_from_db(user_id):
+    user = db.session.get(User, user_id)
+    if user is not None:
+        # Detach so the cached instance outlives this request's session
+        db.session.expunge(user)
+    return user
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,6 +42,7 @@ class User(UserMixin, db.Model):
 class ReelTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(500), nullable=False)
+    shortcode = db.Column(db.String(64), nullable=True)  # Parsed from url; see bot/reel_urls.py
     status = db.Column(db.String(50), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     scheduled_for = db.Column(db.DateTime, nullable=True)
@@ -41,10 +50,52 @@ class ReelTask(db.Model):
     error_message = db.Column(db.Text, nullable=True)
     repeat_interval = db.Column(db.Integer, nullable=True)  # Interval in minutes
     last_check = db.Column(db.DateTime, nullable=True)
+    occurrence_count = db.Column(db.Integer, default=0)  # Completed runs of a recurring task
+    failure_count = db.Column(db.Integer, default=0)  # Failed occurrences in a row of a recurring task
+    # Pipeline stage and durable checkpoints; see bot.pipeline
+    stage = db.Column(db.String(20), default='queued')
+    stage_updated_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed while a worker owns the task
+    video_path = db.Column(db.String(500), nullable=True)  # Cached download, reused by every recurrence
+    video_checksum = db.Column(db.String(64), nullable=True)
+    media_info = db.Column(db.Text, nullable=True)  # JSON container metadata of video_path; see bot/probe.py
+    processed_path = db.Column(db.String(500), nullable=True)  # Cached processed video
+    processed_checksum = db.Column(db.String(64), nullable=True)
+    upload_session = db.Column(db.String(100), nullable=True)  # rupload entity name of an unfinished upload
+    upload_offset = db.Column(db.BigInteger, nullable=True)  # Bytes of it the server has acknowledged
+    encode_tier = db.Column(db.String(20), nullable=True)  # fast/balanced/quality, None for the configured default
+    # Perceptual fingerprint of video_path and the task it duplicates; see bot/fingerprint.py
+    fingerprint = db.Column(db.Text, nullable=True)
+    fingerprinted_at = db.Column(db.DateTime, nullable=True)
+    duplicate_of = db.Column(db.Integer, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Keyset pagination orders by (created_at, id); see pagination.keyset_page
+    __table_args__ = (
+        db.Index('ix_reel_task_created_at_id', 'created_at', 'id'),
+        db.Index('ix_reel_task_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_reel_task_status_created_at_id', 'status', 'created_at', 'id'),
+        # The scheduler only ever asks for pending tasks due before a horizon
+        db.Index('ix_reel_task_status_scheduled_for', 'status', 'scheduled_for'),
+        # Duplicate lookups: same post, and fingerprints recorded since the last index sync
+        db.Index('ix_reel_task_shortcode', 'shortcode'),
+        db.Index('ix_reel_task_fingerprinted_at', 'fingerprinted_at'),
+    )
+
 class BotLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     level = db.Column(db.String(20))
-    message = db.Column(db.Text)
\ No newline at end of file
+    message = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_bot_log_timestamp_id', 'timestamp', 'id'),
+    )
+
+class InstagramSession(db.Model):
+    """Logged-in instagrapi settings shared by every worker; see bot/session_store.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(64), unique=True, nullable=False)
+    settings = db.Column(db.Text, nullable=False)  # JSON from instagrapi's Client.get_settings()
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every write (optimistic locking)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
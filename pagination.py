@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the (sort value, id) of the last row on a page into an opaque cursor"""
+    payload = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    if not value:
+        return default
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of `query` in descending (sort_column, id_column) order.
+
+    Instead of OFFSET, the page starts strictly after the row encoded in `cursor`,
+    so with an index on (sort_column, id_column) every page costs the same as the first.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(sort_value, row_id))
+
+    # Fetch one extra row to find out whether another page exists
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return rows, next_cursor
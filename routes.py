@@ -1,24 +1,18 @@
 from flask import render_template, redirect, url_for, flash, request, Response, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from app import app, db
+from app import app, db, session_scope
 from models import User, ReelTask, BotLog
+from pagination import keyset_page, parse_page_size
+from user_cache import user_cache
+from http_cache import http_cache
+from metrics import registry as metrics_registry
+from bot.encode_profiles import TIERS as ENCODE_TIERS
+from bot.reel_urls import canonical_url, parse_shortcode, InvalidReelURL
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import time
-from bot import InstagramReelDownloader, process_video, upload_with_retry
-import threading
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,  # Set to DEBUG for more detailed logs
-    format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    handlers=[
-        logging.FileHandler('instagram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -40,12 +34,128 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
+# Only the columns the dashboard table and log panel render
+TASK_LIST_COLUMNS = (
+    ReelTask.id, ReelTask.url, ReelTask.status, ReelTask.scheduled_for,
+    ReelTask.repeat_interval, ReelTask.created_at, ReelTask.user_id, ReelTask.stage,
+    ReelTask.encode_tier, ReelTask.duplicate_of,
+)
+LOG_LIST_COLUMNS = (BotLog.id, BotLog.timestamp, BotLog.level, BotLog.message)
+
+def _parse_datetime_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    # Timestamps are stored in naive UTC
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def list_tasks(args, limit=None):
+    """Return (rows, next_cursor) for the tasks visible to the current user, filtered by request args"""
+    query = db.session.query(*TASK_LIST_COLUMNS)
+
+    # Non-admins only ever see their own tasks; admins may filter by user
+    if current_user.is_admin:
+        if args.get('user_id'):
+            query = query.filter(ReelTask.user_id == int(args['user_id']))
+    else:
+        query = query.filter(ReelTask.user_id == current_user.id)
+
+    statuses = [status for status in args.get('status', '').split(',') if status]
+    if statuses:
+        query = query.filter(ReelTask.status.in_(statuses))
+
+    since = _parse_datetime_arg(args, 'since')
+    if since:
+        query = query.filter(ReelTask.created_at >= since)
+    until = _parse_datetime_arg(args, 'until')
+    if until:
+        query = query.filter(ReelTask.created_at < until)
+
+    return keyset_page(query, ReelTask.created_at, ReelTask.id,
+                       cursor=args.get('cursor'), limit=limit or parse_page_size(args.get('limit')))
+
+def list_logs(args, limit=None):
+    """Return (rows, next_cursor) for bot logs, filtered by request args"""
+    query = db.session.query(*LOG_LIST_COLUMNS)
+
+    levels = [level.upper() for level in args.get('level', '').split(',') if level]
+    if levels:
+        query = query.filter(BotLog.level.in_(levels))
+
+    since = _parse_datetime_arg(args, 'since')
+    if since:
+        query = query.filter(BotLog.timestamp >= since)
+    until = _parse_datetime_arg(args, 'until')
+    if until:
+        query = query.filter(BotLog.timestamp < until)
+
+    return keyset_page(query, BotLog.timestamp, BotLog.id,
+                       cursor=args.get('cursor'), limit=limit or parse_page_size(args.get('limit')))
+
+def serialize_task_row(task):
+    return {
+        'id': task.id,
+        'url': task.url,
+        'status': task.status,
+        'scheduled_for': task.scheduled_for.isoformat() if task.scheduled_for else None,
+        'repeat_interval': task.repeat_interval,
+        'created_at': task.created_at.isoformat() if task.created_at else None,
+        'user_id': task.user_id,
+        'stage': task.stage,
+        'encode_tier': task.encode_tier,
+        'duplicate_of': task.duplicate_of,
+    }
+
+def serialize_log_row(log):
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S') if log.timestamp else None,
+        'level': log.level,
+        'message': log.message,
+    }
+
 @app.route('/')
 @login_required
+@http_cache.conditional
 def dashboard():
-    tasks = ReelTask.query.order_by(ReelTask.created_at.desc()).limit(10).all()
-    logs = BotLog.query.order_by(BotLog.timestamp.desc()).limit(50).all()
-    return render_template('dashboard.html', tasks=tasks, logs=logs)
+    tasks, next_task_cursor = list_tasks({}, limit=10)
+    logs, next_log_cursor = list_logs({}, limit=50)
+    return render_template('dashboard.html', tasks=tasks, logs=logs,
+                           next_task_cursor=next_task_cursor, next_log_cursor=next_log_cursor)
+
+@app.route('/api/tasks')
+@login_required
+@http_cache.conditional
+def api_tasks():
+    try:
+        tasks, next_cursor = list_tasks(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'tasks': [serialize_task_row(task) for task in tasks],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/logs')
+@login_required
+@http_cache.conditional
+def api_logs():
+    try:
+        logs, next_cursor = list_logs(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'logs': [serialize_log_row(log) for log in logs],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/add_reel', methods=['POST'])
 @login_required
@@ -53,6 +163,11 @@ def add_reel():
     url = request.form.get('url')
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    try:
+        shortcode = parse_shortcode(url)
+        url = canonical_url(url)
+    except InvalidReelURL as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
         # Check if Instagram credentials are set
@@ -62,19 +177,27 @@ def add_reel():
         # Parse scheduling information
         scheduled_for = request.form.get('scheduled_for')
         repeat_interval = request.form.get('repeat_interval')
+        encode_tier = request.form.get('encode_tier') or None
+        if encode_tier and encode_tier not in ENCODE_TIERS:
+            return jsonify({'error': f"Unknown encode tier: {encode_tier}"}), 400
 
         scheduled_time = None
         if scheduled_for:
             scheduled_time = datetime.fromisoformat(scheduled_for.replace('Z', '+00:00'))
+            # The scheduler works in naive UTC
+            if scheduled_time.tzinfo:
+                scheduled_time = scheduled_time.astimezone(timezone.utc).replace(tzinfo=None)
         else:
             scheduled_time = datetime.utcnow()
 
         # Create new task with user_id
         task = ReelTask(
             url=url,
+            shortcode=shortcode,
             scheduled_for=scheduled_time,
             repeat_interval=int(repeat_interval) if repeat_interval else None,
             status='pending',
+            encode_tier=encode_tier,
             user_id=current_user.id
         )
 
@@ -83,169 +206,45 @@ def add_reel():
 
         logger.info(f"Created new task {task.id} for URL: {url}")
 
-        # Start processing if scheduled for now
-        if not scheduled_for:
-            thread = threading.Thread(target=process_reel_task, args=(task.id,))
-            thread.daemon = True
-            thread.start()
+        # The row is the queue entry: a worker (python -m bot.worker) picks it up when it is due
 
         return jsonify({
             'message': 'Task added successfully',
             'task_id': task.id,
             'url': task.url,
             'scheduled_for': task.scheduled_for.isoformat() if task.scheduled_for else None,
-            'repeat_interval': task.repeat_interval
+            'repeat_interval': task.repeat_interval,
+            'encode_tier': task.encode_tier
         })
 
     except Exception as e:
         logger.error(f"Error adding reel task: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Global variable to track which task is currently being processed
-current_processing_task_id = None
-
-def process_reel_task(task_id):
-    """Process a single reel task"""
-    global current_processing_task_id
-    
-    with app.app_context():
-        task = None
-        try:
-            # Set the current processing task
-            current_processing_task_id = task_id
-            
-            task = ReelTask.query.get(task_id)
-            if not task:
-                logger.error(f"Task {task_id} not found")
-                current_processing_task_id = None
-                return
-
-            # Get the user's Instagram credentials
-            user = User.query.get(task.user_id)
-            if not user or not user.instagram_username:
-                raise Exception("Instagram credentials not set")
-
-            # Update status to processing
-            task.status = 'processing'
-            db.session.commit()
-            # Force the session to refresh to ensure changes are visible to other connections
-            db.session.flush()
-            
-            logger.info(f"Processing task {task_id}: status set to processing")
-            
-            # Log to visually verify the task status is changing
-            logger.info(f"Current status of task {task_id} is: {task.status}")
-
-            # Add a small delay to allow status update to be detected by client
-            time.sleep(2)
-            
-            # Download reel using user's credentials
-            logger.info(f"Starting download for task {task_id}")
-            try:
-                downloader = InstagramReelDownloader()
-                video_path = downloader.download_reel(task.url, user.instagram_username, user.instagram_password)
-                
-                if not video_path:
-                    raise Exception(f"Failed to download reel for task {task_id}")
-                
-                logger.info(f"Download completed for task {task_id}: {video_path}")
-                
-                # Process video
-                logger.info(f"Processing video for task {task_id}")
-                processed_video_path = process_video(video_path)
-                
-                if not processed_video_path:
-                    raise Exception(f"Failed to process video for task {task_id}")
-                
-                logger.info(f"Video processing completed for task {task_id}: {processed_video_path}")
-                
-                # Upload video
-                logger.info(f"Uploading video for task {task_id}")
-                caption = "Check out this amazing content! #fitness #motivation"
-                if not upload_with_retry(processed_video_path, caption):
-                    raise Exception(f"Failed to upload video for task {task_id}")
-            except Exception as e:
-                logger.error(f"Error in task {task_id} processing: {str(e)}")
-                raise e
-            
-            logger.info(f"Upload completed for task {task_id}")
-
-            # Refresh task from database to ensure we have the latest version
-            db.session.refresh(task)
-            # Update task status
-            task.status = 'completed'
-            task.completed_at = datetime.utcnow()
-            db.session.commit()
-            # Force flush to make sure changes are visible to other connections
-            db.session.flush()
-            logger.info(f"Successfully completed task {task_id}: status set to completed")
-            # Clear the current processing task
-            current_processing_task_id = None
-
-        except Exception as e:
-            logger.error(f"Error processing task {task_id}: {str(e)}")
-            if task:
-                # Refresh task from database to ensure we have the latest version
-                db.session.refresh(task)
-                task.status = 'failed'
-                task.error_message = str(e)
-                db.session.commit()
-                logger.info(f"Task {task_id} failed: status set to failed")
-            # Clear the current processing task
-            current_processing_task_id = None
-
-def check_scheduled_tasks():
-    """Check for and process scheduled tasks"""
-    logger.info("Starting scheduled task checker")
-
-    while True:
-        try:
-            with app.app_context():
-                # Find pending tasks that are due
-                now = datetime.utcnow()
-                tasks = ReelTask.query.filter(
-                    ReelTask.status == 'pending',
-                    ReelTask.scheduled_for <= now
-                ).all()
-
-                for task in tasks:
-                    logger.info(f"Found scheduled task {task.id} ready for processing")
-                    thread = threading.Thread(target=process_reel_task, args=(task.id,))
-                    thread.daemon = True
-                    thread.start()
-
-        except Exception as e:
-            logger.error(f"Error in task checker: {str(e)}")
-
-        time.sleep(15)  # Check every 15 seconds
-
-# Start the scheduler thread
-scheduler_thread = threading.Thread(target=check_scheduled_tasks, daemon=True)
-scheduler_thread.start()
-
 @app.route('/stream_logs')
 @login_required
 def stream_logs():
+    # Start after the newest log; the dashboard already rendered the recent ones
+    with session_scope() as session:
+        start_id = session.query(db.func.max(BotLog.id)).scalar() or 0
+
     def generate():
-        last_id = 0
+        last_id = start_id
         # Add a maximum timeout of 25 seconds (Gunicorn default worker timeout is 30s)
         max_iterations = 25
         iterations = 0
         
         while iterations < max_iterations:
-            with app.app_context():
-                try:
-                    logs = BotLog.query.filter(BotLog.id > last_id).order_by(BotLog.id.asc()).all()
-                    if logs:
-                        last_id = logs[-1].id
-                        data = json.dumps([{
-                            'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                            'level': log.level,
-                            'message': log.message
-                        } for log in logs])
-                        yield f"data: {data}\n\n"
-                except Exception as e:
-                    logger.error(f"Error in stream_logs: {str(e)}")
+            try:
+                # One short session per poll so no connection is held while sleeping
+                with session_scope() as session:
+                    logs = [serialize_log_row(log) for log in session.query(*LOG_LIST_COLUMNS).filter(
+                        BotLog.id > last_id).order_by(BotLog.id.asc()).all()]
+                if logs:
+                    last_id = logs[-1]['id']
+                    yield f"data: {json.dumps(logs)}\n\n"
+            except Exception as e:
+                logger.error(f"Error in stream_logs: {str(e)}")
             
             time.sleep(1)
             iterations += 1
@@ -258,6 +257,9 @@ def stream_logs():
 @app.route('/stream_task_updates')
 @login_required
 def stream_task_updates():
+    # The generator runs after the request context is gone, so capture the user now
+    user_id = current_user.id
+
     def generate():
         processed_task_ids = set()
         # Add a maximum timeout of 12 iterations (24 seconds, under Gunicorn's 30s timeout)
@@ -265,38 +267,34 @@ def stream_task_updates():
         iterations = 0
         
         while iterations < max_iterations:
-            with app.app_context():
-                try:
-                    # Verify current_user is not None before querying
-                    if current_user and current_user.is_authenticated:
-                        # Get tasks with status changes (processing, completed, failed)
-                        tasks = ReelTask.query.filter(
-                            ReelTask.user_id == current_user.id,
-                            ReelTask.status.in_(['processing', 'completed', 'failed'])
-                        ).all()
-
-                        updates = []
-                        for task in tasks:
-                            if task is not None:  # Check if task is not None
-                                task_key = f"{task.id}_{task.status}"
-                                if task_key not in processed_task_ids:
-                                    processed_task_ids.add(task_key)
-                                    updates.append({
-                                        'id': task.id,
-                                        'status': task.status,
-                                        'error_message': task.error_message
-                                    })
-                            else:
-                                logger.warning("Found None task in results, skipping")
-
-                        if updates:
-                            yield f"data: {json.dumps(updates)}\n\n"
-                    else:
-                        # If user not authenticated, just sleep and continue
-                        pass
-
-                except Exception as e:
-                    logger.error(f"Error in stream_task_updates: {str(e)}")
+            try:
+                # One short session per poll so no connection is held while sleeping
+                with session_scope() as session:
+                    # Get tasks with status changes (processing, completed, failed)
+                    tasks = session.query(
+                        ReelTask.id, ReelTask.status, ReelTask.stage, ReelTask.error_message
+                    ).filter(
+                        ReelTask.user_id == user_id,
+                        ReelTask.status.in_(['processing', 'completed', 'failed'])
+                    ).all()
+
+                updates = []
+                for task in tasks:
+                    task_key = f"{task.id}_{task.status}_{task.stage}"
+                    if task_key not in processed_task_ids:
+                        processed_task_ids.add(task_key)
+                        updates.append({
+                            'id': task.id,
+                            'status': task.status,
+                            'stage': task.stage,
+                            'error_message': task.error_message
+                        })
+
+                if updates:
+                    yield f"data: {json.dumps(updates)}\n\n"
+
+            except Exception as e:
+                logger.error(f"Error in stream_task_updates: {str(e)}")
             
             time.sleep(2)
             iterations += 1
@@ -306,6 +304,17 @@ def stream_task_updates():
 
     return Response(generate(), mimetype='text/event-stream')
 
+@app.route('/metrics')
+@login_required
+def metrics():
+    """Process metrics, including database pool checkout wait times"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    snapshot = metrics_registry.snapshot()
+    snapshot['db.pool.status'] = db.engine.pool.status()
+    return jsonify(snapshot)
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
@@ -320,6 +329,7 @@ def signup():
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
 
         login_user(user)
         return redirect(url_for('dashboard'))
@@ -370,10 +380,13 @@ def settings():
         instagram_password = request.form.get('instagram_password')
 
         if instagram_username and instagram_password:
-            current_user.instagram_username = instagram_username
-            current_user.set_instagram_password(instagram_password)
+            # current_user is a cached, detached copy; update the database row instead
+            user = db.session.get(User, current_user.id)
+            user.instagram_username = instagram_username
+            user.set_instagram_password(instagram_password)
             db.session.commit()
-            logger.info(f"Instagram credentials updated for user: {current_user.username}")
+            user_cache.invalidate(user.id)
+            logger.info(f"Instagram credentials updated for user: {user.username}")
             flash('Instagram settings updated successfully')
             return redirect(url_for('dashboard'))
         else:
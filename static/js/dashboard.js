@@ -19,34 +19,36 @@ document.addEventListener('DOMContentLoaded', function() {
     // Delete task functionality
     function setupDeleteButtons() {
         const deleteButtons = document.querySelectorAll('.delete-task');
-        deleteButtons.forEach(button => {
-            button.addEventListener('click', async function() {
-                const taskId = this.getAttribute('data-task-id');
-                if (confirm('Are you sure you want to delete this task?')) {
-                    try {
-                        const response = await fetch(`/delete_task/${taskId}`, {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json'
-                            }
-                        });
-
-                        const data = await response.json();
-                        if (response.ok) {
-                            // Remove the task row from the table
-                            const row = document.querySelector(`tr[data-task-id="${taskId}"]`);
-                            if (row) {
-                                row.remove();
-                            }
-                        } else {
-                            alert(`Error: ${data.error}`);
+        deleteButtons.forEach(bindDeleteButton);
+    }
+
+    function bindDeleteButton(button) {
+        button.addEventListener('click', async function() {
+            const taskId = this.getAttribute('data-task-id');
+            if (confirm('Are you sure you want to delete this task?')) {
+                try {
+                    const response = await fetch(`/delete_task/${taskId}`, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        }
+                    });
+
+                    const data = await response.json();
+                    if (response.ok) {
+                        // Remove the task row from the table
+                        const row = document.querySelector(`tr[data-task-id="${taskId}"]`);
+                        if (row) {
+                            row.remove();
                         }
-                    } catch (error) {
-                        console.error('Error deleting task:', error);
-                        alert('An error occurred while deleting the task.');
+                    } else {
+                        alert(`Error: ${data.error}`);
                     }
+                } catch (error) {
+                    console.error('Error deleting task:', error);
+                    alert('An error occurred while deleting the task.');
                 }
-            });
+            }
         });
     }
 
@@ -90,6 +92,97 @@ document.addEventListener('DOMContentLoaded', function() {
         console.error('Clear All Tasks button not found in the DOM');
     }
 
+    // User-supplied values (reel URLs, log messages) must not be parsed as markup
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value == null ? '' : String(value);
+        return div.innerHTML;
+    }
+
+    // Build a task table row from an /api/tasks entry
+    function buildTaskRow(task) {
+        const badgeClass = task.status === 'completed' ? 'success' :
+                          task.status === 'failed' ? 'danger' : 'warning';
+        const scheduledTime = task.scheduled_for ? new Date(task.scheduled_for).toLocaleString() : 'ASAP';
+        const duplicateBadge = task.duplicate_of ?
+            ` <span class="badge bg-secondary" title="Same video as task ${task.duplicate_of}">duplicate of #${task.duplicate_of}</span>` : '';
+        const row = document.createElement('tr');
+        row.setAttribute('data-task-id', task.id);
+        row.innerHTML = `
+            <td>${escapeHtml(task.url)}</td>
+            <td><span class="badge bg-${badgeClass}">${task.status}</span>${duplicateBadge}</td>
+            <td>${scheduledTime}</td>
+            <td>${task.repeat_interval || 'No'}</td>
+            <td class="created-time" data-timestamp="${task.created_at}">${new Date(task.created_at).toLocaleString()}</td>
+            <td>
+                <button class="btn btn-sm btn-danger delete-task" data-task-id="${task.id}">
+                    <i data-feather="trash-2"></i> Delete
+                </button>
+            </td>
+        `;
+        return row;
+    }
+
+    function buildLogEntry(log) {
+        const logEntry = document.createElement('div');
+        logEntry.className = 'log-entry';
+        logEntry.innerHTML = `
+            <span class="log-timestamp">${escapeHtml(log.timestamp)}</span>
+            <span class="log-level log-level-${escapeHtml(log.level.toLowerCase())}">${escapeHtml(log.level)}</span>
+            <span class="log-message">${escapeHtml(log.message)}</span>
+        `;
+        return logEntry;
+    }
+
+    // Load older pages through the keyset-paginated API
+    async function loadMore(button, endpoint, key, appendItem) {
+        const cursor = button.getAttribute('data-next-cursor');
+        if (!cursor) {
+            return;
+        }
+
+        try {
+            button.disabled = true;
+            const response = await fetch(`${endpoint}?cursor=${encodeURIComponent(cursor)}`);
+            const data = await response.json();
+            if (!response.ok) {
+                alert(`Error: ${data.error}`);
+                return;
+            }
+
+            data[key].forEach(appendItem);
+            button.setAttribute('data-next-cursor', data.next_cursor || '');
+            if (!data.next_cursor) {
+                button.classList.add('d-none');
+            }
+        } catch (error) {
+            console.error(`Error loading ${key}:`, error);
+        } finally {
+            button.disabled = false;
+        }
+    }
+
+    const loadMoreTasksBtn = document.getElementById('loadMoreTasksBtn');
+    if (loadMoreTasksBtn) {
+        loadMoreTasksBtn.addEventListener('click', function() {
+            loadMore(this, '/api/tasks', 'tasks', task => {
+                const row = buildTaskRow(task);
+                tasksList.appendChild(row);
+                bindDeleteButton(row.querySelector('.delete-task'));
+                initFeatherIcons();
+            });
+        });
+    }
+
+    const loadMoreLogsBtn = document.getElementById('loadMoreLogsBtn');
+    if (loadMoreLogsBtn) {
+        loadMoreLogsBtn.addEventListener('click', function() {
+            loadMore(this, '/api/logs', 'logs', log => {
+                logContainer.appendChild(buildLogEntry(log));
+            });
+        });
+    }
+
     // Initialize feather icons
     initFeatherIcons();
 
@@ -108,7 +201,9 @@ document.addEventListener('DOMContentLoaded', function() {
                     if (statusCell) {
                         const badgeClass = update.status === 'completed' ? 'success' : 
                                           update.status === 'failed' ? 'danger' : 'warning';
-                        statusCell.innerHTML = `<span class="badge bg-${badgeClass}">${update.status}</span>`;
+                        const label = update.status === 'processing' && update.stage ?
+                                      `${update.status} (${update.stage})` : update.status;
+                        statusCell.innerHTML = `<span class="badge bg-${badgeClass}">${label}</span>`;
                     }
                 }
             });
@@ -135,6 +230,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const urlInput = document.getElementById('url');
         const scheduledForInput = document.getElementById('scheduledFor');
         const repeatIntervalInput = document.getElementById('repeatInterval');
+        const encodeTierInput = document.getElementById('encodeTier');
 
         const formData = new FormData();
         formData.append('url', urlInput.value);
@@ -144,6 +240,9 @@ document.addEventListener('DOMContentLoaded', function() {
         if (repeatIntervalInput.value) {
             formData.append('repeat_interval', repeatIntervalInput.value);
         }
+        if (encodeTierInput.value) {
+            formData.append('encode_tier', encodeTierInput.value);
+        }
 
         try {
             const response = await fetch('/add_reel', {
@@ -165,7 +264,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 const row = document.createElement('tr');
                 row.setAttribute('data-task-id', data.task_id);
                 row.innerHTML = `
-                    <td>${data.url}</td>
+                    <td>${escapeHtml(data.url)}</td>
                     <td><span class="badge bg-warning">pending</span></td>
                     <td>${scheduledTime}</td>
                     <td>${data.repeat_interval || 'No'}</td>
@@ -228,13 +327,7 @@ document.addEventListener('DOMContentLoaded', function() {
         evtSource.onmessage = function(event) {
             const logs = JSON.parse(event.data);
             logs.forEach(log => {
-                const logEntry = document.createElement('div');
-                logEntry.className = 'log-entry';
-                logEntry.innerHTML = `
-                    <span class="log-timestamp">${log.timestamp}</span>
-                    <span class="log-level log-level-${log.level.toLowerCase()}">${log.level}</span>
-                    <span class="log-message">${log.message}</span>
-                `;
+                const logEntry = buildLogEntry(log);
                 logContainer.insertBefore(logEntry, logContainer.firstChild);
 
                 // Keep only the last 50 logs
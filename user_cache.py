@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    In-process LRU cache of User records with a TTL, sitting in front of
+    Flask-Login's user_loader so authenticated requests (and every SSE reconnect)
+    don't need a database round trip.
+
+    Cached users are detached from the session: request code may read them
+    through current_user but must load a fresh row before modifying one, then
+    call invalidate(). Invalidation is signalled to the other workers on this
+    host by touching a shared file whose mtime every worker checks on lookup;
+    workers on other hosts pick up changes within the TTL.
+    """
+
+    def __init__(self, ttl=config.USER_CACHE_TTL, max_size=config.USER_CACHE_SIZE,
+                 signal_path=config.USER_CACHE_SIGNAL_PATH):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.signal_path = signal_path
+        self._entries = OrderedDict()  # user_id -> (expires_at, user)
+        self._lock = threading.Lock()
+        self._signal_mtime = self._read_signal()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def _read_signal(self):
+        try:
+            return os.stat(self.signal_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_signal(self):
+        """Drop everything if another worker has signalled an invalidation"""
+        mtime = self._read_signal()
+        if mtime != self._signal_mtime:
+            self._signal_mtime = mtime
+            self._entries.clear()
+
+    def get(self, user_id, loader):
+        """Return the cached user, calling loader(user_id) on a miss"""
+        if not self.enabled:
+            return loader(user_id)
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_signal()
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        user = loader(user_id)
+        if user is None:
+            return None
+
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Forget one user (or all users) here and signal the other workers"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+            try:
+                with open(self.signal_path, "a"):
+                    os.utime(self.signal_path)
+                # Our own invalidation is already applied
+                self._signal_mtime = self._read_signal()
+            except OSError as e:
+                logger.warning(f"Could not signal user cache invalidation: {str(e)}")
+
+
+user_cache = UserCache()